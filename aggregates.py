@@ -0,0 +1,113 @@
+"""Agregados por región que se actualizan con las filas que cambian.
+
+Por cada región se guardan el número de filas y las estadísticas suficientes de la
+correlación de Pearson por pares (conteos, sumas, sumas de cuadrados y de productos) de
+las columnas numéricas. La tabla regional y la matriz de correlación salen de esas sumas,
+así que al cambiar unas pocas filas basta con restar sus valores anteriores y sumar los
+nuevos en lugar de recorrer toda la tabla.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Columnas de la matriz de correlación (en este orden)
+CORRELATION_COLUMNS = ["temp_actual", "humedad_actual", "presion_actual", "viento_actual", "probabilidad_lluvia", "dias_con_lluvia"]
+
+# Columnas promediadas en la tabla regional y su nombre en la tabla
+REGIONAL_COLUMNS = {
+    "probabilidad_lluvia": "Prob. lluvia promedio (%)",
+    "dias_con_lluvia": "Días con lluvia promedio"
+}
+
+
+def _estadisticas(df_estados):
+    """Estadísticas suficientes de las filas de df_estados: {region: {clave: valor}}"""
+
+    resultado = {}
+    for region, grupo in df_estados.groupby("region", sort=False):
+        x = grupo[CORRELATION_COLUMNS].to_numpy(dtype=np.float64, na_value=np.nan)
+        presentes = (~np.isnan(x)).astype(np.float64)
+        x = np.nan_to_num(x)
+        resultado[region] = {
+            "filas": len(grupo),
+            # [i, j]: filas con i y j presentes, y sumas de i (o de i²) en esas filas
+            "n": presentes.T @ presentes,
+            "suma": x.T @ presentes,
+            "cuadrados": (x * x).T @ presentes,
+            "productos": x.T @ x
+        }
+    return resultado
+
+
+class RegionAggregates:
+    """Estadísticas por región de la tabla de estados, inmutables una vez construidas"""
+
+    def __init__(self, estadisticas):
+        self.estadisticas = estadisticas
+
+    @classmethod
+    def from_frame(cls, df_estados):
+        if df_estados.empty:
+            return cls({})
+        return cls(_estadisticas(df_estados))
+
+    def patch(self, anteriores, nuevas):
+        """Agregados nuevos tras reemplazar las filas `anteriores` por `nuevas` (self no cambia)"""
+
+        estadisticas = {region: dict(valores) for region, valores in self.estadisticas.items()}
+        for signo, filas in ((-1, anteriores), (1, nuevas)):
+            for region, delta in _estadisticas(filas).items():
+                actual = estadisticas.get(region)
+                if actual is None:
+                    estadisticas[region] = actual = {clave: 0 * valor for clave, valor in delta.items()}
+                for clave, valor in delta.items():
+                    actual[clave] = actual[clave] + signo * valor
+
+        # Quitar las regiones que se quedaron sin filas
+        return RegionAggregates({
+            region: valores for region, valores in estadisticas.items() if valores["filas"] > 0
+        })
+
+    def _sumar(self, regiones=None):
+        """Suma las estadísticas de las regiones indicadas (todas por defecto)"""
+
+        seleccion = [v for r, v in self.estadisticas.items() if regiones is None or r in regiones]
+        if not seleccion:
+            return None
+        return {clave: sum(v[clave] for v in seleccion) for clave in seleccion[0]}
+
+    def regional_table(self, regiones=None):
+        """Tabla con el promedio de probabilidad y días con lluvia y el número de estados por región"""
+
+        filas = []
+        for region in sorted(self.estadisticas):
+            if regiones is not None and region not in regiones:
+                continue
+            valores = self.estadisticas[region]
+            fila = {"region": region}
+            for columna, titulo in REGIONAL_COLUMNS.items():
+                j = CORRELATION_COLUMNS.index(columna)
+                n = valores["n"][j, j]
+                fila[titulo] = valores["suma"][j, j] / n if n else np.nan
+            fila["Número de estados"] = valores["filas"]
+            filas.append(fila)
+        return pd.DataFrame(filas, columns=["region"] + list(REGIONAL_COLUMNS.values()) + ["Número de estados"])
+
+    def correlation(self, regiones=None):
+        """Matriz de correlación de Pearson por pares, como DataFrame.corr()"""
+
+        total = self._sumar(regiones)
+        if total is None:
+            return pd.DataFrame(np.nan, index=CORRELATION_COLUMNS, columns=CORRELATION_COLUMNS)
+
+        n = total["n"]
+        sx = total["suma"]
+        sy = sx.T
+        with np.errstate(divide="ignore", invalid="ignore"):
+            covarianza = n * total["productos"] - sx * sy
+            varianza_x = n * total["cuadrados"] - sx * sx
+            varianza_y = varianza_x.T
+            corr = covarianza / np.sqrt(varianza_x * varianza_y)
+        corr = np.where(n > 1, np.clip(corr, -1.0, 1.0), np.nan)
+        np.fill_diagonal(corr, np.where(np.diag(varianza_x) > 0, 1.0, np.nan))
+        return pd.DataFrame(corr, index=CORRELATION_COLUMNS, columns=CORRELATION_COLUMNS)
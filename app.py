@@ -1,14 +1,24 @@
+import time
+
+# Inicio de la ejecución del script, para medir las importaciones y la primera página del proceso
+inicio_ejecucion = time.perf_counter()
+
 import streamlit as st
 import pandas as pd
-import requests
-import folium
-from folium.plugins import HeatMap
-from streamlit_folium import folium_static
-import datetime
+import streamlit.components.v1 as components
+from pipeline import build_snapshot, get_scheduler
+from interpolation import SURFACE_VARIABLES, snapshot_surface
+import data_api
+import figures
+import metrics
+from history_store import HistoryStore
+from snapshot import SnapshotRefresher, DEFAULT_REFRESH_INTERVAL, DEFAULT_SNAPSHOT_PATH
+from rolling_stats import ROLLING_WINDOWS
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-import plotly.express as px
-import plotly.graph_objects as go
+
+# Plotly (en figures) y Folium (en maps) se importan solo al construir la figura o el mapa que los usa
+duracion_importaciones = time.perf_counter() - inicio_ejecucion
 
 # Configuración de la página
 st.set_page_config(
@@ -27,156 +37,26 @@ Esta aplicación muestra la probabilidad de lluvia en los próximos días para d
 Los datos son obtenidos en tiempo real desde la API de OpenWeather.
 """)
 
-# Función para obtener datos climáticos actuales de OpenWeather
-@st.cache_data(ttl=3600, show_spinner="Cargando datos actuales...")
-def get_current_weather(lat, lon, api_key):
-    """Obtiene datos actuales de clima usando la API gratuita"""
-    
-    url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric&lang=es"
-    
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Error al obtener datos actuales: {response.status_code} - {response.text}")
-            return None
-    except Exception as e:
-        st.error(f"Error en la solicitud: {e}")
-        return None
+# Tiempos de render (segundos) de cada sección en la última ejecución de la página
+st.session_state.tiempos_render = {}
 
-# Función para obtener pronóstico de 5 días
-@st.cache_data(ttl=3600, show_spinner="Cargando pronóstico...")
-def get_forecast(lat, lon, api_key):
-    """Obtiene pronóstico de 5 días usando la API gratuita"""
-    
-    url = f"https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={api_key}&units=metric&lang=es"
-    
+@contextmanager
+def medir(seccion):
+    """Mide el tiempo de render de una sección y lo guarda en la sesión"""
+    inicio = time.perf_counter()
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Error al obtener pronóstico: {response.status_code} - {response.text}")
-            return None
-    except Exception as e:
-        st.error(f"Error en la solicitud: {e}")
-        return None
-
-# Función para analizar si hay lluvia en el pronóstico
-def analyze_rain_forecast(forecast_data):
-    """Analiza si hay lluvia en el pronóstico de 5 días y calcula la probabilidad"""
-    
-    if not forecast_data or 'list' not in forecast_data:
-        return {
-            "lluvia_proximos_dias": False,
-            "probabilidad_lluvia": 0,
-            "dias_con_lluvia": 0,
-            "proxima_lluvia": None,
-            "datos_diarios": []
-        }
-    
-    rain_days = 0
-    first_rain = None
-    total_periods = len(forecast_data['list'])
-    rain_periods = 0
-    
-    # Umbral para considerar lluvia (en mm)
-    threshold = 1.0
-    
-    # Diccionario para almacenar datos diarios
-    daily_data = {}
-    
-    # Analizar cada período del pronóstico (cada 3 horas durante 5 días)
-    for period in forecast_data['list']:
-        # Verificar si hay lluvia en este período
-        rain_amount = 0
-        if 'rain' in period and '3h' in period['rain']:
-            rain_amount = period['rain']['3h']
-        
-        # Obtener fecha y temperatura
-        timestamp = period['dt']
-        date_time = datetime.fromtimestamp(timestamp)
-        date_str = date_time.strftime('%Y-%m-%d')
-        temp = period['main']['temp']
-        
-        # Si hay lluvia significativa
-        if rain_amount >= threshold:
-            rain_periods += 1
-            
-            # Si es el primer período con lluvia, guardar la fecha
-            if first_rain is None:
-                first_rain = date_time
-        
-        # Agregar o actualizar datos diarios
-        if date_str not in daily_data:
-            daily_data[date_str] = {
-                'fecha': date_time.date(),
-                'min_temp': temp,
-                'max_temp': temp,
-                'precipitacion': rain_amount,
-                'tiene_lluvia': rain_amount >= threshold
-            }
-        else:
-            daily_data[date_str]['min_temp'] = min(daily_data[date_str]['min_temp'], temp)
-            daily_data[date_str]['max_temp'] = max(daily_data[date_str]['max_temp'], temp)
-            daily_data[date_str]['precipitacion'] += rain_amount
-            daily_data[date_str]['tiene_lluvia'] = daily_data[date_str]['tiene_lluvia'] or (rain_amount >= threshold)
-    
-    # Contar días únicos con lluvia
-    for day_data in daily_data.values():
-        if day_data['tiene_lluvia']:
-            rain_days += 1
-    
-    # Convertir diccionario a lista
-    daily_data_list = list(daily_data.values())
-    
-    # Calcular probabilidad de lluvia
-    rain_probability = (rain_periods / total_periods) * 100 if total_periods > 0 else 0
-    
-    return {
-        "lluvia_proximos_dias": rain_periods > 0,
-        "probabilidad_lluvia": round(rain_probability, 1),
-        "dias_con_lluvia": rain_days,
-        "proxima_lluvia": first_rain,
-        "datos_diarios": daily_data_list
-    }
-
-# Datos de los estados de México (nombre, latitud, longitud)
-estados_mexico = [
-    {"nombre": "Aguascalientes", "lat": 21.8818, "lon": -102.2916, "region": "Centro"},
-    {"nombre": "Baja California", "lat": 30.8406, "lon": -115.2838, "region": "Norte"},
-    {"nombre": "Baja California Sur", "lat": 26.0444, "lon": -111.6661, "region": "Norte"},
-    {"nombre": "Campeche", "lat": 19.8301, "lon": -90.5349, "region": "Sur"},
-    {"nombre": "Chiapas", "lat": 16.7569, "lon": -93.1292, "region": "Sur"},
-    {"nombre": "Chihuahua", "lat": 28.6353, "lon": -106.0889, "region": "Norte"},
-    {"nombre": "Ciudad de México", "lat": 19.4326, "lon": -99.1332, "region": "Centro"},
-    {"nombre": "Coahuila", "lat": 27.0587, "lon": -101.7068, "region": "Norte"},
-    {"nombre": "Colima", "lat": 19.2452, "lon": -103.7241, "region": "Centro"},
-    {"nombre": "Durango", "lat": 24.0277, "lon": -104.6532, "region": "Norte"},
-    {"nombre": "Estado de México", "lat": 19.4969, "lon": -99.7233, "region": "Centro"},
-    {"nombre": "Guanajuato", "lat": 20.9170, "lon": -101.1617, "region": "Centro"},
-    {"nombre": "Guerrero", "lat": 17.4392, "lon": -99.5451, "region": "Sur"},
-    {"nombre": "Hidalgo", "lat": 20.0911, "lon": -98.7624, "region": "Centro"},
-    {"nombre": "Jalisco", "lat": 20.6595, "lon": -103.3494, "region": "Centro"},
-    {"nombre": "Michoacán", "lat": 19.5665, "lon": -101.7068, "region": "Centro"},
-    {"nombre": "Morelos", "lat": 18.6813, "lon": -99.1013, "region": "Centro"},
-    {"nombre": "Nayarit", "lat": 21.7514, "lon": -104.8455, "region": "Centro"},
-    {"nombre": "Nuevo León", "lat": 25.5922, "lon": -99.9962, "region": "Norte"},
-    {"nombre": "Oaxaca", "lat": 17.0732, "lon": -96.7266, "region": "Sur"},
-    {"nombre": "Puebla", "lat": 19.0414, "lon": -98.2063, "region": "Centro"},
-    {"nombre": "Querétaro", "lat": 20.5888, "lon": -100.3899, "region": "Centro"},
-    {"nombre": "Quintana Roo", "lat": 19.1817, "lon": -88.4791, "region": "Sur"},
-    {"nombre": "San Luis Potosí", "lat": 22.1565, "lon": -100.9855, "region": "Centro"},
-    {"nombre": "Sinaloa", "lat": 25.1721, "lon": -107.4795, "region": "Norte"},
-    {"nombre": "Sonora", "lat": 29.2970, "lon": -110.3309, "region": "Norte"},
-    {"nombre": "Tabasco", "lat": 17.8409, "lon": -92.6189, "region": "Sur"},
-    {"nombre": "Tamaulipas", "lat": 24.2669, "lon": -98.8363, "region": "Norte"},
-    {"nombre": "Tlaxcala", "lat": 19.3139, "lon": -98.2404, "region": "Centro"},
-    {"nombre": "Veracruz", "lat": 19.1738, "lon": -96.1342, "region": "Sur"},
-    {"nombre": "Yucatán", "lat": 20.7099, "lon": -89.0943, "region": "Sur"},
-    {"nombre": "Zacatecas", "lat": 22.7709, "lon": -102.5832, "region": "Centro"}
-]
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        st.session_state.tiempos_render[seccion] = duracion
+        metrics.observe("stage_seconds", duracion, etapa=f"render:{seccion}")
+
+# Tamaño del mapa en la página (píxeles)
+MAP_WIDTH = 700
+MAP_HEIGHT = 500
+
+# Pestañas de la página
+TABS = ["Datos actuales", "Pronóstico de lluvia", "Análisis regional", "Tendencias"]
 
 # Sidebar para controles
 st.sidebar.title("Configuración")
@@ -185,442 +65,399 @@ st.sidebar.title("Configuración")
 region_options = ["Todos los estados", "Norte", "Centro", "Sur"]
 selected_region = st.sidebar.selectbox("Región a mostrar", region_options)
 
-# Filtrar estados según la región seleccionada
-if selected_region == "Norte":
-    estados_filtrados = [estado for estado in estados_mexico if estado["region"] == "Norte"]
-elif selected_region == "Centro":
-    estados_filtrados = [estado for estado in estados_mexico if estado["region"] == "Centro"]
-elif selected_region == "Sur":
-    estados_filtrados = [estado for estado in estados_mexico if estado["region"] == "Sur"]
-else:
-    estados_filtrados = estados_mexico
+# Superficie interpolada que se dibuja bajo los marcadores del mapa
+surface_options = [None] + list(SURFACE_VARIABLES)
+selected_surface = st.sidebar.selectbox(
+    "Superficie interpolada",
+    surface_options,
+    format_func=lambda variable: SURFACE_VARIABLES.get(variable, "Ninguna")
+)
+
+# Mostrar el mapa y la tabla de los estados que van llegando durante una actualización
+streaming = st.sidebar.checkbox("Mostrar resultados a medida que llegan", value=True)
+
+# Versiones de datos con figuras en caché: la última y las anteriores que todavía usan las
+# ejecuciones que empezaron antes de publicarse la nueva
+CACHED_VERSIONS = 3
+
+# Entradas en caché de mapas y figuras: versiones en caché por cada región
+FIGURE_CACHE_ENTRIES = CACHED_VERSIONS * len(region_options)
+
+# Entradas en caché de los gráficos diarios (uno por versión y estado)
+DAILY_CACHE_ENTRIES = 100
+
+# Tiempos de arranque del proceso: importaciones y primera página (segundos)
+@st.cache_resource
+def get_startup_times():
+    """Devuelve el registro de tiempos de arranque, compartido por todas las sesiones"""
+    
+    return {}
+
+tiempos_arranque = get_startup_times()
+primera_ejecucion = not tiempos_arranque
+if primera_ejecucion:
+    tiempos_arranque["importaciones"] = duracion_importaciones
+    metrics.observe("stage_seconds", duracion_importaciones, etapa="arranque:importaciones")
+
+# Historial de observaciones compartido por todas las sesiones del proceso
+@st.cache_resource
+def get_history_store():
+    """Abre el historial de observaciones y pronósticos"""
+    
+    return HistoryStore()
+
+# Actualizador en segundo plano compartido por todas las sesiones del proceso
+@st.cache_resource
+def get_refresher():
+    """Inicia el hilo que reconstruye periódicamente el snapshot de datos"""
+    
+    history = get_history_store()
+    
+    # Se piden respuestas más recientes que el intervalo para adelantarse al vencimiento de la caché
+    def build(on_progress, on_partial):
+        return build_snapshot(API_KEY, on_progress=on_progress, max_age=DEFAULT_REFRESH_INTERVAL, history=history,
+                              on_partial=on_partial)
+    
+    refresher = SnapshotRefresher(build, interval=DEFAULT_REFRESH_INTERVAL, snapshot_dir=DEFAULT_SNAPSHOT_PATH)
+    
+    # Mostrar el último snapshot guardado mientras la primera actualización corre en segundo plano
+    refresher.warm_start()
+    return refresher.start()
 
-# Manejo de estado de la sesión
-if 'last_update' not in st.session_state:
-    st.session_state.last_update = None
+refresher = get_refresher()
 
-if 'results_data' not in st.session_state:
-    st.session_state.results_data = None
+# Endpoint /metrics en formato de Prometheus (opcional, con RAIN_METRICS_PORT)
+@st.cache_resource
+def get_metrics_endpoint():
+    """Inicia el endpoint de métricas una sola vez por proceso"""
+    
+    metrics.enable()
+    return metrics.start_http_server(metrics.METRICS_PORT)
+
+if metrics.METRICS_PORT:
+    get_metrics_endpoint()
+
+# API de datos de solo lectura sobre el snapshot compartido (opcional, con RAIN_API_PORT)
+@st.cache_resource
+def get_data_api():
+    """Inicia la API de datos una sola vez por proceso"""
+    
+    return data_api.start_http_server(data_api.API_PORT, refresher.latest)
 
-# Botón para actualizar datos
+if data_api.API_PORT:
+    get_data_api()
+
+# Mapa de probabilidad de lluvia, reutilizado en los reruns que no cambian los datos
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES * len(surface_options), show_spinner=False)
+def get_map_html(version, region, variable, _df_estados, _superficie):
+    """Construye el mapa y devuelve su HTML; la clave es la versión del snapshot, la región y la superficie"""
+    
+    from maps import build_rain_map, render_map_html
+    
+    return render_map_html(build_rain_map(_df_estados, _superficie, SURFACE_VARIABLES.get(variable)))
+
+# Superficie nacional interpolada (IDW), calculada una vez por versión y variable
+@st.cache_data(max_entries=CACHED_VERSIONS * len(SURFACE_VARIABLES), show_spinner=False)
+def get_rain_surface(version, variable, _snapshot):
+    """Interpola la variable de todos los estados sobre una malla de México"""
+    
+    return snapshot_surface(_snapshot, variable)
+
+# Observaciones recientes del historial, leídas una vez por versión del snapshot
+@st.cache_data(ttl=DEFAULT_REFRESH_INTERVAL, show_spinner=False)
+def load_recent_history(version, nombres, horas=24):
+    """Lee las observaciones de las últimas horas de los estados indicados"""
+    
+    hasta = datetime.now()
+    return get_history_store().scan(
+        "observaciones",
+        nombres=list(nombres),
+        desde=hasta - timedelta(hours=horas),
+        hasta=hasta,
+        columnas=["ts", "nombre", "temp", "humedad"]
+    )
+
+# Tablas y figuras de cada pestaña, construidas la primera vez que se muestran y
+# memorizadas por versión del snapshot y región (los DataFrames no forman parte de la clave)
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def get_current_tables(version, region, _df_estados):
+    """Tarjetas y tabla de condiciones actuales"""
+    
+    return figures.current_tables(_df_estados)
+
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def get_forecast_figures(version, region, _df_estados, _dias_secos, _riesgo):
+    """Mapa de calor y tabla de pronóstico"""
+    
+    return figures.rain_choropleth(_df_estados), figures.forecast_table(_df_estados, _dias_secos, _riesgo)
+
+@st.cache_data(max_entries=DAILY_CACHE_ENTRIES, show_spinner=False)
+def get_daily_figures(version, nombre, _df_diario):
+    """Gráficos diarios de un estado"""
+    
+    return figures.daily_figures(_df_diario, nombre)
+
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def get_regional_figures(version, region, _df_estados, _agregados):
+    """Tabla y gráficos del análisis regional"""
+    
+    return figures.regional_figures(_df_estados, _agregados)
+
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def get_trend_figures(version, region, ventana, _df_estados, _agregados, _tendencias):
+    """Gráficos y estadísticas de tendencias (de la última actualización o de una ventana móvil)"""
+    
+    if ventana not in ROLLING_WINDOWS:
+        return figures.trend_figures(_df_estados, _agregados)
+    return figures.trend_figures(_df_estados, _agregados, _tendencias, ventana)
+
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def get_history_figure(version, nombres):
+    """Gráfico de temperatura del historial reciente"""
+    
+    return figures.history_figure(load_recent_history(version, nombres))
+
+# Columnas de la tabla provisional durante una actualización
+PARTIAL_COLUMNS = ["nombre", "region", "temp_actual", "clima_actual", "probabilidad_lluvia", "dias_con_lluvia"]
+
+def show_partial_results(completadas):
+    """Muestra el mapa y la tabla de los estados ya recibidos hasta que termina la actualización en curso"""
+    
+    from maps import build_rain_map, render_map_html
+    
+    progress_bar = st.progress(0.0, text="Cargando datos climáticos...")
+    contenedor = st.empty()
+    mostradas = 0
+    
+    while not refresher.wait_completed(completadas, timeout=0.2):
+        parcial = refresher.partial()
+        recibidos = len(parcial.results) if parcial is not None else 0
+        progress_bar.progress(refresher.progress, text=f"Cargando datos climáticos... {recibidos} ubicaciones recibidas")
+        
+        # Redibujar solo cuando llegan estados nuevos
+        if recibidos == mostradas:
+            continue
+        mostradas = recibidos
+        df_parcial = parcial.estados(selected_region)
+        with contenedor.container():
+            st.subheader("Mapa de probabilidad de lluvia por estado (actualización en curso)")
+            components.html(render_map_html(build_rain_map(df_parcial)), width=MAP_WIDTH, height=MAP_HEIGHT + 10)
+            st.dataframe(df_parcial[PARTIAL_COLUMNS], hide_index=True)
+    
+    # El snapshot completo reemplaza al contenido provisional
+    progress_bar.empty()
+    contenedor.empty()
+
+# Botón para actualizar datos (la actualización corre en segundo plano)
 update_button = st.sidebar.button("Actualizar datos")
 
-# Cargar datos iniciales o actualizar según el botón
-if update_button or st.session_state.results_data is None:
+if update_button:
+    completadas = refresher.completed
+    refresher.request_refresh()
+    if streaming:
+        show_partial_results(completadas)
+    else:
+        st.sidebar.info("Actualización en curso. Los datos nuevos se mostrarán al recargar la página.")
+
+# Cada carga de la página muestra el último snapshot publicado (el guardado del arranque hasta
+# que termina la primera actualización); toda la ejecución usa ese mismo objeto.
+# Leer el contador antes de pedir el snapshot: si la primera actualización termina entre las dos
+# lecturas, la espera de abajo ve que ya terminó en lugar de esperar a la siguiente
+completadas = refresher.completed
+snapshot = refresher.latest()
+
+# Primera carga del proceso: mostrar los estados a medida que llegan hasta el primer snapshot
+if snapshot is None and streaming:
+    if refresher.last_error is None:
+        show_partial_results(completadas)
+    snapshot = refresher.latest()
+
+# Sin streaming: esperar al primer snapshot mostrando solo el avance
+if snapshot is None and refresher.last_error is None:
     with st.spinner('Cargando datos climáticos...'):
             # Barra de progreso
             progress_bar = st.progress(0)
             
-            results = []
-            datos_diarios_por_estado = {}
-            
-            for i, estado in enumerate(estados_filtrados):
-                # Actualizar barra de progreso
-                progress_bar.progress((i + 1) / len(estados_filtrados))
-                
-                # Obtener datos actuales
-                current_data = get_current_weather(estado["lat"], estado["lon"], API_KEY)
-                
-                # Obtener pronóstico
-                forecast_data = get_forecast(estado["lat"], estado["lon"], API_KEY)
-                
-                # Analizar si hay lluvia en el pronóstico
-                rain_analysis = analyze_rain_forecast(forecast_data)
-                
-                # Guardar datos diarios por estado
-                datos_diarios_por_estado[estado["nombre"]] = rain_analysis["datos_diarios"]
-                
-                # Obtener información actual
-                temp_actual = None
-                clima_actual = None
-                humedad_actual = None
-                presion_actual = None
-                viento_actual = None
-                icon_code = None
-                
-                if current_data and 'main' in current_data:
-                    temp_actual = current_data['main'].get('temp')
-                    humedad_actual = current_data['main'].get('humidity')
-                    presion_actual = current_data['main'].get('pressure')
-                    
-                    if 'wind' in current_data:
-                        viento_actual = current_data['wind'].get('speed')
-                    
-                    if 'weather' in current_data and len(current_data['weather']) > 0:
-                        clima_actual = current_data['weather'][0].get('description')
-                        icon_code = current_data['weather'][0].get('icon')
-                
-                # Guardar resultados
-                results.append({
-                    "nombre": estado["nombre"],
-                    "region": estado["region"],
-                    "lat": estado["lat"],
-                    "lon": estado["lon"],
-                    "temp_actual": temp_actual,
-                    "clima_actual": clima_actual,
-                    "humedad_actual": humedad_actual,
-                    "presion_actual": presion_actual,
-                    "viento_actual": viento_actual,
-                    "icon_code": icon_code,
-                    "lluvia_proximos_dias": rain_analysis["lluvia_proximos_dias"],
-                    "probabilidad_lluvia": rain_analysis["probabilidad_lluvia"],
-                    "dias_con_lluvia": rain_analysis["dias_con_lluvia"],
-                    "proxima_lluvia": rain_analysis["proxima_lluvia"]
-                })
-            
-            # Guardar datos en session_state
-            st.session_state.results_data = results
-            st.session_state.datos_diarios_por_estado = datos_diarios_por_estado
+            while snapshot is None and refresher.last_error is None:
+                progress_bar.progress(refresher.progress)
+                snapshot = refresher.wait(timeout=0.2)
             
             # Limpiar barra de progreso
             progress_bar.empty()
 
-# Usar los datos almacenados en session_state
-if st.session_state.results_data:
-    # Convertir a DataFrame
-    df_estados = pd.DataFrame(st.session_state.results_data)
-    
-    # Crear mapa
-    m = folium.Map(location=[23.6345, -102.5528], zoom_start=5)
-    
-    # Añadir marcadores para cada estado
-    for _, row in df_estados.iterrows():
-        # Determinar color basado en probabilidad de lluvia
-        if row["probabilidad_lluvia"] > 50:
-            color = "green"
-        elif row["probabilidad_lluvia"] > 30:
-            color = "lightblue"
-        elif row["probabilidad_lluvia"] > 10:
-            color = "orange"
-        else:
-            color = "red"
+if snapshot is None:
+    st.error(f"Error al cargar los datos climáticos: {refresher.last_error}")
+
+if snapshot is not None:
+    if snapshot is refresher.restored:
+        st.info(f"Mostrando los datos guardados del {snapshot.timestamp.strftime('%d/%m/%Y %H:%M')}; "
+                "la actualización corre en segundo plano")
+    
+    if snapshot.errores:
+        st.warning("No se pudieron obtener datos completos para: " + ", ".join(snapshot.errores))
+    
+    # Alertas tempranas: estados que cambiaron de nivel de riesgo de sequía en la última actualización
+    if snapshot.alertas is not None and not snapshot.alertas.empty:
+        with st.expander(f"Alertas tempranas de sequía ({len(snapshot.alertas)})", expanded=True):
+            st.dataframe(figures.alert_table(snapshot.alertas), hide_index=True)
+
+# Usar el snapshot compartido (solo lectura); el filtro por región se hace en memoria
+if snapshot is not None and not snapshot.df_estados.empty:
+    df_estados = snapshot.estados(selected_region)
+    
+    with medir("Mapa"):
+        # HTML del mapa construido una sola vez por versión de datos y región
+        superficie = get_rain_surface(snapshot.version, selected_surface, snapshot) if selected_surface else None
+        map_html = get_map_html(snapshot.version, selected_region, selected_surface, df_estados, superficie)
+        
+        # Mostrar mapa en Streamlit
+        st.subheader("Mapa de probabilidad de lluvia por estado")
+        components.html(map_html, width=MAP_WIDTH, height=MAP_HEIGHT + 10)
+    
+    # Selector de pestañas: solo se construye la pestaña visible
+    seccion = st.radio("Sección", TABS, horizontal=True, label_visibility="collapsed", key="seccion")
+    
+    if seccion == "Datos actuales":
+        with medir(seccion):
+            # Mostrar datos actuales en una tabla
+            st.subheader("Condiciones actuales por estado")
             
-        # Crear popup con información
-        popup_html = f"""
-        <div style="width: 200px">
-            <h4>{row['nombre']}</h4>
-            <p><b>Temperatura actual:</b> {row['temp_actual']}°C</p>
-            <p><b>Clima actual:</b> {row['clima_actual']}</p>
-            <p><b>Humedad:</b> {row['humedad_actual']}%</p>
-            <p><b>Viento:</b> {row['viento_actual']} m/s</p>
-            <p><b>Probabilidad de lluvia (5 días):</b> {row['probabilidad_lluvia']}%</p>
-            <p><b>Días con lluvia prevista:</b> {row['dias_con_lluvia']}</p>
-            <p><b>Próxima lluvia:</b> {row['proxima_lluvia'].strftime('%d/%m/%Y %H:%M') if not pd.isnull(row['proxima_lluvia']) else 'No prevista'}</p>
-        </div>
-        """
-        
-        folium.CircleMarker(
-            location=[row["lat"], row["lon"]],
-            radius=10,
-            color=color,
-            fill=True,
-            fill_color=color,
-            fill_opacity=0.7,
-            popup=folium.Popup(popup_html, max_width=300)
-        ).add_to(m)
-    
-    # Añadir leyenda
-    legend_html = '''
-    <div style="position: fixed; 
-        bottom: 50px; left: 50px; width: 250px; height: 130px; 
-        border:2px solid grey; z-index:9999; font-size:14px;
-        background-color:white;
-        padding: 10px;
-        border-radius: 5px;
-        ">
-        <p><i class="fa fa-circle" style="color:green"></i> Probabilidad alta (>50%)</p>
-        <p><i class="fa fa-circle" style="color:lightblue"></i> Probabilidad media (30-50%)</p>
-        <p><i class="fa fa-circle" style="color:orange"></i> Probabilidad baja (10-30%)</p>
-        <p><i class="fa fa-circle" style="color:red"></i> Sin lluvia prevista (<10%)</p>
-    </div>
-    '''
-    m.get_root().html.add_child(folium.Element(legend_html))
-    
-    # Mostrar mapa en Streamlit
-    st.subheader("Mapa de probabilidad de lluvia por estado")
-    folium_static(m)
-    
-    # Mostrar pestañas con diferentes visualizaciones
-    tab1, tab2, tab3, tab4 = st.tabs(["Datos actuales", "Pronóstico de lluvia", "Análisis regional", "Tendencias"])
-    
-    with tab1:
-        # Mostrar datos actuales en una tabla
-        st.subheader("Condiciones actuales por estado")
-        
-        # Crear columnas para mostrar tarjetas de estados
-        col1, col2 = st.columns(2)
-        
-        # Ordenar estados por temperatura (de mayor a menor)
-        df_temp = df_estados.sort_values(by="temp_actual", ascending=False)
-        
-        with col1:
-            st.markdown("#### Estados más calurosos")
-            for _, row in df_temp.head(5).iterrows():
-                with st.container():
-                    st.markdown(f"""
-                    <div style="border:1px solid #ddd; border-radius:5px; padding:10px; margin-bottom:10px;">
-                        <h5>{row['nombre']} - {row['temp_actual']}°C</h5>
-                        <p>{row['clima_actual']}</p>
-                        <p>Humedad: {row['humedad_actual']}% | Viento: {row['viento_actual']} m/s</p>
-                    </div>
-                    """, unsafe_allow_html=True)
-        
-        with col2:
-            st.markdown("#### Estados más frescos")
-            for _, row in df_temp.tail(5).iterrows():
-                with st.container():
-                    st.markdown(f"""
-                    <div style="border:1px solid #ddd; border-radius:5px; padding:10px; margin-bottom:10px;">
-                        <h5>{row['nombre']} - {row['temp_actual']}°C</h5>
-                        <p>{row['clima_actual']}</p>
-                        <p>Humedad: {row['humedad_actual']}% | Viento: {row['viento_actual']} m/s</p>
-                    </div>
-                    """, unsafe_allow_html=True)
-        
-        # Mostrar todos los datos en una tabla
-        st.markdown("#### Datos de todos los estados")
-        st.dataframe(
-            df_estados[["nombre", "region", "temp_actual", "clima_actual", "humedad_actual", "viento_actual"]]
-            .rename(columns={
-                "nombre": "Estado", 
-                "region": "Región",
-                "temp_actual": "Temperatura (°C)", 
-                "clima_actual": "Clima", 
-                "humedad_actual": "Humedad (%)", 
-                "viento_actual": "Viento (m/s)"
-            })
-            .sort_values(by="Estado")
-        )
-    
-    with tab2:
-        # Mostrar pronóstico en una tabla
-        st.subheader("Pronóstico de lluvia para los próximos 5 días")
-        
-        # Crear una columna formateada para mostrar la próxima lluvia
-        df_pronostico = df_estados.copy()
-        df_pronostico["proxima_lluvia_fmt"] = df_pronostico["proxima_lluvia"].apply(
-            lambda x: x.strftime("%d/%m/%Y %H:%M") if not pd.isnull(x) else "No prevista"
-        )
-        
-        # Crear gráfico de mapa de calor para probabilidad de lluvia
-        fig = px.choropleth(
-            df_pronostico,
-            locations="nombre",
-            color="probabilidad_lluvia",
-            hover_name="nombre",
-            color_continuous_scale="Blues",
-            labels={"probabilidad_lluvia": "Probabilidad de lluvia (%)"},
-            title="Mapa de calor de probabilidad de lluvia por estado"
-        )
-        
-        # Intentar ajustar el mapa a México, pero como usamos nombres en lugar de códigos geográficos, esto es limitado
-        fig.update_geos(
-            visible=False,
-            showcountries=True,
-            showcoastlines=True
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
-        
-        # Mostrar tabla de pronóstico
-        st.dataframe(
-            df_pronostico[["nombre", "region", "probabilidad_lluvia", "dias_con_lluvia", "proxima_lluvia_fmt"]]
-            .rename(columns={
-                "nombre": "Estado", 
-                "region": "Región",
-                "probabilidad_lluvia": "Prob. lluvia (%)", 
-                "dias_con_lluvia": "Días con lluvia", 
-                "proxima_lluvia_fmt": "Próxima lluvia"
-            })
-            .sort_values(by="Prob. lluvia (%)", ascending=False)
-        )
-        
-        # Mostrar detalles de pronóstico diario para un estado seleccionado
-        st.subheader("Pronóstico diario detallado")
-        
-        # Selector de estado
-        estado_seleccionado = st.selectbox(
-            "Selecciona un estado para ver el pronóstico diario detallado",
-            df_estados["nombre"].tolist()
-        )
-        
-        if estado_seleccionado and estado_seleccionado in st.session_state.datos_diarios_por_estado:
-            datos_diarios = st.session_state.datos_diarios_por_estado[estado_seleccionado]
-            if datos_diarios:
-                # Convertir a DataFrame
-                df_diario = pd.DataFrame(datos_diarios)
-                
-                # Formatear fecha
-                df_diario["fecha_str"] = df_diario["fecha"].apply(lambda x: x.strftime("%d/%m/%Y"))
-                
-                # Crear gráfico de temperatura máxima y mínima
-                fig_temp = go.Figure()
-                
-                fig_temp.add_trace(
-                    go.Scatter(
-                        x=df_diario["fecha_str"],
-                        y=df_diario["max_temp"],
-                        mode="lines+markers",
-                        name="Temp. Máxima",
-                        line=dict(color="red")
-                    )
-                )
-                
-                fig_temp.add_trace(
-                    go.Scatter(
-                        x=df_diario["fecha_str"],
-                        y=df_diario["min_temp"],
-                        mode="lines+markers",
-                        name="Temp. Mínima",
-                        line=dict(color="blue")
-                    )
-                )
-                
-                fig_temp.update_layout(
-                    title=f"Pronóstico de temperatura para {estado_seleccionado}",
-                    xaxis_title="Fecha",
-                    yaxis_title="Temperatura (°C)",
-                    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-                )
-                
-                st.plotly_chart(fig_temp, use_container_width=True)
-                
-                # Crear gráfico de precipitación
-                fig_precip = go.Figure()
-                
-                fig_precip.add_trace(
-                    go.Bar(
-                        x=df_diario["fecha_str"],
-                        y=df_diario["precipitacion"],
-                        name="Precipitación",
-                        marker_color="skyblue"
-                    )
-                )
-                
-                fig_precip.update_layout(
-                    title=f"Pronóstico de precipitación para {estado_seleccionado}",
-                    xaxis_title="Fecha",
-                    yaxis_title="Precipitación (mm)",
-                    showlegend=False
-                )
-                
-                st.plotly_chart(fig_precip, use_container_width=True)
-            else:
-                st.write("No hay datos diarios disponibles para este estado")
+            df_calurosos, df_frescos, df_tabla = get_current_tables(snapshot.version, selected_region, df_estados)
+            
+            # Crear columnas para mostrar tarjetas de estados
+            col1, col2 = st.columns(2)
+            
+            for columna, titulo, df_tarjetas in ((col1, "Estados más calurosos", df_calurosos), (col2, "Estados más frescos", df_frescos)):
+                with columna:
+                    st.markdown(f"#### {titulo}")
+                    for _, row in df_tarjetas.iterrows():
+                        with st.container():
+                            st.markdown(f"""
+                            <div style="border:1px solid #ddd; border-radius:5px; padding:10px; margin-bottom:10px;">
+                                <h5>{row['nombre']} - {row['temp_actual']}°C</h5>
+                                <p>{row['clima_actual']}</p>
+                                <p>Humedad: {row['humedad_actual']}% | Viento: {row['viento_actual']} m/s</p>
+                            </div>
+                            """, unsafe_allow_html=True)
+            
+            # Mostrar todos los datos en una tabla
+            st.markdown("#### Datos de todos los estados")
+            st.dataframe(df_tabla)
     
-    with tab3:
-        # Análisis regional
-        st.subheader("Análisis regional de probabilidad de lluvia")
-        
-        # Agrupar por región
-        df_regional = df_estados.groupby("region").agg({
-            "probabilidad_lluvia": "mean",
-            "dias_con_lluvia": "mean",
-            "nombre": "count"
-        }).reset_index()
-        
-        df_regional = df_regional.rename(columns={
-            "probabilidad_lluvia": "Prob. lluvia promedio (%)",
-            "dias_con_lluvia": "Días con lluvia promedio",
-            "nombre": "Número de estados"
-        })
-        
-        # Mostrar tabla regional
-        st.dataframe(df_regional)
-        
-        # Crear gráfico de barras para probabilidad de lluvia por región
-        fig_region = px.bar(
-            df_regional,
-            x="region",
-            y="Prob. lluvia promedio (%)",
-            text="Prob. lluvia promedio (%)",
-            color="region",
-            labels={"region": "Región"},
-            title="Probabilidad de lluvia promedio por región"
-        )
-        
-        fig_region.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
-        
-        st.plotly_chart(fig_region, use_container_width=True)
-        
-        # Gráfico de días con lluvia por región
-        fig_dias = px.bar(
-            df_regional,
-            x="region",
-            y="Días con lluvia promedio",
-            text="Días con lluvia promedio",
-            color="region",
-            labels={"region": "Región"},
-            title="Días con lluvia promedio por región"
-        )
-        
-        fig_dias.update_traces(texttemplate='%{text:.1f}', textposition='outside')
-        
-        st.plotly_chart(fig_dias, use_container_width=True)
+    elif seccion == "Pronóstico de lluvia":
+        with medir(seccion):
+            # Mostrar pronóstico en una tabla
+            st.subheader("Pronóstico de lluvia para los próximos 5 días")
+            
+            fig, df_tabla = get_forecast_figures(snapshot.version, selected_region, df_estados, snapshot.dias_secos, snapshot.riesgo)
+            st.plotly_chart(fig, use_container_width=True)
+            
+            # Mostrar tabla de pronóstico
+            st.dataframe(df_tabla)
+            
+            # Mostrar detalles de pronóstico diario para un estado seleccionado
+            st.subheader("Pronóstico diario detallado")
+            
+            # Selector de estado
+            estado_seleccionado = st.selectbox(
+                "Selecciona un estado para ver el pronóstico diario detallado",
+                df_estados["nombre"].tolist()
+            )
+            
+            if estado_seleccionado:
+                # Solo se recalculan los gráficos diarios del estado elegido
+                figuras_diarias = get_daily_figures(snapshot.version, estado_seleccionado, snapshot.diario(estado_seleccionado))
+                if figuras_diarias is not None:
+                    fig_temp, fig_precip = figuras_diarias
+                    st.plotly_chart(fig_temp, use_container_width=True)
+                    st.plotly_chart(fig_precip, use_container_width=True)
+                else:
+                    st.write("No hay datos diarios disponibles para este estado")
     
-    with tab4:
-        # Análisis de tendencias y correlaciones
-        st.subheader("Análisis de tendencias y correlaciones")
-        
-        # Crear gráfico de dispersión entre temperatura y humedad
-        fig_scatter = px.scatter(
-            df_estados,
-            x="temp_actual",
-            y="humedad_actual",
-            size="probabilidad_lluvia",
-            color="region",
-            hover_name="nombre",
-            labels={
-                "temp_actual": "Temperatura (°C)",
-                "humedad_actual": "Humedad (%)",
-                "probabilidad_lluvia": "Prob. de lluvia (%)",
-                "region": "Región"
-            },
-            title="Correlación entre temperatura, humedad y probabilidad de lluvia"
-        )
-        
-        st.plotly_chart(fig_scatter, use_container_width=True)
-        
-        # Calcular correlaciones
-        corr_cols = ["temp_actual", "humedad_actual", "presion_actual", "viento_actual", "probabilidad_lluvia", "dias_con_lluvia"]
-        df_corr = df_estados[corr_cols].corr()
-        
-        # Visualizar matriz de correlación
-        fig_corr = px.imshow(
-            df_corr,
-            text_auto=True,
-            color_continuous_scale="RdBu_r",
-            title="Matriz de correlación entre variables climáticas"
-        )
-        
-        st.plotly_chart(fig_corr, use_container_width=True)
-        
-        # Análisis de distribución de probabilidad de lluvia
-        st.subheader("Distribución de probabilidad de lluvia")
-        
-        fig_hist = px.histogram(
-            df_estados,
-            x="probabilidad_lluvia",
-            nbins=20,
-            color="region",
-            labels={"probabilidad_lluvia": "Probabilidad de lluvia (%)"},
-            title="Distribución de probabilidad de lluvia por región"
-        )
-        
-        st.plotly_chart(fig_hist, use_container_width=True)
-        
-        # Calcular estadísticas descriptivas
-        st.subheader("Estadísticas climáticas descriptivas")
-        
-        df_stats = df_estados[["temp_actual", "humedad_actual", "probabilidad_lluvia"]].describe().reset_index()
-        df_stats = df_stats.rename(columns={
-            "index": "Estadística",
-            "temp_actual": "Temperatura (°C)",
-            "humedad_actual": "Humedad (%)",
-            "probabilidad_lluvia": "Prob. lluvia (%)"
-        })
-        
-        st.dataframe(df_stats)
+    elif seccion == "Análisis regional":
+        with medir(seccion):
+            # Análisis regional
+            st.subheader("Análisis regional de probabilidad de lluvia")
+            
+            df_regional, fig_region, fig_dias = get_regional_figures(snapshot.version, selected_region, df_estados, snapshot.agregados)
+            
+            # Mostrar tabla regional
+            st.dataframe(df_regional)
+            
+            st.plotly_chart(fig_region, use_container_width=True)
+            st.plotly_chart(fig_dias, use_container_width=True)
+    
+    elif seccion == "Tendencias":
+        with medir(seccion):
+            # Análisis de tendencias y correlaciones
+            st.subheader("Análisis de tendencias y correlaciones")
+            
+            # Periodo de las estadísticas: la última actualización o una ventana móvil
+            ventana = "Última actualización"
+            if snapshot.tendencias is not None:
+                ventana = st.radio(
+                    "Periodo de las estadísticas",
+                    ["Última actualización"] + list(ROLLING_WINDOWS),
+                    horizontal=True,
+                    key="ventana"
+                )
+                if ventana in ROLLING_WINDOWS:
+                    st.caption(f"{snapshot.tendencias.observations(ventana, set(df_estados['region']))} observaciones "
+                               "acumuladas desde que inició la aplicación")
+            
+            fig_scatter, fig_corr, fig_hist, df_stats = get_trend_figures(
+                snapshot.version, selected_region, ventana, df_estados, snapshot.agregados, snapshot.tendencias
+            )
+            
+            st.plotly_chart(fig_scatter, use_container_width=True)
+            st.plotly_chart(fig_corr, use_container_width=True)
+            
+            # Análisis de distribución de probabilidad de lluvia
+            st.subheader("Distribución de probabilidad de lluvia")
+            st.plotly_chart(fig_hist, use_container_width=True)
+            
+            # Calcular estadísticas descriptivas
+            st.subheader("Estadísticas climáticas descriptivas")
+            st.dataframe(df_stats)
+            
+            # Tendencias a partir del historial de observaciones
+            st.subheader("Tendencias históricas (últimas 24 horas)")
+            
+            fig_tendencia = get_history_figure(snapshot.version, tuple(df_estados["nombre"]))
+            if fig_tendencia is None:
+                st.info("Todavía no hay suficientes observaciones en el historial para mostrar tendencias")
+            else:
+                st.plotly_chart(fig_tendencia, use_container_width=True)
+
+# Uso de la cuota de OpenWeather en este proceso
+with st.sidebar.expander("Uso de la API de OpenWeather"):
+    uso_api = get_scheduler().stats()
+    st.metric(
+        "Llamadas en el último minuto",
+        f"{uso_api['llamadas_ultimo_minuto']} / {uso_api['cuota_por_minuto']}",
+        help="Cuota del plan gratuito por minuto"
+    )
+    st.dataframe(pd.Series(uso_api, name="Valor").to_frame())
+
+# Panel de depuración con los tiempos de esta ejecución y las métricas del proceso
+if st.sidebar.checkbox("Mostrar panel de rendimiento"):
+    with st.sidebar.expander("Rendimiento", expanded=True):
+        st.caption("Render de esta ejecución (s)")
+        st.dataframe(pd.Series(st.session_state.tiempos_render, name="Segundos", dtype=float).round(3).to_frame())
+        
+        st.caption("Arranque del proceso (s)")
+        st.dataframe(pd.Series(tiempos_arranque, name="Segundos", dtype=float).round(3).to_frame())
+        
+        if metrics.ENABLED:
+            st.caption("Métricas del proceso")
+            df_metricas = pd.DataFrame(metrics.collect())
+            if not df_metricas.empty:
+                df_metricas["etiquetas"] = df_metricas["etiquetas"].map(
+                    lambda etiquetas: ", ".join(f"{k}={v}" for k, v in etiquetas.items())
+                )
+            st.dataframe(df_metricas, hide_index=True)
+        else:
+            st.caption("Define RAIN_METRICS=1 para medir también las etapas del pipeline, la caché y la latencia de OpenWeather.")
 
 # Información adicional COMPLETADA
 st.sidebar.markdown("---")
@@ -632,6 +469,8 @@ Este proyecto visualiza datos climáticos de México obtenidos de OpenWeather, c
 - **Fuente de Datos:** Datos en tiempo real de OpenWeather API (pronóstico de 5 días)
 - **Definición de Lluvia:** Se considera lluvia significativa cuando se registra más de 1mm de precipitación en 3 horas
 - **Cálculo de Probabilidad:** Porcentaje de períodos de 3 horas con lluvia en los próximos 5 días
+- **Estadísticas Móviles:** Medias, varianzas, correlaciones e histogramas de las últimas 24 horas, 7 días o 30 días, acumulados desde que inició la aplicación (los percentiles se aproximan con los histogramas)
+- **Riesgo de Sequía:** Índice de 0 a 100 que combina probabilidad de lluvia, días con lluvia, humedad, temperatura y días secos consecutivos; se alerta cuando un estado cambia de nivel
 - **Regiones:** 
   - Norte: Estados fronterizos y zonas áridas
   - Centro: Zona del altiplano central
@@ -662,7 +501,7 @@ st.markdown("---")
 st.markdown("""
 ### Detalles Técnicos
 1. **Actualización de Datos:** 
-   - Los datos se actualizan automáticamente cada 1 hora
+   - Los datos se actualizan automáticamente cada {} minutos
    - Última actualización: {}
    
 2. **Código Fuente:** 
@@ -670,7 +509,7 @@ st.markdown("""
 
 3. **Licencia:** 
    MIT License - Uso libre para fines educativos
-""".format(st.session_state.last_update.strftime('%d/%m/%Y %H:%M') if st.session_state.last_update else "N/A"))
+""".format(DEFAULT_REFRESH_INTERVAL // 60, snapshot.timestamp.strftime('%d/%m/%Y %H:%M') if snapshot is not None else "N/A"))
 
 with st.expander("📚 Guía Rápida - Cómo Funciona Esta App"):
     st.markdown("""
@@ -687,8 +526,9 @@ with st.expander("📚 Guía Rápida - Cómo Funciona Esta App"):
     # Paso 2: Calcular métricas
     probabilidad = (periodos_lluvia / total_periodos) * 100
     
-    # Paso 3: Visualizar
-    folium.Map().add_child(HeatMap(data))
+    # Paso 3: Visualizar (superficie IDW como imagen sobre el mapa)
+    superficie = rain_surface(lon, lat, probabilidad)
+    folium.Map().add_child(ImageOverlay(superficie.image(), superficie.bounds))
     ```
     
     ## 📊 Interpretación de Gráficos
@@ -696,3 +536,8 @@ with st.expander("📚 Guía Rápida - Cómo Funciona Esta App"):
     |---------|----------------|---------|
     | Matriz Correlación | Valores cerca de +1/-1 | Relaciones fuertes positivas/negativas |
     """)
+
+# Tiempo hasta la primera página del proceso (desde que empezó la primera ejecución del script)
+if primera_ejecucion:
+    tiempos_arranque["primera_pagina"] = time.perf_counter() - inicio_ejecucion
+    metrics.observe("stage_seconds", tiempos_arranque["primera_pagina"], etapa="arranque:primera_pagina")
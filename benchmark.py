@@ -0,0 +1,487 @@
+"""Pruebas de rendimiento de extremo a extremo contra el servidor local que imita OpenWeather.
+
+Mide la latencia de actualización en frío y en caliente para distintos números de
+ubicaciones, el rendimiento de analyze_rain_forecast y del índice de riesgo de sequía, las estadísticas móviles, la construcción del mapa de Folium y
+la superficie interpolada, el tiempo de render de cada pestaña con el AppTest de Streamlit y el arranque de
+un proceso nuevo de la app (importaciones y primera página, con y sin snapshot guardado). Los resultados se guardan
+en JSON para comparar ejecuciones:
+
+    python benchmark.py --sizes 32 500 5000 --fixtures fixtures
+    python benchmark.py --sizes 32 --compare benchmarks/anterior.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+# Caché, historial y cuota aislados para no tocar los datos reales ni limitar la tasa.
+# Deben definirse antes de importar los módulos del pipeline, que leen estos valores al cargarse.
+_TMP = tempfile.mkdtemp(prefix="rain-benchmark-")
+os.environ.setdefault("RAIN_CACHE_PATH", os.path.join(_TMP, "weather_cache.sqlite3"))
+os.environ.setdefault("RAIN_HISTORY_PATH", os.path.join(_TMP, "historial"))
+os.environ.setdefault("OPENWEATHER_CALLS_PER_MINUTE", "1000000")
+
+import pipeline
+from drought_risk import AlertEngine
+from forecast_parser import ForecastArrays, orjson, parse_forecast
+from interpolation import DEFAULT_RESOLUTION, grid, snapshot_surface
+from maps import build_rain_map
+from mock_openweather import MockConfig, start_server, synthetic_forecast, synthetic_locations
+from rolling_stats import DESCRIBE_COLUMNS, RollingStats
+
+# Número de ubicaciones por defecto para la actualización completa
+DEFAULT_SIZES = [32, 500, 5000]
+
+# Directorio por defecto de los resultados
+DEFAULT_RESULTS_DIR = "benchmarks"
+
+# Pestañas de la app (claves de st.session_state.tiempos_render junto con "Mapa")
+APP_TABS = ["Datos actuales", "Pronóstico de lluvia", "Análisis regional", "Tendencias"]
+
+API_KEY = "benchmark"
+
+
+def _resumen(tiempos):
+    """Estadísticas de una lista de duraciones (segundos)"""
+
+    return {
+        "n": len(tiempos),
+        "min_s": round(min(tiempos), 4),
+        "mediana_s": round(statistics.median(tiempos), 4),
+        "max_s": round(max(tiempos), 4)
+    }
+
+
+def _medir(funcion, repeticiones):
+    """Ejecuta `funcion` varias veces y devuelve las duraciones y el último resultado"""
+
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos, resultado
+
+
+def _ubicaciones(n):
+    """Los estados reales para 32 ubicaciones; ubicaciones sintéticas para el resto"""
+
+    if n == len(pipeline.estados_mexico):
+        return pipeline.estados_mexico
+    return synthetic_locations(n)
+
+
+def bench_refresh(sizes, repeticiones):
+    """Latencia de build_snapshot con la caché vacía (frío) y con la caché llena (caliente).
+
+    En caliente se mide la actualización incremental (sin cambios en las respuestas) y la
+    construcción completa; ninguna de las dos debería llamar a la API. Si lo hace, la medición
+    no es en caliente y se marca con "caliente_valido": False.
+    """
+
+    cache = pipeline.get_weather_cache()
+    # Dos respuestas por ubicación: con menos espacio la caché se vacía durante cada pasada
+    cache.max_entries = max(cache.max_entries, 2 * max(sizes))
+    registro = pipeline.get_incremental_results()
+    scheduler = pipeline.get_scheduler()
+    resultados = {}
+    for n in sizes:
+        estados = _ubicaciones(n)
+
+        def frio():
+            cache.clear()
+            registro.clear()
+            return pipeline.build_snapshot(API_KEY, estados=estados)
+
+        enviadas = scheduler.stats()["enviadas"]
+        tiempos_frio, snapshot = _medir(frio, repeticiones)
+        llamadas = (scheduler.stats()["enviadas"] - enviadas) // repeticiones
+        enviadas = scheduler.stats()["enviadas"]
+        tiempos_caliente, _ = _medir(lambda: pipeline.build_snapshot(API_KEY, estados=estados), repeticiones)
+        tiempos_completo, _ = _medir(
+            lambda: pipeline.build_snapshot(API_KEY, estados=estados, incremental=False), repeticiones
+        )
+        llamadas_caliente = scheduler.stats()["enviadas"] - enviadas
+
+        resultados[str(n)] = {
+            "frio": _resumen(tiempos_frio),
+            "caliente": _resumen(tiempos_caliente),
+            "caliente_completo": _resumen(tiempos_completo),
+            "llamadas_api": llamadas,
+            "llamadas_api_caliente": llamadas_caliente,
+            "caliente_valido": llamadas_caliente == 0,
+            "errores": len(snapshot.errores)
+        }
+        print(f"Actualización {n} ubicaciones: frío {statistics.median(tiempos_frio):.2f} s, "
+              f"caliente {statistics.median(tiempos_caliente):.2f} s "
+              f"(completo {statistics.median(tiempos_completo):.2f} s), {llamadas} llamadas")
+        if llamadas_caliente:
+            print(f"  AVISO: la pasada en caliente hizo {llamadas_caliente} llamadas a la API; "
+                  "su latencia no corresponde a una caché llena", file=sys.stderr)
+    return resultados
+
+
+def bench_analysis(n, repeticiones):
+    """Pronósticos analizados por segundo, uno a uno y en lote"""
+
+    forecasts = [synthetic_forecast(u["lat"], u["lon"]) for u in synthetic_locations(n)]
+
+    tiempos_uno, _ = _medir(lambda: [pipeline.analyze_rain_forecast(f) for f in forecasts], repeticiones)
+    tiempos_lote, _ = _medir(lambda: pipeline.analyze_rain_forecast_batch(forecasts), repeticiones)
+
+    # Decodificación de las respuestas: JSON completo, lectura de solo los campos usados
+    # y lectura del formato binario de la caché
+    cuerpos = [json.dumps(f).encode() for f in forecasts]
+    tiempos_json, _ = _medir(lambda: [json.loads(c) for c in cuerpos], repeticiones)
+    tiempos_parser, compactos = _medir(lambda: [parse_forecast(c) for c in cuerpos], repeticiones)
+    binarios = [f.to_bytes() for f in compactos]
+    tiempos_cache, _ = _medir(lambda: [ForecastArrays.from_bytes(b) for b in binarios], repeticiones)
+
+    resultados = {
+        "pronosticos": n,
+        "periodos_por_pronostico": len(forecasts[0]["list"]),
+        "secuencial": dict(_resumen(tiempos_uno), pronosticos_por_s=round(n / statistics.median(tiempos_uno), 1)),
+        "lote": dict(_resumen(tiempos_lote), pronosticos_por_s=round(n / statistics.median(tiempos_lote), 1)),
+        "decodificacion": {
+            "orjson": orjson is not None,
+            "json_completo": dict(_resumen(tiempos_json), pronosticos_por_s=round(n / statistics.median(tiempos_json), 1)),
+            "parser": dict(_resumen(tiempos_parser), pronosticos_por_s=round(n / statistics.median(tiempos_parser), 1)),
+            "cache_binaria": dict(_resumen(tiempos_cache), pronosticos_por_s=round(n / statistics.median(tiempos_cache), 1)),
+            "bytes_json_promedio": round(statistics.mean(len(c) for c in cuerpos)),
+            "bytes_binario_promedio": round(statistics.mean(len(b) for b in binarios))
+        }
+    }
+    decodificacion = resultados["decodificacion"]
+    print(f"Análisis de {n} pronósticos: {resultados['secuencial']['pronosticos_por_s']} /s secuencial, "
+          f"{resultados['lote']['pronosticos_por_s']} /s en lote")
+    print(f"Decodificación: {decodificacion['json_completo']['pronosticos_por_s']} /s JSON completo, "
+          f"{decodificacion['parser']['pronosticos_por_s']} /s parser, "
+          f"{decodificacion['cache_binaria']['pronosticos_por_s']} /s desde la caché "
+          f"({decodificacion['bytes_json_promedio']} -> {decodificacion['bytes_binario_promedio']} bytes)")
+    return resultados
+
+
+def bench_risk(n, repeticiones):
+    """Índice de riesgo de sequía y alertas de `n` ubicaciones en una sola pasada"""
+
+    base = pipeline.build_snapshot(API_KEY).df_estados
+    df_estados = base.sample(n, replace=True, random_state=0).reset_index(drop=True)
+    df_estados["nombre"] = [f"ubicacion-{i}" for i in range(n)]
+    dias_secos = {nombre: i % 40 for i, nombre in enumerate(df_estados["nombre"])}
+
+    motor = AlertEngine()
+    inicio = time.perf_counter()
+    _, alertas = motor.evaluate(df_estados, dias_secos)
+    tiempo_primera = time.perf_counter() - inicio
+    tiempos, _ = _medir(lambda: motor.evaluate(df_estados, dias_secos), repeticiones)
+
+    resultados = {
+        "ubicaciones": n,
+        "primera_s": round(tiempo_primera, 4),
+        "alertas_primera": len(alertas),
+        "siguientes": _resumen(tiempos)
+    }
+    print(f"Riesgo de {n} ubicaciones: primera evaluación {tiempo_primera * 1000:.1f} ms, "
+          f"siguientes {statistics.median(tiempos) * 1000:.1f} ms")
+    return resultados
+
+
+def bench_rolling(n, horas, repeticiones):
+    """Estadísticas móviles: agregar `horas` actualizaciones de `n` ubicaciones y consultarlas,
+    contra recalcular con pandas sobre el historial de la ventana de 7 días"""
+
+    base = pipeline.build_snapshot(API_KEY).df_estados
+    df_estados = base.sample(n, replace=True, random_state=0).reset_index(drop=True)
+    df_estados["nombre"] = [f"ubicacion-{i}" for i in range(n)]
+    inicio_ts = datetime.now().timestamp() - horas * 3600
+
+    estadisticas = RollingStats()
+    lotes = []
+    tiempos_update = []
+    for hora in range(horas):
+        lote = df_estados.assign(temp_actual=df_estados["temp_actual"] + (hora % 24) / 4)
+        lotes.append(lote)
+        inicio = time.perf_counter()
+        estadisticas.update(lote, datetime.fromtimestamp(inicio_ts + hora * 3600))
+        tiempos_update.append(time.perf_counter() - inicio)
+
+    def consultar():
+        vista = estadisticas.view()
+        return vista.correlation("7 días"), vista.describe("7 días"), vista.histogram("7 días")
+
+    def recalcular():
+        historial = pd.concat(lotes[-7 * 24:], ignore_index=True)
+        return historial[estadisticas.columns].corr(), historial[DESCRIBE_COLUMNS].describe()
+
+    tiempos_consulta, _ = _medir(consultar, repeticiones)
+    tiempos_pandas, _ = _medir(recalcular, repeticiones)
+
+    resultados = {
+        "ubicaciones": n,
+        "actualizaciones": horas,
+        "update": _resumen(tiempos_update),
+        "consulta": _resumen(tiempos_consulta),
+        "recalculo_pandas": _resumen(tiempos_pandas)
+    }
+    print(f"Estadísticas móviles de {n} ubicaciones x {horas} h: update {statistics.median(tiempos_update) * 1000:.1f} ms, "
+          f"consulta {statistics.median(tiempos_consulta) * 1000:.1f} ms, "
+          f"recalcular con pandas {statistics.median(tiempos_pandas) * 1000:.1f} ms")
+    return resultados
+
+
+def bench_map(sizes, repeticiones):
+    """Construcción del mapa de Folium y generación de su HTML"""
+
+    resultados = {}
+    for n in sizes:
+        df_estados = pipeline.build_snapshot(API_KEY, estados=_ubicaciones(n)).df_estados
+        tiempos_build, mapa = _medir(lambda: build_rain_map(df_estados), repeticiones)
+        tiempos_html, html = _medir(lambda: mapa.get_root().render(), repeticiones)
+        resultados[str(n)] = {
+            "construccion": _resumen(tiempos_build),
+            "html": _resumen(tiempos_html),
+            "html_bytes": len(html)
+        }
+        print(f"Mapa {n} ubicaciones: construcción {statistics.median(tiempos_build):.3f} s, "
+              f"HTML {statistics.median(tiempos_html):.3f} s ({len(html) / 1024:.0f} KiB)")
+    return resultados
+
+
+def bench_surface(resolution, repeticiones):
+    """Preparación de la malla (una vez por proceso) e interpolación de la superficie nacional"""
+
+    snapshot = pipeline.build_snapshot(API_KEY)
+    grid.cache_clear()
+    inicio = time.perf_counter()
+    _, _, dentro, forma, _ = grid(resolution)
+    tiempo_malla = time.perf_counter() - inicio
+
+    tiempos_superficie, superficie = _medir(lambda: snapshot_surface(snapshot, resolution=resolution), repeticiones)
+    tiempos_imagen, _ = _medir(superficie.image, repeticiones)
+    resultados = {
+        "resolucion": resolution,
+        "celdas": int(dentro.sum()),
+        "forma": list(forma),
+        "malla_s": round(tiempo_malla, 4),
+        "superficie": _resumen(tiempos_superficie),
+        "imagen": _resumen(tiempos_imagen)
+    }
+    print(f"Superficie {resolution}° ({resultados['celdas']} celdas): malla {tiempo_malla:.3f} s, "
+          f"interpolación {statistics.median(tiempos_superficie):.3f} s, imagen {statistics.median(tiempos_imagen):.3f} s")
+    return resultados
+
+
+def bench_app(repeticiones, timeout):
+    """Tiempo de la primera carga y de cada rerun de la app, con el desglose por pestaña.
+
+    Solo se construye la pestaña visible, así que cada repetición recorre todas las pestañas.
+    La primera visita a una pestaña construye sus figuras; las siguientes usan la caché.
+    """
+
+    from streamlit.testing.v1 import AppTest
+
+    ruta_app = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    at = AppTest.from_file(ruta_app, default_timeout=timeout)
+    at.secrets["OPENWEATHER_API_KEY"] = API_KEY
+
+    inicio = time.perf_counter()
+    at.run()
+    primera_carga = time.perf_counter() - inicio
+    if at.exception:
+        raise RuntimeError(f"La app falló: {at.exception[0].value}")
+
+    tiempos_rerun = []
+    primera_visita = {}
+    secciones = {seccion: [] for seccion in ["Mapa"] + APP_TABS}
+    for repeticion in range(repeticiones + 1):
+        for pestaña in APP_TABS:
+            inicio = time.perf_counter()
+            at.radio(key="seccion").set_value(pestaña).run()
+            duracion = time.perf_counter() - inicio
+            tiempos_render = at.session_state["tiempos_render"]
+            if repeticion == 0:
+                primera_visita[pestaña] = round(tiempos_render.get(pestaña, duracion), 4)
+                continue
+            tiempos_rerun.append(duracion)
+            for seccion in ("Mapa", pestaña):
+                if seccion in tiempos_render:
+                    secciones[seccion].append(tiempos_render[seccion])
+
+    resultados = {
+        "primera_carga_s": round(primera_carga, 4),
+        "primera_visita_s": primera_visita,
+        "rerun": _resumen(tiempos_rerun),
+        "secciones": {seccion: _resumen(t) for seccion, t in secciones.items() if t}
+    }
+    print(f"App: primera carga {primera_carga:.2f} s, rerun {statistics.median(tiempos_rerun):.2f} s")
+    for seccion, resumen in resultados["secciones"].items():
+        visita = primera_visita.get(seccion)
+        detalle = f" (primera visita {visita:.3f} s)" if visita is not None else ""
+        print(f"  {seccion}: {resumen['mediana_s']:.3f} s{detalle}")
+    return resultados
+
+
+# Script de un proceso nuevo que carga la app una vez e imprime sus tiempos de arranque en JSON
+_STARTUP_SCRIPT = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+import metrics
+at = AppTest.from_file(sys.argv[1], default_timeout=float(sys.argv[3]))
+at.secrets["OPENWEATHER_API_KEY"] = sys.argv[2]
+inicio = time.perf_counter()
+at.run()
+tiempos = {r["etiquetas"]["etapa"]: r["sum"] for r in metrics.collect() if r["etiquetas"].get("etapa", "").startswith("arranque:")}
+print(json.dumps({"primera_ejecucion_s": time.perf_counter() - inicio, "error": bool(at.exception), **tiempos}))
+"""
+
+
+def bench_startup(timeout):
+    """Arranque de un proceso nuevo de la app: importaciones y tiempo hasta la primera página,
+    sin snapshot guardado (en frío) y con el snapshot que dejó la ejecución anterior"""
+
+    ruta_app = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    directorio = tempfile.mkdtemp(prefix="arranque-", dir=_TMP)
+    resultados = {}
+    for caso in ("sin_snapshot", "con_snapshot"):
+        # Caché vacía en cada caso, como una réplica nueva
+        entorno = dict(
+            os.environ,
+            RAIN_METRICS="1",
+            RAIN_CACHE_PATH=os.path.join(directorio, f"cache-{caso}.sqlite3"),
+            RAIN_HISTORY_PATH=os.path.join(directorio, "historial"),
+            RAIN_SNAPSHOT_PATH=os.path.join(directorio, "snapshot"),
+            OPENWEATHER_BASE_URL=pipeline.OPENWEATHER_BASE_URL
+        )
+        salida = subprocess.run(
+            [sys.executable, "-c", _STARTUP_SCRIPT, ruta_app, API_KEY, str(timeout)],
+            capture_output=True, text=True, check=True, env=entorno, cwd=os.path.dirname(ruta_app)
+        ).stdout
+        tiempos = json.loads(salida.strip().splitlines()[-1])
+        if tiempos.pop("error"):
+            raise RuntimeError(f"La app falló al arrancar ({caso})")
+        resultados[caso] = {clave.replace("arranque:", ""): round(valor, 4) for clave, valor in tiempos.items()}
+        print(f"Arranque {caso.replace('_', ' ')}: importaciones {resultados[caso]['importaciones']:.2f} s, "
+              f"primera página {resultados[caso]['primera_pagina']:.2f} s")
+        # El caso siguiente arranca con el snapshot que guardó la primera actualización
+        if not os.path.exists(os.path.join(entorno["RAIN_SNAPSHOT_PATH"], "snapshot_meta.json")):
+            raise RuntimeError("La app no guardó el snapshot")
+    return resultados
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _medianas(resultados, prefijo=""):
+    """Aplana los resultados a {ruta: mediana} para compararlos"""
+
+    planos = {}
+    for clave, valor in resultados.items():
+        if not isinstance(valor, dict):
+            continue
+        ruta = f"{prefijo}{clave}"
+        if "mediana_s" in valor:
+            planos[ruta] = valor["mediana_s"]
+        else:
+            planos.update(_medianas(valor, ruta + "."))
+    return planos
+
+
+def compare(actual, anterior):
+    """Imprime la diferencia de las medianas respecto a una ejecución anterior"""
+
+    medianas_actual = _medianas(actual["resultados"])
+    medianas_anterior = _medianas(anterior["resultados"])
+    print(f"\nComparación con {anterior.get('commit')} ({anterior.get('fecha')}):")
+    for ruta, valor in medianas_actual.items():
+        previo = medianas_anterior.get(ruta)
+        if not previo:
+            continue
+        cambio = 100 * (valor - previo) / previo
+        print(f"  {ruta}: {previo:.4f} s -> {valor:.4f} s ({cambio:+.1f}%)")
+
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos"""
+
+    parser = argparse.ArgumentParser(description="Pruebas de rendimiento del análisis de lluvia")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Números de ubicaciones para la actualización completa")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones de cada medición")
+    parser.add_argument("--analysis-size", type=int, default=1000, help="Pronósticos para medir el análisis")
+    parser.add_argument("--risk-size", type=int, default=50000, help="Ubicaciones para medir el índice de riesgo")
+    parser.add_argument("--rolling-size", type=int, default=5000, help="Ubicaciones para medir las estadísticas móviles")
+    parser.add_argument("--rolling-hours", type=int, default=7 * 24, help="Actualizaciones horarias agregadas")
+    parser.add_argument("--fixtures", help="Directorio con respuestas grabadas para el servidor simulado")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latencia simulada por respuesta (segundos)")
+    parser.add_argument("--surface-resolution", type=float, default=DEFAULT_RESOLUTION,
+                        help="Resolución (grados) de la superficie interpolada")
+    parser.add_argument("--skip-app", action="store_true", help="No medir el render de la app")
+    parser.add_argument("--app-timeout", type=float, default=120, help="Tiempo máximo por ejecución de la app")
+    parser.add_argument("--output", help="Archivo JSON de resultados (por defecto en benchmarks/)")
+    parser.add_argument("--compare", help="Resultados anteriores para comparar")
+    args = parser.parse_args(argv)
+
+    servidor, base_url = start_server(config=MockConfig(latency=args.latency, fixtures=args.fixtures, seed=0))
+    pipeline.OPENWEATHER_BASE_URL = base_url
+
+    resultados = {
+        "actualizacion": bench_refresh(args.sizes, args.repeat),
+        "analisis": bench_analysis(args.analysis_size, args.repeat),
+        "riesgo": bench_risk(args.risk_size, args.repeat),
+        "estadisticas_moviles": bench_rolling(args.rolling_size, args.rolling_hours, args.repeat),
+        "mapa": bench_map(sorted(set([len(pipeline.estados_mexico)] + args.sizes)), args.repeat),
+        "superficie": bench_surface(args.surface_resolution, args.repeat)
+    }
+    if not args.skip_app:
+        resultados["app"] = bench_app(args.repeat, args.app_timeout)
+        resultados["arranque"] = bench_startup(args.app_timeout)
+    servidor.shutdown()
+
+    ahora = datetime.now()
+    salida = {
+        "fecha": ahora.isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parametros": vars(args),
+        "resultados": resultados
+    }
+
+    ruta = args.output or os.path.join(DEFAULT_RESULTS_DIR, f"benchmark-{ahora:%Y%m%d-%H%M%S}.json")
+    directorio = os.path.dirname(ruta)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(salida, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados en {ruta}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(salida, json.load(f))
+
+    # Una medición en caliente que llamó a la API invalida la ejecución
+    if not all(r["caliente_valido"] for r in resultados["actualizacion"].values()):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
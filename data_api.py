@@ -0,0 +1,335 @@
+"""API HTTP de solo lectura con los datos del snapshot actual, en JSON o Arrow IPC.
+
+Sirve las filas de resultados por estado y el pronóstico diario del mismo snapshot que usa
+la app, así que una consulta nunca llama a OpenWeather ni provoca un rerun de Streamlit:
+
+    RAIN_API_PORT=8502 streamlit run app.py
+    curl http://127.0.0.1:8502/v1/estados?region=Norte
+    curl "http://127.0.0.1:8502/v1/diario?estado=Sonora&estado=Sinaloa&format=arrow" -o diario.arrow
+
+Rutas: /v1/estados (filas de resultados), /v1/diario (datos diarios por estado) y
+/v1/snapshot (versión, fecha y estados sin datos completos). Se filtra con `region` y con
+`estado` (repetido o separado por comas). El formato se elige con `format=json|arrow` o con
+el encabezado Accept. Cada respuesta lleva un ETag que depende del snapshot y de la consulta
+(If-None-Match responde 304 sin serializar nada) y se comprime con gzip si el cliente lo acepta.
+
+También se puede servir aparte el último snapshot que guardó la app en disco:
+
+    python data_api.py --snapshot-dir .cache/snapshot --port 8502
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+import sys
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import metrics
+from forecast_parser import orjson
+from snapshot import DEFAULT_SNAPSHOT_PATH, load_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Puerto opcional de la API (sin él la app no la inicia)
+API_PORT = os.environ.get("RAIN_API_PORT")
+
+# Tipos de contenido de cada formato
+CONTENT_TYPES = {
+    "json": "application/json",
+    "arrow": "application/vnd.apache.arrow.stream"
+}
+
+# Rutas disponibles
+ROUTES = ("/v1/estados", "/v1/diario", "/v1/snapshot")
+
+# Respuestas ya serializadas que se conservan (por snapshot y consulta)
+DEFAULT_CACHE_ENTRIES = 256
+
+# Tamaño mínimo (bytes) a partir del cual se comprime con gzip
+GZIP_MIN_BYTES = 1024
+
+
+def _valor_json(valor):
+    """Convierte un valor de una fila a un tipo de JSON (NaN a null, fechas a texto ISO)"""
+
+    if isinstance(valor, float) and math.isnan(valor):
+        return None
+    if hasattr(valor, "isoformat"):
+        return valor.isoformat()
+    if hasattr(valor, "item"):
+        return _valor_json(valor.item())
+    return valor
+
+
+def _fila_json(fila):
+    return {clave: _valor_json(valor) for clave, valor in fila.items()}
+
+
+def _dumps(datos):
+    if orjson is not None:
+        return orjson.dumps(datos)
+    return json.dumps(datos, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _arrow(df, snapshot):
+    """Serializa un DataFrame como un stream de Arrow IPC con la versión y fecha del snapshot"""
+
+    import pyarrow as pa
+
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    tabla = tabla.replace_schema_metadata({
+        **(tabla.schema.metadata or {}),
+        b"version": str(snapshot.version).encode(),
+        b"timestamp": snapshot.timestamp.isoformat().encode()
+    })
+    salida = pa.BufferOutputStream()
+    with pa.ipc.new_stream(salida, tabla.schema) as escritor:
+        escritor.write_table(tabla)
+    return salida.getvalue().to_pybytes()
+
+
+class ApiError(Exception):
+    """Error de la consulta con su código HTTP"""
+
+    def __init__(self, status, mensaje):
+        super().__init__(mensaje)
+        self.status = status
+
+
+class DataApi:
+    """Respuestas de la API a partir del snapshot que devuelve `get_snapshot`.
+
+    No depende del servidor HTTP: respond() recibe la ruta, la consulta y los encabezados y
+    devuelve (código, encabezados, cuerpo). Los cuerpos se memorizan por ETag, que incluye la
+    versión y la fecha del snapshot, así que un snapshot nuevo invalida las respuestas anteriores.
+    """
+
+    def __init__(self, get_snapshot, cache_entries=DEFAULT_CACHE_ENTRIES):
+        self.get_snapshot = get_snapshot
+        self.cache_entries = cache_entries
+        self._respuestas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _formato(self, params, accept):
+        formato = params.get("format", [None])[-1]
+        if formato is None:
+            formato = "arrow" if CONTENT_TYPES["arrow"] in (accept or "") else "json"
+        if formato not in CONTENT_TYPES:
+            raise ApiError(400, f"Formato no soportado: {formato}")
+        return formato
+
+    def _filtro(self, params):
+        """(región o None, conjunto de nombres o None) de la consulta"""
+
+        region = params.get("region", [None])[-1]
+        if region == "Todos los estados":
+            region = None
+        nombres = {nombre.strip() for valor in params.get("estado", []) for nombre in valor.split(",") if nombre.strip()}
+        return region, nombres or None
+
+    @staticmethod
+    def _validar(snapshot, region, nombres):
+        """Rechaza regiones y estados que no están en el snapshot (antes de filtrar: los filtros
+        por región se memorizan en el snapshot y no deben crecer con valores arbitrarios)"""
+
+        if region is not None and region not in snapshot.agregados.estadisticas:
+            raise ApiError(400, f"Región desconocida: {region}")
+        desconocidos = sorted(nombre for nombre in nombres or () if nombre not in snapshot.datos_diarios_por_estado)
+        if desconocidos:
+            raise ApiError(400, "Estados desconocidos: " + ", ".join(desconocidos[:10]))
+
+    def _etag(self, snapshot, ruta, formato, region, nombres):
+        clave = "|".join([
+            str(snapshot.version),
+            snapshot.timestamp.isoformat(),
+            ruta,
+            formato,
+            region or "",
+            ",".join(sorted(nombres or ()))
+        ])
+        return '"' + hashlib.sha1(clave.encode("utf-8")).hexdigest()[:20] + '"'
+
+    def _cuerpo(self, snapshot, ruta, formato, region, nombres):
+        """Serializa la respuesta de una ruta con los filtros aplicados"""
+
+        df_estados = snapshot.estados(region)
+        if nombres is not None:
+            df_estados = df_estados[df_estados["nombre"].isin(nombres)]
+        incluidos = set(df_estados["nombre"])
+
+        if ruta == "/v1/snapshot":
+            if formato != "json":
+                raise ApiError(400, "/v1/snapshot solo está disponible en JSON")
+            return _dumps({
+                "version": snapshot.version,
+                "timestamp": snapshot.timestamp.isoformat(),
+                "estados": len(df_estados),
+                "errores": [nombre for nombre in snapshot.errores if nombre in incluidos]
+            })
+
+        if ruta == "/v1/estados":
+            if formato == "arrow":
+                return _arrow(df_estados, snapshot)
+            return _dumps({
+                "version": snapshot.version,
+                "timestamp": snapshot.timestamp.isoformat(),
+                "estados": [_fila_json(fila) for fila in snapshot.results if fila["nombre"] in incluidos]
+            })
+
+        if formato == "arrow":
+            df_diario = snapshot.df_diario
+            return _arrow(df_diario[df_diario["nombre"].isin(incluidos)], snapshot)
+        return _dumps({
+            "version": snapshot.version,
+            "timestamp": snapshot.timestamp.isoformat(),
+            "diario": {
+                nombre: [_fila_json(dia) for dia in dias]
+                for nombre, dias in snapshot.datos_diarios_por_estado.items() if nombre in incluidos
+            }
+        })
+
+    def _guardar(self, etag, cuerpo):
+        comprimido = gzip.compress(cuerpo, compresslevel=6) if len(cuerpo) >= GZIP_MIN_BYTES else None
+        with self._lock:
+            self._respuestas[etag] = (cuerpo, comprimido)
+            while len(self._respuestas) > self.cache_entries:
+                self._respuestas.popitem(last=False)
+        return cuerpo, comprimido
+
+    def respond(self, ruta, consulta="", encabezados=None):
+        """Devuelve (código, encabezados, cuerpo) de una consulta GET"""
+
+        encabezados = encabezados or {}
+        try:
+            if ruta not in ROUTES:
+                raise ApiError(404, f"Ruta desconocida: {ruta}")
+            params = parse_qs(consulta)
+            formato = self._formato(params, encabezados.get("Accept"))
+            region, nombres = self._filtro(params)
+
+            snapshot = self.get_snapshot()
+            if snapshot is None:
+                metrics.increment("api_requests_total", ruta=ruta, resultado="sin_datos")
+                return 503, {"Retry-After": "5", "Content-Type": "text/plain; charset=utf-8"}, \
+                    "Todavía no hay datos disponibles".encode("utf-8")
+            self._validar(snapshot, region, nombres)
+
+            # La versión comprimida es otra representación y lleva su propio ETag
+            etag = self._etag(snapshot, ruta, formato, region, nombres)
+            etag_gzip = etag[:-1] + '-gzip"'
+            respuesta = {"Cache-Control": "no-cache", "Vary": "Accept, Accept-Encoding"}
+            conocidos = {valor.strip() for valor in encabezados.get("If-None-Match", "").split(",")}
+            for etiqueta in (etag, etag_gzip):
+                if etiqueta in conocidos:
+                    metrics.increment("api_requests_total", ruta=ruta, resultado="no_modificado")
+                    return 304, dict(respuesta, ETag=etiqueta), b""
+
+            with self._lock:
+                guardada = self._respuestas.get(etag)
+                if guardada is not None:
+                    self._respuestas.move_to_end(etag)
+            if guardada is None:
+                with metrics.timer("api_seconds", ruta=ruta, formato=formato):
+                    guardada = self._guardar(etag, self._cuerpo(snapshot, ruta, formato, region, nombres))
+        except ApiError as e:
+            metrics.increment("api_requests_total", ruta=ruta if ruta in ROUTES else "desconocida", resultado="error")
+            return e.status, {"Content-Type": "text/plain; charset=utf-8"}, str(e).encode("utf-8")
+
+        cuerpo, comprimido = guardada
+        respuesta["Content-Type"] = CONTENT_TYPES[formato]
+        respuesta["ETag"] = etag
+        if comprimido is not None and "gzip" in encabezados.get("Accept-Encoding", ""):
+            respuesta["Content-Encoding"] = "gzip"
+            respuesta["ETag"] = etag_gzip
+            cuerpo = comprimido
+        metrics.increment("api_requests_total", ruta=ruta, resultado="ok")
+        return 200, respuesta, cuerpo
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        status, encabezados, cuerpo = self.server.api.respond(url.path, url.query, self.headers)
+        self.send_response(status)
+        for nombre, valor in encabezados.items():
+            self.send_header(nombre, valor)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+
+def start_http_server(port, get_snapshot, host="127.0.0.1"):
+    """Sirve la API en un hilo de fondo y devuelve el servidor"""
+
+    servidor = ThreadingHTTPServer((host, int(port)), _Handler)
+    servidor.daemon_threads = True
+    servidor.api = DataApi(get_snapshot)
+    threading.Thread(target=servidor.serve_forever, name="data-api", daemon=True).start()
+    return servidor
+
+
+class SavedSnapshot:
+    """Último snapshot guardado en un directorio; se vuelve a leer cuando cambian sus archivos"""
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self._firma = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def _firma_actual(self):
+        firmas = []
+        for nombre in ("snapshot_meta.json", "snapshot.json"):
+            ruta = os.path.join(self.directorio, nombre)
+            if os.path.exists(ruta):
+                firmas.append((nombre, os.stat(ruta).st_mtime_ns))
+        return tuple(firmas)
+
+    def __call__(self):
+        with self._lock:
+            firma = self._firma_actual()
+            if firma != self._firma:
+                try:
+                    snapshot = load_snapshot(self.directorio)
+                except Exception:
+                    # Puede estar a medio escribir: se conserva el anterior y se reintenta en la siguiente consulta
+                    logger.exception("No se pudo leer el snapshot guardado")
+                    return self._snapshot
+                if snapshot is not None:
+                    snapshot.version = (self._snapshot.version + 1) if self._snapshot is not None else 1
+                self._snapshot = snapshot
+                self._firma = firma
+            return self._snapshot
+
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos"""
+
+    parser = argparse.ArgumentParser(description="API de datos sobre el último snapshot guardado en disco")
+    parser.add_argument("--snapshot-dir", default=DEFAULT_SNAPSHOT_PATH, help="Directorio del snapshot guardado")
+    parser.add_argument("--port", type=int, default=int(API_PORT or 8502), help="Puerto de la API")
+    parser.add_argument("--host", default="127.0.0.1", help="Dirección en la que escucha la API")
+    args = parser.parse_args(argv)
+
+    servidor = start_http_server(args.port, SavedSnapshot(args.snapshot_dir), host=args.host)
+    print(f"API de datos en http://{args.host}:{servidor.server_address[1]}/v1/estados")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""Índice de riesgo de sequía y alertas tempranas por cambio de nivel.
+
+El índice (0 a 100) se calcula para todas las ubicaciones a la vez con NumPy y combina la
+probabilidad de lluvia pronosticada, los días con lluvia prevista, la humedad, la temperatura
+y, cuando hay historial, los días secos consecutivos. Los niveles usan histéresis para que un
+índice que oscila cerca de un umbral no cambie de nivel en cada actualización, y AlertEngine
+solo genera una alerta cuando una ubicación cambia de nivel (sin repetirla).
+"""
+
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# Niveles de riesgo, de menor a mayor
+RISK_LEVELS = ["Bajo", "Moderado", "Alto", "Extremo"]
+
+# Índice a partir del cual empieza cada nivel (a partir del segundo)
+LEVEL_THRESHOLDS = np.array([25.0, 50.0, 70.0])
+
+# Margen (puntos del índice) que hay que superar para cambiar de nivel
+DEFAULT_HYSTERESIS = 5.0
+
+# Nivel a partir del cual un cambio genera alerta (al entrar o al salir de él)
+ALERT_LEVEL = 2
+
+# Tiempo durante el cual no se repite la misma alerta de una ubicación (segundos)
+DEFAULT_DEDUPE_SECONDS = 6 * 3600
+
+# Peso de cada componente del índice (se reparten entre los disponibles)
+WEIGHTS = {
+    "sin_lluvia": 0.35,
+    "dias_sin_lluvia": 0.2,
+    "sequedad": 0.15,
+    "calor": 0.1,
+    "racha_seca": 0.2
+}
+
+# Días del pronóstico y temperaturas (°C) que corresponden a 0 y 1 en el componente de calor
+FORECAST_DAYS = 5
+TEMP_RANGE = (15.0, 40.0)
+
+# Días secos consecutivos con los que el componente de racha seca llega a 1
+MAX_DRY_SPELL = 30
+
+# Columnas de df_estados que usa el índice y columnas de la tabla de alertas
+RISK_INPUT_COLUMNS = ["nombre", "region", "probabilidad_lluvia", "dias_con_lluvia", "humedad_actual", "temp_actual"]
+ALERT_COLUMNS = ["nombre", "region", "nivel_anterior", "nivel", "indice_riesgo", "sube", "timestamp"]
+
+
+def _array(valores, n):
+    if valores is None:
+        return np.full(n, np.nan)
+    return pd.to_numeric(pd.Series(valores), errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def risk_components(probabilidad, dias_con_lluvia, humedad, temperatura, dias_secos=None):
+    """Componentes del índice normalizados entre 0 (sin riesgo) y 1 (NaN si falta el dato)"""
+
+    probabilidad = _array(probabilidad, 0)
+    n = len(probabilidad)
+    temp_min, temp_max = TEMP_RANGE
+    return {
+        "sin_lluvia": 1 - np.clip(probabilidad / 100, 0, 1),
+        "dias_sin_lluvia": 1 - np.clip(_array(dias_con_lluvia, n) / FORECAST_DAYS, 0, 1),
+        "sequedad": 1 - np.clip(_array(humedad, n) / 100, 0, 1),
+        "calor": np.clip((_array(temperatura, n) - temp_min) / (temp_max - temp_min), 0, 1),
+        "racha_seca": np.clip(_array(dias_secos, n) / MAX_DRY_SPELL, 0, 1)
+    }
+
+
+def risk_index(probabilidad, dias_con_lluvia, humedad, temperatura, dias_secos=None):
+    """Índice de riesgo (0-100) de cada ubicación; NaN si no hay ningún dato"""
+
+    componentes = risk_components(probabilidad, dias_con_lluvia, humedad, temperatura, dias_secos)
+    suma = np.zeros(len(componentes["sin_lluvia"]))
+    pesos = np.zeros_like(suma)
+    for nombre, valores in componentes.items():
+        presentes = ~np.isnan(valores)
+        suma += np.where(presentes, valores, 0) * WEIGHTS[nombre]
+        pesos += presentes * WEIGHTS[nombre]
+    with np.errstate(invalid="ignore"):
+        return np.round(100 * suma / pesos, 1)
+
+
+def risk_levels(indice, anteriores=None, histeresis=DEFAULT_HYSTERESIS):
+    """Nivel de cada índice (posición en RISK_LEVELS; -1 si el índice es NaN).
+
+    Con `anteriores` (nivel previo de cada ubicación, -1 si no hay) se aplica la histéresis:
+    para subir hay que superar el umbral por `histeresis` puntos y para bajar, quedar por
+    debajo por el mismo margen.
+    """
+
+    indice = np.asarray(indice, dtype=np.float64)
+    vacios = np.isnan(indice)
+    valores = np.where(vacios, -np.inf, indice)
+    niveles = np.searchsorted(LEVEL_THRESHOLDS, valores, side="right").astype(np.int8)
+
+    if anteriores is not None:
+        anteriores = np.asarray(anteriores, dtype=np.int8)
+        # Niveles con los umbrales desplazados hacia arriba (subir) y hacia abajo (bajar)
+        subida = np.searchsorted(LEVEL_THRESHOLDS + histeresis, valores, side="right").astype(np.int8)
+        bajada = np.searchsorted(LEVEL_THRESHOLDS - histeresis, valores, side="right").astype(np.int8)
+        niveles = np.where(anteriores >= 0, np.clip(anteriores, subida, bajada), niveles)
+
+    return np.where(vacios, -1, niveles).astype(np.int8)
+
+
+def risk_table(df_estados, dias_secos=None, anteriores=None, histeresis=DEFAULT_HYSTERESIS):
+    """Tabla con el índice y el nivel de riesgo de cada estado de df_estados"""
+
+    racha = df_estados["nombre"].map(dias_secos) if dias_secos is not None else None
+    indice = risk_index(
+        df_estados["probabilidad_lluvia"],
+        df_estados["dias_con_lluvia"],
+        df_estados["humedad_actual"],
+        df_estados["temp_actual"],
+        racha
+    )
+    niveles = risk_levels(indice, anteriores, histeresis)
+    etiquetas = np.array(RISK_LEVELS + [None], dtype=object)
+    return pd.DataFrame({
+        "nombre": df_estados["nombre"].to_numpy(),
+        "region": df_estados["region"].to_numpy(),
+        "indice_riesgo": indice,
+        "nivel_riesgo": niveles,
+        "riesgo": etiquetas[niveles]
+    })
+
+
+class AlertEngine:
+    """Niveles de riesgo por ubicación entre actualizaciones y alertas por cambio de nivel.
+
+    Una alerta se genera cuando el nivel de una ubicación cambia y el nivel nuevo o el
+    anterior es ALERT_LEVEL o mayor. Si la ubicación ya tuvo una alerta hacia el mismo nivel
+    en los últimos `dedupe_seconds` no se repite. Una ubicación sin índice conserva su nivel y
+    una que no se conocía toma su primer nivel sin alerta. El estado se guarda en arrays
+    alineados con un índice de nombres; state() y restore() permiten conservarlo entre procesos.
+    """
+
+    def __init__(self, histeresis=DEFAULT_HYSTERESIS, dedupe_seconds=DEFAULT_DEDUPE_SECONDS):
+        self.histeresis = histeresis
+        self.dedupe_seconds = dedupe_seconds
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._nombres = pd.Index([], dtype=object)
+        # Nivel actual de cada ubicación (-1 si nunca tuvo índice)
+        self._niveles = np.empty(0, dtype=np.int8)
+        # Momento de la última alerta de cada ubicación hacia cada nivel
+        self._ultimas_alertas = np.empty((0, len(RISK_LEVELS)))
+
+    def _posiciones(self, nombres):
+        """Posición de cada nombre en el estado, agregando los que no se conocían"""
+
+        posiciones = self._nombres.get_indexer(nombres)
+        faltan = posiciones < 0
+        if faltan.any():
+            nuevos = pd.Index(nombres[faltan]).unique()
+            self._nombres = self._nombres.append(nuevos)
+            self._niveles = np.concatenate([self._niveles, np.full(len(nuevos), -1, dtype=np.int8)])
+            self._ultimas_alertas = np.vstack([self._ultimas_alertas, np.full((len(nuevos), len(RISK_LEVELS)), -np.inf)])
+            posiciones[faltan] = self._nombres.get_indexer(nombres[faltan])
+        return posiciones
+
+    def restore(self, nombres, niveles, ultimas_alertas):
+        """Carga el nivel y el momento de las últimas alertas de cada ubicación (como los da state())"""
+
+        nombres = np.asarray(nombres, dtype=object)
+        if not len(nombres):
+            return
+        with self._lock:
+            posiciones = self._posiciones(nombres)
+            self._niveles[posiciones] = niveles
+            self._ultimas_alertas[posiciones] = ultimas_alertas
+
+    def state(self, nombres=None):
+        """(nombres, niveles, últimas alertas) de las ubicaciones indicadas (todas por defecto)"""
+
+        with self._lock:
+            if nombres is None:
+                nombres = self._nombres.to_numpy()
+            posiciones = self._nombres.get_indexer(nombres)
+            posiciones = posiciones[posiciones >= 0]
+            return (
+                self._nombres.to_numpy()[posiciones],
+                self._niveles[posiciones].copy(),
+                self._ultimas_alertas[posiciones].copy()
+            )
+
+    def evaluate(self, df_estados, dias_secos=None, timestamp=None):
+        """Calcula el riesgo de df_estados y devuelve (tabla de riesgo, alertas nuevas)"""
+
+        ts = timestamp.timestamp() if timestamp is not None else time.time()
+        if df_estados.empty:
+            return risk_table(pd.DataFrame(columns=RISK_INPUT_COLUMNS)), pd.DataFrame(columns=ALERT_COLUMNS)
+        nombres = df_estados["nombre"].to_numpy()
+
+        with self._lock:
+            posiciones = self._posiciones(nombres)
+            anteriores = self._niveles[posiciones]
+            tabla = risk_table(df_estados, dias_secos, anteriores, self.histeresis)
+
+            # Sin índice se conserva el nivel anterior
+            niveles = tabla["nivel_riesgo"].to_numpy()
+            niveles = np.where(niveles < 0, anteriores, niveles)
+            tabla["nivel_riesgo"] = niveles
+            tabla["riesgo"] = np.array(RISK_LEVELS + [None], dtype=object)[niveles]
+
+            # Una ubicación que no se conocía toma su nivel sin alerta: no se sabe desde cuál cambió
+            cambio = (anteriores >= 0) & (niveles >= 0) & (niveles != anteriores) & (np.maximum(niveles, anteriores) >= ALERT_LEVEL)
+
+            # Quitar las alertas hacia un nivel que ya se avisó dentro de la ventana
+            ultima = self._ultimas_alertas[posiciones, np.maximum(niveles, 0)]
+            nuevas = cambio & (ts - ultima >= self.dedupe_seconds)
+
+            self._niveles[posiciones] = niveles
+            self._ultimas_alertas[posiciones[nuevas], niveles[nuevas]] = ts
+
+        return tabla, pd.DataFrame(columns=ALERT_COLUMNS, data={
+            "nombre": nombres[nuevas],
+            "region": tabla["region"].to_numpy()[nuevas],
+            "nivel_anterior": np.array(RISK_LEVELS, dtype=object)[anteriores[nuevas]],
+            "nivel": tabla["riesgo"].to_numpy()[nuevas],
+            "indice_riesgo": tabla["indice_riesgo"].to_numpy()[nuevas],
+            "sube": niveles[nuevas] > anteriores[nuevas],
+            "timestamp": pd.Timestamp.fromtimestamp(ts)
+        })
@@ -0,0 +1,360 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from aggregates import CORRELATION_COLUMNS
+from geometry import state_geojson, tolerance_for_view
+
+# Funciones que construyen las tablas y figuras de cada pestaña a partir de los DataFrames
+# del snapshot. No dependen de Streamlit: la app las memoriza por versión de datos.
+# Plotly se importa dentro de cada función de figuras para no cargarlo al importar el
+# módulo (las tablas no lo necesitan y acelera el arranque de la app).
+
+# Ancho aproximado (pixeles) del mapa de calor, para elegir el nivel de detalle de los polígonos
+CHOROPLETH_WIDTH = 700
+
+
+def format_dates(fechas, formato, vacio=""):
+    """Fechas como texto con `formato`; los nulos se muestran como `vacio`.
+
+    Las fechas del snapshot se repiten mucho (días y períodos de 3 horas): se formatea cada
+    valor distinto una sola vez y se reparte con sus códigos.
+    """
+
+    # Los nulos tienen código -1, que toma el texto `vacio` agregado al final
+    codigos, unicos = pd.factorize(fechas)
+    textos = np.append(unicos.strftime(formato).to_numpy(dtype=object), vacio)
+    return pd.Series(textos[codigos], index=fechas.index, name=fechas.name)
+
+# Tablas de la pestaña de condiciones actuales
+def current_tables(df_estados):
+    """Devuelve (5 más calurosos, 5 más frescos, tabla de todos los estados)"""
+
+    # Ordenar estados por temperatura (de mayor a menor)
+    df_temp = df_estados.sort_values(by="temp_actual", ascending=False)
+
+    df_tabla = (
+        df_estados[["nombre", "region", "temp_actual", "clima_actual", "humedad_actual", "viento_actual"]]
+        .rename(columns={
+            "nombre": "Estado",
+            "region": "Región",
+            "temp_actual": "Temperatura (°C)",
+            "clima_actual": "Clima",
+            "humedad_actual": "Humedad (%)",
+            "viento_actual": "Viento (m/s)"
+        })
+        .sort_values(by="Estado")
+    )
+    return df_temp.head(5), df_temp.tail(5), df_tabla
+
+# Tabla de la pestaña de pronóstico
+def forecast_table(df_estados, dias_secos=None, riesgo=None):
+    """Tabla de pronóstico por estado ordenada por probabilidad de lluvia"""
+
+    # Solo las columnas que se muestran, más una columna formateada para la próxima lluvia
+    columnas_pronostico = ["nombre", "region", "probabilidad_lluvia", "dias_con_lluvia", "proxima_lluvia_fmt"]
+    df_pronostico = df_estados[columnas_pronostico[:-1]].assign(
+        proxima_lluvia_fmt=format_dates(df_estados["proxima_lluvia"], "%d/%m/%Y %H:%M", "No prevista")
+    )
+
+    # Días secos consecutivos observados (según el historial)
+    if dias_secos is not None:
+        df_pronostico["dias_secos"] = df_pronostico["nombre"].map(dias_secos)
+        columnas_pronostico.append("dias_secos")
+
+    # Nivel e índice de riesgo de sequía
+    if riesgo is not None:
+        por_nombre = riesgo.set_index("nombre")
+        df_pronostico["riesgo"] = df_pronostico["nombre"].map(por_nombre["riesgo"])
+        df_pronostico["indice_riesgo"] = df_pronostico["nombre"].map(por_nombre["indice_riesgo"])
+        columnas_pronostico += ["riesgo", "indice_riesgo"]
+
+    return (
+        df_pronostico[columnas_pronostico]
+        .rename(columns={
+            "nombre": "Estado",
+            "region": "Región",
+            "probabilidad_lluvia": "Prob. lluvia (%)",
+            "dias_con_lluvia": "Días con lluvia",
+            "proxima_lluvia_fmt": "Próxima lluvia",
+            "dias_secos": "Días secos consecutivos",
+            "riesgo": "Riesgo de sequía",
+            "indice_riesgo": "Índice de riesgo"
+        })
+        .sort_values(by="Prob. lluvia (%)", ascending=False)
+    )
+
+# Tabla de alertas tempranas de sequía
+def alert_table(alertas):
+    """Alertas de cambio de nivel de riesgo, de mayor a menor índice"""
+
+    df_alertas = alertas.assign(cambio=alertas["sube"].map({True: "Sube", False: "Baja"}))
+    return (
+        df_alertas[["nombre", "region", "nivel_anterior", "nivel", "cambio", "indice_riesgo"]]
+        .rename(columns={
+            "nombre": "Estado",
+            "region": "Región",
+            "nivel_anterior": "Riesgo anterior",
+            "nivel": "Riesgo",
+            "cambio": "Cambio",
+            "indice_riesgo": "Índice de riesgo"
+        })
+        .sort_values(by="Índice de riesgo", ascending=False)
+    )
+
+# Mapa de calor de probabilidad de lluvia
+def rain_choropleth(df_estados, ancho_px=CHOROPLETH_WIDTH):
+    """Figura de probabilidad de lluvia por estado sobre sus polígonos simplificados"""
+
+    import plotly.express as px
+
+    # Nivel de detalle según la extensión de los estados visibles (con 1° de margen) y el ancho
+    tolerancia = tolerance_for_view(df_estados["lon"].min() - 1, df_estados["lon"].max() + 1, ancho_px)
+
+    # Solo los polígonos de los estados que se muestran
+    nombres = set(df_estados["nombre"])
+    geojson = {
+        "type": "FeatureCollection",
+        "features": [f for f in state_geojson(tolerancia)["features"] if f["id"] in nombres]
+    }
+
+    # Crear gráfico de mapa de calor para probabilidad de lluvia
+    fig = px.choropleth(
+        df_estados,
+        geojson=geojson,
+        locations="nombre",
+        color="probabilidad_lluvia",
+        hover_name="nombre",
+        color_continuous_scale="Blues",
+        labels={"probabilidad_lluvia": "Probabilidad de lluvia (%)"},
+        title="Mapa de calor de probabilidad de lluvia por estado"
+    )
+
+    # Ajustar la vista a los estados mostrados
+    fig.update_geos(fitbounds="locations", visible=False)
+    return fig
+
+# Gráficos del pronóstico diario de un estado
+def daily_figures(df_diario, nombre):
+    """Devuelve (figura de temperatura, figura de precipitación) o None si no hay datos"""
+
+    import plotly.graph_objects as go
+
+    if df_diario.empty:
+        return None
+
+    # Formatear fecha (sin modificar el DataFrame compartido)
+    fecha_str = format_dates(df_diario["fecha"], "%d/%m/%Y")
+
+    # Crear gráfico de temperatura máxima y mínima
+    fig_temp = go.Figure()
+
+    fig_temp.add_trace(
+        go.Scatter(
+            x=fecha_str,
+            y=df_diario["max_temp"],
+            mode="lines+markers",
+            name="Temp. Máxima",
+            line=dict(color="red")
+        )
+    )
+
+    fig_temp.add_trace(
+        go.Scatter(
+            x=fecha_str,
+            y=df_diario["min_temp"],
+            mode="lines+markers",
+            name="Temp. Mínima",
+            line=dict(color="blue")
+        )
+    )
+
+    fig_temp.update_layout(
+        title=f"Pronóstico de temperatura para {nombre}",
+        xaxis_title="Fecha",
+        yaxis_title="Temperatura (°C)",
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+
+    # Crear gráfico de precipitación
+    fig_precip = go.Figure()
+
+    fig_precip.add_trace(
+        go.Bar(
+            x=fecha_str,
+            y=df_diario["precipitacion"],
+            name="Precipitación",
+            marker_color="skyblue"
+        )
+    )
+
+    fig_precip.update_layout(
+        title=f"Pronóstico de precipitación para {nombre}",
+        xaxis_title="Fecha",
+        yaxis_title="Precipitación (mm)",
+        showlegend=False
+    )
+
+    return fig_temp, fig_precip
+
+# Tabla y gráficos de la pestaña de análisis regional
+def regional_figures(df_estados, agregados=None):
+    """Devuelve (tabla regional, barras de probabilidad, barras de días con lluvia).
+
+    Con `agregados` (RegionAggregates del snapshot) la tabla sale de sus sumas por región.
+    """
+
+    import plotly.express as px
+
+    if agregados is not None:
+        df_regional = agregados.regional_table(set(df_estados["region"]))
+    else:
+        # Agrupar por región
+        df_regional = df_estados.groupby("region").agg({
+            "probabilidad_lluvia": "mean",
+            "dias_con_lluvia": "mean",
+            "nombre": "count"
+        }).reset_index()
+
+        df_regional = df_regional.rename(columns={
+            "probabilidad_lluvia": "Prob. lluvia promedio (%)",
+            "dias_con_lluvia": "Días con lluvia promedio",
+            "nombre": "Número de estados"
+        })
+
+    # Crear gráfico de barras para probabilidad de lluvia por región
+    fig_region = px.bar(
+        df_regional,
+        x="region",
+        y="Prob. lluvia promedio (%)",
+        text="Prob. lluvia promedio (%)",
+        color="region",
+        labels={"region": "Región"},
+        title="Probabilidad de lluvia promedio por región"
+    )
+
+    fig_region.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
+
+    # Gráfico de días con lluvia por región
+    fig_dias = px.bar(
+        df_regional,
+        x="region",
+        y="Días con lluvia promedio",
+        text="Días con lluvia promedio",
+        color="region",
+        labels={"region": "Región"},
+        title="Días con lluvia promedio por región"
+    )
+
+    fig_dias.update_traces(texttemplate='%{text:.1f}', textposition='outside')
+
+    return df_regional, fig_region, fig_dias
+
+# Nombres de las columnas de las estadísticas descriptivas
+STATS_COLUMNS = {
+    "index": "Estadística",
+    "temp_actual": "Temperatura (°C)",
+    "humedad_actual": "Humedad (%)",
+    "probabilidad_lluvia": "Prob. lluvia (%)"
+}
+
+# Gráficos y estadísticas de la pestaña de tendencias
+def trend_figures(df_estados, agregados=None, tendencias=None, ventana=None):
+    """Devuelve (dispersión, matriz de correlación, histograma, estadísticas descriptivas).
+
+    Con `agregados` (RegionAggregates del snapshot) la correlación sale de sus sumas por región.
+    Con `tendencias` (RollingView) y una `ventana` de ROLLING_WINDOWS, la correlación, el
+    histograma y las estadísticas son de todas las actualizaciones de esa ventana.
+    """
+
+    import plotly.express as px
+
+    # Crear gráfico de dispersión entre temperatura y humedad
+    fig_scatter = px.scatter(
+        df_estados,
+        x="temp_actual",
+        y="humedad_actual",
+        size="probabilidad_lluvia",
+        color="region",
+        hover_name="nombre",
+        labels={
+            "temp_actual": "Temperatura (°C)",
+            "humedad_actual": "Humedad (%)",
+            "probabilidad_lluvia": "Prob. de lluvia (%)",
+            "region": "Región"
+        },
+        title="Correlación entre temperatura, humedad y probabilidad de lluvia"
+    )
+
+    regiones = set(df_estados["region"])
+    movil = tendencias is not None and ventana is not None
+
+    # Calcular correlaciones
+    if movil:
+        df_corr = tendencias.correlation(ventana, regiones)
+    elif agregados is not None:
+        df_corr = agregados.correlation(regiones)
+    else:
+        df_corr = df_estados[CORRELATION_COLUMNS].corr()
+
+    # Visualizar matriz de correlación
+    fig_corr = px.imshow(
+        df_corr,
+        text_auto=True,
+        color_continuous_scale="RdBu_r",
+        title="Matriz de correlación entre variables climáticas"
+    )
+
+    # Análisis de distribución de probabilidad de lluvia
+    if movil:
+        # Conteos por intervalo ya agregados en la ventana
+        df_hist = tendencias.histogram(ventana, "probabilidad_lluvia", regiones)
+        df_hist = df_hist.assign(centro=(df_hist["desde"] + df_hist["hasta"]) / 2)
+        fig_hist = px.bar(
+            df_hist,
+            x="centro",
+            y="conteo",
+            color="region",
+            labels={"centro": "Probabilidad de lluvia (%)", "conteo": "Observaciones", "region": "Región"},
+            title=f"Distribución de probabilidad de lluvia por región ({ventana})"
+        )
+        fig_hist.update_layout(bargap=0)
+    else:
+        fig_hist = px.histogram(
+            df_estados,
+            x="probabilidad_lluvia",
+            nbins=20,
+            color="region",
+            labels={"probabilidad_lluvia": "Probabilidad de lluvia (%)"},
+            title="Distribución de probabilidad de lluvia por región"
+        )
+
+    # Calcular estadísticas descriptivas
+    if movil:
+        df_stats = tendencias.describe(ventana, regiones)
+    else:
+        df_stats = df_estados[["temp_actual", "humedad_actual", "probabilidad_lluvia"]].describe()
+    df_stats = df_stats.reset_index().rename(columns=STATS_COLUMNS)
+
+    return fig_scatter, fig_corr, fig_hist, df_stats
+
+# Gráfico de temperatura observada a partir del historial
+def history_figure(df_historial):
+    """Figura de temperatura en el tiempo (None si el historial tiene menos de dos instantes)"""
+
+    import plotly.express as px
+
+    if df_historial["ts"].nunique() < 2:
+        return None
+
+    df_historial = df_historial.assign(hora=df_historial["ts"].map(datetime.fromtimestamp))
+
+    return px.line(
+        df_historial,
+        x="hora",
+        y="temp",
+        color="nombre",
+        markers=True,
+        labels={"hora": "Hora", "temp": "Temperatura (°C)", "nombre": "Estado"},
+        title="Temperatura observada en las últimas 24 horas"
+    )
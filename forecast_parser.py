@@ -0,0 +1,113 @@
+"""Lectura ligera de los pronósticos de 5 días de OpenWeather.
+
+Del JSON de /forecast solo se usan, por período, el instante (dt), la temperatura
+(main.temp) y la lluvia en 3 horas (rain.3h). parse_forecast los pasa directamente a
+arrays tipados y ForecastArrays los guarda en un formato binario compacto, así que la
+caché no guarda el JSON completo y leer un pronóstico de ella no requiere decodificar JSON.
+
+orjson es opcional: si está instalado se usa para decodificar las respuestas; si no, se
+usa el módulo json.
+"""
+
+import json
+import struct
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Cabecera del formato binario: identificador y número de períodos
+_CABECERA = struct.Struct("<4sI")
+_FORMATO = b"FCA1"
+
+# Tipos de los arrays (little-endian para que el formato no dependa de la plataforma)
+_DT = np.dtype("<i8")
+_FLOAT = np.dtype("<f8")
+
+
+def loads(contenido):
+    """Decodifica JSON (bytes o str) con orjson si está disponible"""
+
+    if orjson is not None:
+        return orjson.loads(contenido)
+    return json.loads(contenido)
+
+
+class ForecastArrays:
+    """Pronóstico reducido a los campos que usa el análisis, un array por campo.
+
+    Los arrays son de solo lectura: el mismo objeto se comparte entre hilos y snapshots.
+    """
+
+    __slots__ = ("dt", "temp", "rain_3h")
+
+    def __init__(self, dt, temp, rain_3h):
+        self.dt = dt
+        self.temp = temp
+        self.rain_3h = rain_3h
+
+    def __len__(self):
+        return len(self.dt)
+
+    def to_bytes(self):
+        """Formato binario de la caché: cabecera y los tres arrays seguidos"""
+
+        return (
+            _CABECERA.pack(_FORMATO, len(self.dt))
+            + self.dt.astype(_DT, copy=False).tobytes()
+            + self.temp.astype(_FLOAT, copy=False).tobytes()
+            + self.rain_3h.astype(_FLOAT, copy=False).tobytes()
+        )
+
+    @classmethod
+    def from_bytes(cls, datos):
+        """Lee el formato de to_bytes sin copiar los datos"""
+
+        formato, n = _CABECERA.unpack_from(datos)
+        if formato != _FORMATO:
+            raise ValueError(f"Formato de pronóstico desconocido: {formato!r}")
+        inicio = _CABECERA.size
+        dt = np.frombuffer(datos, dtype=_DT, count=n, offset=inicio)
+        temp = np.frombuffer(datos, dtype=_FLOAT, count=n, offset=inicio + 8 * n)
+        rain_3h = np.frombuffer(datos, dtype=_FLOAT, count=n, offset=inicio + 16 * n)
+        return cls(dt, temp, rain_3h)
+
+    def periods(self):
+        """Lista de (dt, temperatura, lluvia en 3 horas) con tipos de Python"""
+
+        return list(zip(self.dt.tolist(), self.temp.tolist(), self.rain_3h.tolist()))
+
+
+def _arrays(periodos):
+    n = len(periodos)
+    dt = np.fromiter((p["dt"] for p in periodos), dtype=_DT, count=n)
+    temp = np.fromiter((p["main"]["temp"] for p in periodos), dtype=_FLOAT, count=n)
+    rain_3h = np.fromiter(((p.get("rain") or {}).get("3h", 0) for p in periodos), dtype=_FLOAT, count=n)
+    for array in (dt, temp, rain_3h):
+        array.flags.writeable = False
+    return ForecastArrays(dt, temp, rain_3h)
+
+
+def forecast_arrays(forecast_data):
+    """ForecastArrays de un pronóstico, ya sea compacto o el JSON completo decodificado.
+
+    Devuelve None si no hay pronóstico o si la respuesta no trae la lista de períodos.
+    """
+
+    if forecast_data is None or isinstance(forecast_data, ForecastArrays):
+        return forecast_data
+    if "list" not in forecast_data:
+        return None
+    return _arrays(forecast_data["list"])
+
+
+def parse_forecast(contenido):
+    """Convierte el cuerpo de una respuesta de /forecast en ForecastArrays"""
+
+    arrays = forecast_arrays(loads(contenido))
+    if arrays is None:
+        raise ValueError("La respuesta de pronóstico no incluye la lista de períodos")
+    return arrays
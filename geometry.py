@@ -0,0 +1,346 @@
+"""Geometrías de los estados precalculadas en varios niveles de simplificación.
+
+data/estados_mexico.topo.json es un TopoJSON cuantizado: los límites compartidos entre
+estados se guardan una sola vez como arcos (enteros con codificación delta) y se simplifican
+juntos, así que los estados vecinos siguen encajando en todos los niveles. Cada nivel es un
+objeto del TopoJSON con su tolerancia de Douglas-Peucker en grados; el nivel 0 conserva
+todos los vértices y es el que usa el índice espacial del muestreo.
+
+El archivo se carga una sola vez por proceso y el nivel se elige según el zoom o el tamaño
+de la vista para que el navegador reciba solo el detalle que puede dibujar. Para regenerarlo:
+
+    python geometry.py build --source estados.geojson --tolerances 0 0.01 0.03 0.08
+    python geometry.py info
+"""
+
+import argparse
+import json
+import os
+import sys
+from functools import lru_cache
+
+import numpy as np
+
+# TopoJSON con los 32 estados (propiedades "nombre" y "region" como en estados_mexico)
+TOPOLOGY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "estados_mexico.topo.json")
+
+# Tolerancias de simplificación (grados) de los niveles que se generan
+DEFAULT_TOLERANCES = (0.0, 0.01, 0.03, 0.08)
+
+# Tamaño de la unidad de cuantización (grados); 1e-4 conserva los 4 decimales de la fuente
+DEFAULT_QUANTIZATION = 1e-4
+
+# Prefijo de los objetos del TopoJSON, uno por nivel ("estados_0.02")
+OBJECT_PREFIX = "estados_"
+
+
+def _leer_geojson(path):
+    """Estados de un GeoJSON con el formato (nombre, region, partes) de load_state_polygons"""
+
+    with open(path, encoding="utf-8") as f:
+        coleccion = json.load(f)
+
+    estados = []
+    for feature in coleccion["features"]:
+        geometria = feature["geometry"]
+        poligonos = geometria["coordinates"] if geometria["type"] == "MultiPolygon" else [geometria["coordinates"]]
+        partes = [[np.asarray(anillo, dtype=np.float64) for anillo in poligono] for poligono in poligonos]
+        estados.append((feature["properties"]["nombre"], feature["properties"]["region"], partes))
+    return estados
+
+
+def simplify_indices(puntos, tolerancia):
+    """Índices de los vértices que conserva Douglas-Peucker (siempre incluye los extremos)"""
+
+    n = len(puntos)
+    if tolerancia <= 0 or n <= 2:
+        return np.arange(n)
+
+    conservar = np.zeros(n, dtype=bool)
+    conservar[[0, -1]] = True
+    pendientes = [(0, n - 1)]
+    while pendientes:
+        i, j = pendientes.pop()
+        if j <= i + 1:
+            continue
+        origen = puntos[i]
+        direccion = puntos[j] - origen
+        tramo = puntos[i + 1:j] - origen
+        largo = np.hypot(*direccion)
+        if largo == 0:
+            # Arco cerrado: distancia al punto inicial
+            distancias = np.hypot(tramo[:, 0], tramo[:, 1])
+        else:
+            distancias = np.abs(direccion[0] * tramo[:, 1] - direccion[1] * tramo[:, 0]) / largo
+        k = int(np.argmax(distancias))
+        if distancias[k] > tolerancia:
+            m = i + 1 + k
+            conservar[m] = True
+            pendientes.extend([(i, m), (m, j)])
+    return np.flatnonzero(conservar)
+
+
+def _anillos_abiertos(estados, origen, cuantizacion):
+    """Anillos en coordenadas enteras, sin el punto de cierre ni vértices repetidos seguidos"""
+
+    anillos = []
+    for _, _, partes in estados:
+        for poligono in partes:
+            for anillo in poligono:
+                enteros = np.rint((np.asarray(anillo) - origen) / cuantizacion).astype(np.int64)
+                enteros = enteros[np.any(enteros != np.roll(enteros, 1, axis=0), axis=1)]
+                anillos.append([tuple(punto) for punto in enteros.tolist()])
+    return anillos
+
+
+def _uniones(anillos):
+    """Vértices donde se separan los límites: aparecen con distintos vecinos en distintos anillos"""
+
+    vecinos = {}
+    for anillo in anillos:
+        n = len(anillo)
+        for i, punto in enumerate(anillo):
+            anterior, siguiente = anillo[i - 1], anillo[(i + 1) % n]
+            vecinos.setdefault(punto, set()).add((min(anterior, siguiente), max(anterior, siguiente)))
+    return {punto for punto, pares in vecinos.items() if len(pares) > 1}
+
+
+def _cortar(anillo, uniones):
+    """Divide un anillo en arcos que empiezan y terminan en uniones"""
+
+    cortes = [i for i, punto in enumerate(anillo) if punto in uniones]
+    if not cortes:
+        # Sin uniones (islas, enclaves): un arco cerrado que empieza en su menor vértice
+        inicio = anillo.index(min(anillo))
+        girado = anillo[inicio:] + anillo[:inicio]
+        return [girado + girado[:1]]
+
+    girado = anillo[cortes[0]:] + anillo[:cortes[0]]
+    cortes = [i - cortes[0] for i in cortes] + [len(anillo)]
+    girado = girado + girado[:1]
+    return [girado[a:b + 1] for a, b in zip(cortes[:-1], cortes[1:])]
+
+
+def build_topology(estados, tolerances=DEFAULT_TOLERANCES, quantization=DEFAULT_QUANTIZATION):
+    """TopoJSON cuantizado con un objeto por tolerancia y arcos compartidos entre estados y niveles"""
+
+    todos = np.concatenate([anillo for _, _, partes in estados for poligono in partes for anillo in poligono])
+    origen = np.round(todos.min(axis=0), 4)
+    anillos = _anillos_abiertos(estados, origen, quantization)
+    uniones = _uniones(anillos)
+
+    # Arcos del nivel completo: cada límite compartido se guarda una sola vez
+    arcos_base = {}
+    anillos_arcos = []
+    for anillo in anillos:
+        referencias = []
+        for arco in _cortar(anillo, uniones):
+            clave = tuple(arco)
+            if clave in arcos_base:
+                referencias.append(arcos_base[clave])
+            elif clave[::-1] in arcos_base:
+                referencias.append(~arcos_base[clave[::-1]])
+            else:
+                arcos_base[clave] = len(arcos_base)
+                referencias.append(arcos_base[clave])
+        anillos_arcos.append(referencias)
+    base = list(arcos_base)
+
+    arcos = []
+    indices = {}
+
+    def registrar(arco):
+        clave = tuple(map(tuple, arco))
+        if clave not in indices:
+            indices[clave] = len(arcos)
+            delta = np.diff(np.asarray(arco), axis=0, prepend=[[0, 0]])
+            arcos.append(delta.tolist())
+        return indices[clave]
+
+    objetos = {}
+    for tolerancia in tolerances:
+        # Simplificar cada arco una vez: los dos estados que lo comparten ven el mismo resultado
+        simplificados = []
+        for arco in base:
+            arco = np.asarray(arco)
+            conservar = simplify_indices(arco * quantization, tolerancia)
+            simplificados.append((registrar(arco[conservar]), len(conservar)))
+
+        geometrias = []
+        posicion = 0
+        for nombre, region, partes in estados:
+            poligonos = []
+            for poligono in partes:
+                anillos_nivel = []
+                for i in range(len(poligono)):
+                    referencias = anillos_arcos[posicion]
+                    posicion += 1
+                    vertices = sum(simplificados[r if r >= 0 else ~r][1] - 1 for r in referencias)
+                    # Descartar anillos que se reducen a menos de un triángulo (con el exterior, sus huecos)
+                    if vertices < 3:
+                        if i == 0:
+                            posicion += len(poligono) - 1
+                            break
+                        continue
+                    anillos_nivel.append([
+                        simplificados[r][0] if r >= 0 else ~simplificados[~r][0] for r in referencias
+                    ])
+                if anillos_nivel:
+                    poligonos.append(anillos_nivel)
+            geometrias.append({
+                "type": "MultiPolygon",
+                "id": nombre,
+                "properties": {"nombre": nombre, "region": region},
+                "arcs": poligonos
+            })
+        objetos[f"{OBJECT_PREFIX}{tolerancia:g}"] = {"type": "GeometryCollection", "geometries": geometrias}
+
+    return {
+        "type": "Topology",
+        "transform": {"scale": [quantization, quantization], "translate": origen.tolist()},
+        "objects": objetos,
+        "arcs": arcos
+    }
+
+
+def write_topology(topology, path=TOPOLOGY_PATH):
+    """Guarda el TopoJSON sin espacios"""
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(topology, f, ensure_ascii=False, separators=(",", ":"))
+
+
+@lru_cache(maxsize=None)
+def load_topology(path=TOPOLOGY_PATH):
+    """Lee el TopoJSON una vez por proceso y decodifica sus arcos a lon/lat"""
+
+    with open(path, encoding="utf-8") as f:
+        topology = json.load(f)
+
+    escala = np.asarray(topology["transform"]["scale"])
+    origen = np.asarray(topology["transform"]["translate"])
+    arcos = [np.cumsum(np.asarray(arco, dtype=np.int64), axis=0) * escala + origen for arco in topology["arcs"]]
+    return topology, arcos
+
+
+def available_tolerances(path=TOPOLOGY_PATH):
+    """Tolerancias de los niveles disponibles, de menor a mayor"""
+
+    topology, _ = load_topology(path)
+    return sorted(float(clave[len(OBJECT_PREFIX):]) for clave in topology["objects"])
+
+
+def tolerance_for_resolution(grados_por_pixel, path=TOPOLOGY_PATH):
+    """Nivel más simple cuya tolerancia no supera el tamaño de un pixel"""
+
+    tolerancias = available_tolerances(path)
+    return max([t for t in tolerancias if t <= grados_por_pixel], default=tolerancias[0])
+
+
+def tolerance_for_zoom(zoom, path=TOPOLOGY_PATH):
+    """Nivel para un zoom de mapa web (teselas de 256 pixeles)"""
+
+    return tolerance_for_resolution(360 / (256 * 2 ** zoom), path)
+
+
+def tolerance_for_view(lon_min, lon_max, ancho_px, path=TOPOLOGY_PATH):
+    """Nivel para una vista que muestra [lon_min, lon_max] en `ancho_px` pixeles"""
+
+    return tolerance_for_resolution((lon_max - lon_min) / max(ancho_px, 1), path)
+
+
+def _anillo(arcos, referencias):
+    """Une los arcos de un anillo (un índice negativo ~i recorre el arco i al revés)"""
+
+    tramos = []
+    for i, r in enumerate(referencias):
+        arco = arcos[r] if r >= 0 else arcos[~r][::-1]
+        tramos.append(arco if i == 0 else arco[1:])
+    return np.concatenate(tramos)
+
+
+@lru_cache(maxsize=None)
+def state_polygons(tolerancia=0.0, path=TOPOLOGY_PATH):
+    """Polígonos de los estados en un nivel: lista de (nombre, region, partes).
+
+    Cada parte es una lista de anillos cerrados (el exterior y sus huecos) como arrays
+    (n, 2) de lon/lat.
+    """
+
+    topology, arcos = load_topology(path)
+    objeto = topology["objects"][f"{OBJECT_PREFIX}{tolerancia:g}"]
+    estados = []
+    for geometria in objeto["geometries"]:
+        partes = [[_anillo(arcos, anillo) for anillo in poligono] for poligono in geometria["arcs"]]
+        estados.append((geometria["properties"]["nombre"], geometria["properties"]["region"], partes))
+    return estados
+
+
+def _horario(anillo):
+    """True si el anillo va en sentido horario (área con signo negativa)"""
+
+    x, y = anillo[:, 0], anillo[:, 1]
+    return np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]) < 0
+
+
+@lru_cache(maxsize=None)
+def state_geojson(tolerancia=0.0, path=TOPOLOGY_PATH):
+    """FeatureCollection de un nivel con id = nombre del estado.
+
+    Los anillos exteriores van en sentido horario y los huecos al revés, la orientación que
+    espera d3-geo (los mapas de plotly); Leaflet acepta cualquiera.
+    """
+
+    features = []
+    for nombre, region, partes in state_polygons(tolerancia, path):
+        coordenadas = []
+        for poligono in partes:
+            anillos = []
+            for i, anillo in enumerate(poligono):
+                if _horario(anillo) != (i == 0):
+                    anillo = anillo[::-1]
+                anillos.append(np.round(anillo, 4).tolist())
+            coordenadas.append(anillos)
+        features.append({
+            "type": "Feature",
+            "id": nombre,
+            "properties": {"nombre": nombre, "region": region},
+            "geometry": {"type": "MultiPolygon", "coordinates": coordenadas}
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos"""
+
+    parser = argparse.ArgumentParser(description="Geometrías simplificadas de los estados")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    build = subparsers.add_parser("build", help="Generar el TopoJSON a partir de un GeoJSON")
+    build.add_argument("--source", help="GeoJSON de origen (por defecto, el nivel completo del TopoJSON actual)")
+    build.add_argument("--tolerances", type=float, nargs="+", default=list(DEFAULT_TOLERANCES),
+                       help="Tolerancias de simplificación (grados)")
+    build.add_argument("--quantization", type=float, default=DEFAULT_QUANTIZATION,
+                       help="Tamaño de la unidad de cuantización (grados)")
+    build.add_argument("--out", default=TOPOLOGY_PATH, help="Archivo de salida")
+
+    subparsers.add_parser("info", help="Vértices y tamaño en GeoJSON de cada nivel")
+    args = parser.parse_args(argv)
+
+    if args.comando == "build":
+        estados = _leer_geojson(args.source) if args.source else state_polygons(0.0)
+        tolerancias = sorted(set([0.0] + args.tolerances))
+        write_topology(build_topology(estados, tolerancias, args.quantization), args.out)
+        print(f"TopoJSON guardado en {args.out} ({os.path.getsize(args.out) / 1024:.0f} KiB)")
+        return 0
+
+    for tolerancia in available_tolerances():
+        estados = state_polygons(tolerancia)
+        vertices = sum(len(anillo) for _, _, partes in estados for poligono in partes for anillo in poligono)
+        tamaño = len(json.dumps(state_geojson(tolerancia), separators=(",", ":")))
+        print(f"Tolerancia {tolerancia:g}°: {vertices} vértices, GeoJSON {tamaño / 1024:.0f} KiB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
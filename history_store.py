@@ -0,0 +1,324 @@
+import glob
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from forecast_parser import forecast_arrays
+
+# Directorio por defecto del historial
+DEFAULT_HISTORY_PATH = os.environ.get("RAIN_HISTORY_PATH", "historial")
+
+# Particiones con más antigüedad que esta (días) se compactan en un solo archivo
+DEFAULT_COMPACT_AFTER_DAYS = 2
+
+# Grupos de condición de OpenWeather que indican precipitación (tormenta, llovizna, lluvia)
+RAIN_CONDITION_GROUPS = (2, 3, 5)
+
+OBSERVACIONES_SCHEMA = pa.schema([
+    ("ts", pa.int64()),
+    ("nombre", pa.string()),
+    ("region", pa.string()),
+    ("lat", pa.float64()),
+    ("lon", pa.float64()),
+    ("temp", pa.float64()),
+    ("humedad", pa.float64()),
+    ("presion", pa.float64()),
+    ("viento", pa.float64()),
+    ("lluvia_1h", pa.float64()),
+    ("condicion_id", pa.int64())
+])
+
+PRONOSTICOS_SCHEMA = pa.schema([
+    ("emitido", pa.int64()),
+    ("nombre", pa.string()),
+    ("region", pa.string()),
+    ("dt", pa.int64()),
+    ("temp", pa.float64()),
+    ("lluvia_3h", pa.float64())
+])
+
+_SCHEMAS = {"observaciones": OBSERVACIONES_SCHEMA, "pronosticos": PRONOSTICOS_SCHEMA}
+
+# Columna de tiempo usada para particionar y filtrar cada tabla
+_TIME_COLUMN = {"observaciones": "ts", "pronosticos": "emitido"}
+
+_PARTITIONING = ds.partitioning(pa.schema([("fecha", pa.string())]), flavor="hive")
+
+_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS estado_por_ubicacion (
+    nombre TEXT PRIMARY KEY,
+    dia_actual TEXT,
+    llovio_hoy INTEGER NOT NULL DEFAULT 0,
+    dias_secos INTEGER NOT NULL DEFAULT 0,
+    ultimo_ts INTEGER,
+    ultimo_pronostico TEXT
+);
+CREATE TABLE IF NOT EXISTS riesgo_por_ubicacion (
+    nombre TEXT PRIMARY KEY,
+    nivel INTEGER NOT NULL,
+    ultimas_alertas TEXT NOT NULL
+);
+"""
+
+
+def _fecha_local(ts):
+    return datetime.fromtimestamp(ts).date().isoformat()
+
+
+def _hubo_lluvia(lluvia_1h, condicion_id):
+    """Indica si una observación actual registra precipitación"""
+
+    if lluvia_1h is not None and lluvia_1h > 0:
+        return True
+    return condicion_id is not None and condicion_id // 100 in RAIN_CONDITION_GROUPS
+
+
+class HistoryStore:
+    """Historial columnar de observaciones y pronósticos, particionado por fecha.
+
+    Cada actualización agrega archivos Parquet nuevos (nunca se reescriben los existentes
+    salvo al compactar particiones antiguas). El contador de días secos consecutivos se
+    mantiene en SQLite y se actualiza solo con el último lote.
+    """
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH):
+        self.path = path
+        self._local = threading.local()
+        for tabla in _SCHEMAS:
+            os.makedirs(os.path.join(path, tabla), exist_ok=True)
+        self._connect().executescript(_STATE_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.path, "estado.sqlite3"), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _write_partitions(self, tabla, columnas):
+        """Escribe un archivo nuevo por cada fecha presente en el lote, todavía sin publicar.
+
+        Devuelve los pares (temporal, final): quien llama los renombra cuando su transacción
+        se confirma, o borra los temporales si falla.
+        """
+
+        archivos = []
+        if not columnas["nombre"]:
+            return archivos
+        fechas = [_fecha_local(ts) for ts in columnas[_TIME_COLUMN[tabla]]]
+        for fecha in sorted(set(fechas)):
+            filas = [i for i, f in enumerate(fechas) if f == fecha]
+            datos = {col: [valores[i] for i in filas] for col, valores in columnas.items()}
+            directorio = os.path.join(self.path, tabla, f"fecha={fecha}")
+            os.makedirs(directorio, exist_ok=True)
+            nombre = f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet"
+            # Escribir con prefijo "_" (ignorado por los lectores)
+            temporal = os.path.join(directorio, "_" + nombre)
+            archivos.append((temporal, os.path.join(directorio, nombre)))
+            pq.write_table(pa.Table.from_pydict(datos, schema=_SCHEMAS[tabla]), temporal)
+        return archivos
+
+    def append_batch(self, estados, datos_api, emitido=None):
+        """Agrega las condiciones actuales y los períodos de pronóstico de un lote.
+
+        `datos_api` es la lista devuelta por pipeline.fetch_weather_data. Las observaciones
+        y pronósticos que ya estaban guardados (respuestas repetidas de la caché) se omiten.
+        Devuelve el contador de días secos actualizado por estado.
+        """
+
+        emitido = int(emitido or time.time())
+        observaciones = {campo.name: [] for campo in OBSERVACIONES_SCHEMA}
+        pronosticos = {campo.name: [] for campo in PRONOSTICOS_SCHEMA}
+
+        conn = self._connect()
+        archivos = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for estado, datos_estado in zip(estados, datos_api):
+                fila = conn.execute(
+                    "SELECT dia_actual, llovio_hoy, dias_secos, ultimo_ts, ultimo_pronostico "
+                    "FROM estado_por_ubicacion WHERE nombre=?",
+                    (estado["nombre"],)
+                ).fetchone()
+                dia_actual, llovio_hoy, dias_secos, ultimo_ts, ultimo_pronostico = fila or (None, 0, 0, None, None)
+
+                current_data = datos_estado["current"]
+                if current_data and "main" in current_data and current_data.get("dt", 0) > (ultimo_ts or 0):
+                    ts = int(current_data["dt"])
+                    lluvia_1h = (current_data.get("rain") or {}).get("1h", 0.0)
+                    clima = current_data.get("weather") or [{}]
+                    condicion_id = clima[0].get("id")
+
+                    observaciones["ts"].append(ts)
+                    observaciones["nombre"].append(estado["nombre"])
+                    observaciones["region"].append(estado["region"])
+                    observaciones["lat"].append(estado["lat"])
+                    observaciones["lon"].append(estado["lon"])
+                    observaciones["temp"].append(current_data["main"].get("temp"))
+                    observaciones["humedad"].append(current_data["main"].get("humidity"))
+                    observaciones["presion"].append(current_data["main"].get("pressure"))
+                    observaciones["viento"].append((current_data.get("wind") or {}).get("speed"))
+                    observaciones["lluvia_1h"].append(lluvia_1h)
+                    observaciones["condicion_id"].append(condicion_id)
+
+                    # Actualizar el contador de días secos solo con la observación nueva
+                    dia = _fecha_local(ts)
+                    llovio = _hubo_lluvia(lluvia_1h, condicion_id)
+                    if dia_actual is None or dia == dia_actual:
+                        llovio_hoy = int(bool(llovio_hoy) or llovio)
+                    elif dia > dia_actual:
+                        # Se cierra el día anterior; los días sin observaciones no se cuentan
+                        dias_secos = 0 if llovio_hoy else dias_secos + 1
+                        llovio_hoy = int(llovio)
+                    dia_actual = max(dia, dia_actual or dia)
+                    ultimo_ts = ts
+
+                forecast_data = forecast_arrays(datos_estado["forecast"])
+                if forecast_data is not None and len(forecast_data):
+                    huella = hashlib.sha1(forecast_data.to_bytes()).hexdigest()
+                    if huella != ultimo_pronostico:
+                        n = len(forecast_data)
+                        pronosticos["emitido"].extend([emitido] * n)
+                        pronosticos["nombre"].extend([estado["nombre"]] * n)
+                        pronosticos["region"].extend([estado["region"]] * n)
+                        pronosticos["dt"].extend(forecast_data.dt.tolist())
+                        pronosticos["temp"].extend(forecast_data.temp.tolist())
+                        pronosticos["lluvia_3h"].extend(forecast_data.rain_3h.tolist())
+                        ultimo_pronostico = huella
+
+                conn.execute(
+                    "INSERT OR REPLACE INTO estado_por_ubicacion VALUES (?, ?, ?, ?, ?, ?)",
+                    (estado["nombre"], dia_actual, llovio_hoy, dias_secos, ultimo_ts, ultimo_pronostico)
+                )
+
+            archivos += self._write_partitions("observaciones", observaciones)
+            archivos += self._write_partitions("pronosticos", pronosticos)
+            conn.execute("COMMIT")
+        except Exception:
+            # Sin confirmar, los archivos del lote no se publican: el siguiente lote los vuelve a escribir
+            conn.execute("ROLLBACK")
+            for temporal, _ in archivos:
+                if os.path.exists(temporal):
+                    os.remove(temporal)
+            raise
+
+        # Publicar las particiones solo después de confirmar el estado de deduplicación
+        for temporal, final in archivos:
+            os.replace(temporal, final)
+
+        return self.dry_days()
+
+    def dry_days(self):
+        """Días secos consecutivos por estado (0 si llovió en el día en curso)"""
+
+        filas = self._connect().execute(
+            "SELECT nombre, llovio_hoy, dias_secos FROM estado_por_ubicacion"
+        ).fetchall()
+        return {nombre: 0 if llovio_hoy else dias_secos for nombre, llovio_hoy, dias_secos in filas}
+
+    def risk_state(self):
+        """Nivel de riesgo guardado de cada estado y momento de su última alerta hacia cada nivel.
+
+        Devuelve (nombres, niveles, últimas alertas) como los recibe AlertEngine.restore;
+        -inf si nunca hubo alerta hacia ese nivel.
+        """
+
+        filas = self._connect().execute(
+            "SELECT nombre, nivel, ultimas_alertas FROM riesgo_por_ubicacion"
+        ).fetchall()
+        return (
+            [nombre for nombre, _, _ in filas],
+            [nivel for _, nivel, _ in filas],
+            [[-math.inf if ts is None else ts for ts in json.loads(ultimas)] for _, _, ultimas in filas]
+        )
+
+    def save_risk_state(self, nombres, niveles, ultimas_alertas):
+        """Guarda el estado de AlertEngine.state() para que otro proceso continúe desde él"""
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO riesgo_por_ubicacion VALUES (?, ?, ?)",
+                [
+                    (nombre, int(nivel), json.dumps([ts if math.isfinite(ts) else None for ts in map(float, ultimas)]))
+                    for nombre, nivel, ultimas in zip(nombres, niveles, ultimas_alertas)
+                ]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def scan(self, tabla="observaciones", nombres=None, desde=None, hasta=None, columnas=None):
+        """Lee un rango de tiempo del historial como DataFrame.
+
+        Solo se abren las particiones de las fechas del rango; `desde`/`hasta` son datetime
+        y `nombres` una lista opcional de estados.
+        """
+
+        directorio = os.path.join(self.path, tabla)
+        if not glob.glob(os.path.join(directorio, "fecha=*", "*.parquet")):
+            return pa.Table.from_pylist([], schema=_SCHEMAS[tabla]).to_pandas()
+
+        columna_ts = _TIME_COLUMN[tabla]
+        filtro = None
+
+        def agregar(condicion):
+            nonlocal filtro
+            filtro = condicion if filtro is None else filtro & condicion
+
+        if desde is not None:
+            agregar(ds.field("fecha") >= desde.date().isoformat())
+            agregar(ds.field(columna_ts) >= int(desde.timestamp()))
+        if hasta is not None:
+            agregar(ds.field("fecha") <= hasta.date().isoformat())
+            agregar(ds.field(columna_ts) <= int(hasta.timestamp()))
+        if nombres is not None:
+            agregar(ds.field("nombre").isin(list(nombres)))
+
+        dataset = ds.dataset(directorio, format="parquet", partitioning=_PARTITIONING, schema=_SCHEMAS[tabla].append(pa.field("fecha", pa.string())))
+        df = dataset.to_table(columns=columnas, filter=filtro).to_pandas()
+        if columnas is None:
+            df = df.drop(columns=["fecha"])
+        if columna_ts in df.columns:
+            df = df.sort_values(columna_ts, kind="stable").reset_index(drop=True)
+        return df
+
+    def compact(self, older_than_days=DEFAULT_COMPACT_AFTER_DAYS):
+        """Une los archivos de cada partición antigua en uno solo ordenado por estado y tiempo.
+
+        Devuelve el número de particiones compactadas.
+        """
+
+        limite = (date.today() - timedelta(days=older_than_days)).isoformat()
+        compactadas = 0
+        for tabla, schema in _SCHEMAS.items():
+            columna_ts = _TIME_COLUMN[tabla]
+            for directorio in sorted(glob.glob(os.path.join(self.path, tabla, "fecha=*"))):
+                fecha = os.path.basename(directorio).split("=", 1)[1]
+                archivos = sorted(glob.glob(os.path.join(directorio, "part-*.parquet")))
+                if fecha >= limite or len(archivos) < 2:
+                    continue
+
+                datos = pa.concat_tables([pq.read_table(a, schema=schema) for a in archivos])
+                datos = datos.sort_by([("nombre", "ascending"), (columna_ts, "ascending")])
+                nombre = f"part-compact-{int(time.time() * 1000)}.parquet"
+                temporal = os.path.join(directorio, "_" + nombre)
+                pq.write_table(datos, temporal)
+                os.replace(temporal, os.path.join(directorio, nombre))
+                for archivo in archivos:
+                    os.remove(archivo)
+                compactadas += 1
+        return compactadas
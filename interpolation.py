@@ -0,0 +1,176 @@
+"""Interpolación espacial (IDW) de valores por punto sobre una malla regular de México.
+
+Convierte valores puntuales (probabilidad de lluvia o precipitación por estado o por punto
+de muestreo) en una superficie continua con ponderación por inverso de la distancia,
+calculada por bloques con NumPy. Las celdas fuera del territorio quedan vacías (NaN).
+"""
+
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from sampling import get_state_index
+
+# Resolución por defecto de la malla (grados)
+DEFAULT_RESOLUTION = float(os.environ.get("RAIN_SURFACE_RESOLUTION", 0.05))
+
+# Exponente de la ponderación por inverso de la distancia
+DEFAULT_POWER = 2
+
+# Máximo de pares (celda, punto) en memoria a la vez
+_MAX_PAIRS = 4_000_000
+
+# Variables que se pueden interpolar y su descripción
+SURFACE_VARIABLES = {
+    "probabilidad_lluvia": "Probabilidad de lluvia (%)",
+    "precipitacion": "Precipitación en 5 días (mm)"
+}
+
+# Escala de colores (valor normalizado 0-1 -> RGB) parecida a "Blues"
+COLOR_STOPS = [
+    (0.0, (247, 251, 255)),
+    (0.25, (198, 219, 239)),
+    (0.5, (107, 174, 214)),
+    (0.75, (33, 113, 181)),
+    (1.0, (8, 48, 107))
+]
+
+
+class RainSurface:
+    """Superficie interpolada: matriz de valores (fila 0 al norte) y sus límites geográficos"""
+
+    def __init__(self, valores, bounds, resolution):
+        self.valores = valores
+        # [[lat_min, lon_min], [lat_max, lon_max]] como los espera folium
+        self.bounds = bounds
+        self.resolution = resolution
+
+    def image(self, vmin=None, vmax=None, opacity=0.75):
+        """Imagen RGBA (uint8) de la superficie; las celdas vacías son transparentes.
+
+        Leaflet estira la imagen entre los límites en Web Mercator, así que las filas (igualmente
+        espaciadas en latitud) se remuestrean a filas igualmente espaciadas en y de Mercator.
+        """
+
+        filas = mercator_rows(len(self.valores), self.bounds[0][0], self.bounds[1][0])
+        return surface_image(self.valores[filas], vmin=vmin, vmax=vmax, opacity=opacity)
+
+
+def _mercator(lat):
+    return np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))
+
+
+def mercator_rows(n, lat_min, lat_max):
+    """Fila (0 al norte, igualmente espaciadas en latitud) que cae en el centro de cada una de
+    las `n` filas igualmente espaciadas en y de Mercator entre lat_min y lat_max"""
+
+    y_min, y_max = _mercator(lat_min), _mercator(lat_max)
+    y = y_max - (np.arange(n) + 0.5) / n * (y_max - y_min)
+    lat = np.degrees(2 * np.arctan(np.exp(y)) - np.pi / 2)
+    return np.clip(((lat_max - lat) / (lat_max - lat_min) * n).astype(int), 0, n - 1)
+
+
+@lru_cache(maxsize=8)
+def grid(resolution=DEFAULT_RESOLUTION):
+    """Centros de las celdas de la malla y máscara de celdas dentro de algún estado.
+
+    Devuelve (lon, lat, dentro, forma, bounds); lon/lat son vectores aplanados con la fila 0 al norte.
+    """
+
+    index = get_state_index()
+    lon_min, lat_min = index.lon0, index.lat0
+    lon_max = lon_min + index.columnas * index.cell_size
+    lat_max = lat_min + index.filas * index.cell_size
+
+    columnas = np.arange(lon_min + resolution / 2, lon_max, resolution)
+    filas = np.arange(lat_max - resolution / 2, lat_min, -resolution)
+    malla_lon, malla_lat = np.meshgrid(columnas, filas)
+    malla_lon = malla_lon.ravel()
+    malla_lat = malla_lat.ravel()
+
+    dentro = index.locate(malla_lon, malla_lat) >= 0
+    bounds = [
+        [float(filas[-1] - resolution / 2), float(columnas[0] - resolution / 2)],
+        [float(filas[0] + resolution / 2), float(columnas[-1] + resolution / 2)]
+    ]
+    return malla_lon, malla_lat, dentro, (len(filas), len(columnas)), bounds
+
+
+def idw(lon, lat, valores, destino_lon, destino_lat, power=DEFAULT_POWER):
+    """Interpola `valores` de los puntos (lon, lat) en los puntos de destino.
+
+    Las distancias se calculan en grados con la longitud escalada por el coseno de la
+    latitud media. Un destino que coincide con un punto de origen toma su valor exacto.
+    """
+
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    valores = np.asarray(valores, dtype=np.float64)
+    validos = ~np.isnan(valores)
+    lon, lat, valores = lon[validos], lat[validos], valores[validos]
+
+    resultado = np.full(len(destino_lon), np.nan)
+    if len(valores) == 0:
+        return resultado
+
+    escala = np.cos(np.radians(lat.mean()))
+    px = lon * escala
+    paso = max(1, _MAX_PAIRS // len(valores))
+    for inicio in range(0, len(destino_lon), paso):
+        dx = destino_lon[inicio:inicio + paso, None] * escala - px
+        dy = destino_lat[inicio:inicio + paso, None] - lat
+        d2 = dx * dx + dy * dy
+
+        with np.errstate(divide="ignore"):
+            pesos = d2 ** (-power / 2)
+        exactos = d2 == 0
+        if exactos.any():
+            # Donde la distancia es cero solo cuenta el punto coincidente
+            filas_exactas = exactos.any(axis=1)
+            pesos[filas_exactas] = exactos[filas_exactas]
+
+        resultado[inicio:inicio + paso] = (pesos @ valores) / pesos.sum(axis=1)
+    return resultado
+
+
+def rain_surface(lon, lat, valores, resolution=DEFAULT_RESOLUTION, power=DEFAULT_POWER):
+    """Superficie IDW sobre la malla de México (solo se calculan las celdas del territorio)"""
+
+    malla_lon, malla_lat, dentro, forma, bounds = grid(resolution)
+    superficie = np.full(len(malla_lon), np.nan)
+    superficie[dentro] = idw(lon, lat, valores, malla_lon[dentro], malla_lat[dentro], power=power)
+    return RainSurface(superficie.reshape(forma), bounds, resolution)
+
+
+def snapshot_surface(snapshot, variable="probabilidad_lluvia", resolution=DEFAULT_RESOLUTION):
+    """Superficie nacional de una variable del snapshot a partir de las coordenadas de cada estado"""
+
+    df_estados = snapshot.df_estados
+    if variable == "precipitacion":
+        totales = snapshot.df_diario.groupby("nombre", sort=False, observed=True)["precipitacion"].sum()
+        valores = df_estados["nombre"].map(totales)
+    elif variable in SURFACE_VARIABLES:
+        valores = df_estados[variable]
+    else:
+        raise ValueError(f"Variable no soportada: {variable}")
+    return rain_surface(df_estados["lon"], df_estados["lat"], valores.astype(float), resolution=resolution)
+
+
+def surface_image(valores, vmin=None, vmax=None, opacity=0.75):
+    """Convierte una matriz de valores en una imagen RGBA con la escala COLOR_STOPS"""
+
+    vacios = np.isnan(valores)
+    if vmin is None:
+        vmin = np.nanmin(valores) if not vacios.all() else 0.0
+    if vmax is None:
+        vmax = np.nanmax(valores) if not vacios.all() else 1.0
+    rango = (vmax - vmin) or 1.0
+    normalizados = np.clip((np.nan_to_num(valores, nan=vmin) - vmin) / rango, 0, 1)
+
+    posiciones = [posicion for posicion, _ in COLOR_STOPS]
+    imagen = np.empty(valores.shape + (4,), dtype=np.uint8)
+    for canal in range(3):
+        imagen[..., canal] = np.interp(normalizados, posiciones, [color[canal] for _, color in COLOR_STOPS])
+    imagen[..., 3] = np.where(vacios, 0, int(255 * opacity))
+    return imagen
@@ -0,0 +1,121 @@
+import folium
+import numpy as np
+import pandas as pd
+
+# Centro y zoom inicial del mapa de México
+MAP_CENTER = [23.6345, -102.5528]
+MAP_ZOOM = 5
+
+# Umbrales de probabilidad de lluvia (%) y color de cada rango, de mayor a menor
+COLOR_THRESHOLDS = [(50, "green"), (30, "lightblue"), (10, "orange")]
+DEFAULT_COLOR = "red"
+
+# Función para asignar el color de cada estado según su probabilidad de lluvia
+def rain_colors(probabilidad):
+    """Devuelve un array con el color de cada valor de probabilidad"""
+    
+    probabilidad = np.asarray(probabilidad, dtype=float)
+    condiciones = [probabilidad > umbral for umbral, _ in COLOR_THRESHOLDS]
+    colores = [color for _, color in COLOR_THRESHOLDS]
+    return np.select(condiciones, colores, default=DEFAULT_COLOR)
+
+# Función para mostrar una columna numérica con su unidad en el popup (sin decimales sobrantes)
+def _numeros(serie, unidad="", vacio="Sin datos"):
+    return (serie.astype(float).map("{:g}".format) + unidad).where(serie.notna(), vacio)
+
+# Función para armar el HTML del popup de todos los estados a la vez
+def popup_html(df_estados):
+    """Devuelve una Series con el HTML del popup de cada estado"""
+    
+    proxima_lluvia = pd.to_datetime(df_estados["proxima_lluvia"]).dt.strftime("%d/%m/%Y %H:%M").fillna("No prevista")
+    return (
+        '<div style="width: 200px">'
+        + "<h4>" + df_estados["nombre"].astype(str) + "</h4>"
+        + "<p><b>Temperatura actual:</b> " + _numeros(df_estados["temp_actual"], "°C") + "</p>"
+        + "<p><b>Clima actual:</b> " + df_estados["clima_actual"].astype(object).fillna("Sin datos").astype(str) + "</p>"
+        + "<p><b>Humedad:</b> " + _numeros(df_estados["humedad_actual"], "%") + "</p>"
+        + "<p><b>Viento:</b> " + _numeros(df_estados["viento_actual"], " m/s") + "</p>"
+        + "<p><b>Probabilidad de lluvia (5 días):</b> " + _numeros(df_estados["probabilidad_lluvia"], "%") + "</p>"
+        + "<p><b>Días con lluvia prevista:</b> " + df_estados["dias_con_lluvia"].astype(str) + "</p>"
+        + "<p><b>Próxima lluvia:</b> " + proxima_lluvia + "</p>"
+        + "</div>"
+    )
+
+# Función para convertir los estados en una colección de puntos GeoJSON
+def rain_feature_collection(df_estados):
+    """FeatureCollection con un punto por estado, su color y el HTML de su popup"""
+    
+    colores = rain_colors(df_estados["probabilidad_lluvia"])
+    popups = popup_html(df_estados)
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [lon, lat]},
+            "properties": {"nombre": nombre, "color": color, "popup": popup}
+        }
+        for nombre, lat, lon, color, popup in zip(
+            df_estados["nombre"], df_estados["lat"].astype(float), df_estados["lon"].astype(float), colores.tolist(), popups
+        )
+    ]
+    return {"type": "FeatureCollection", "features": features}
+
+def _estilo(feature):
+    color = feature["properties"]["color"]
+    return {"color": color, "fillColor": color, "fillOpacity": 0.7}
+
+# Función para construir el mapa de probabilidad de lluvia
+def build_rain_map(df_estados, superficie=None, nombre_superficie="Superficie interpolada"):
+    """Crea el mapa de Folium con un marcador por estado coloreado según la probabilidad de lluvia.
+    
+    Todos los marcadores forman una sola capa GeoJSON en lugar de un CircleMarker por fila.
+    Si se pasa una superficie interpolada (RainSurface) se agrega debajo como imagen.
+    """
+    
+    # Crear mapa
+    m = folium.Map(location=MAP_CENTER, zoom_start=MAP_ZOOM)
+    
+    # Superficie interpolada como una sola imagen sobre el mapa base
+    if superficie is not None:
+        folium.raster_layers.ImageOverlay(
+            image=superficie.image(),
+            bounds=superficie.bounds,
+            name=nombre_superficie,
+            pixelated=False
+        ).add_to(m)
+    
+    # Añadir los estados como una sola capa de puntos
+    folium.GeoJson(
+        rain_feature_collection(df_estados),
+        name="Probabilidad de lluvia",
+        marker=folium.CircleMarker(radius=10, fill=True),
+        style_function=_estilo,
+        popup=folium.GeoJsonPopup(fields=["popup"], labels=False, max_width=300)
+    ).add_to(m)
+
+    # Añadir leyenda
+    legend_html = '''
+    <div style="position: fixed; 
+        bottom: 50px; left: 50px; width: 250px; height: 130px; 
+        border:2px solid grey; z-index:9999; font-size:14px;
+        background-color:white;
+        padding: 10px;
+        border-radius: 5px;
+        ">
+        <p><i class="fa fa-circle" style="color:green"></i> Probabilidad alta (>50%)</p>
+        <p><i class="fa fa-circle" style="color:lightblue"></i> Probabilidad media (30-50%)</p>
+        <p><i class="fa fa-circle" style="color:orange"></i> Probabilidad baja (10-30%)</p>
+        <p><i class="fa fa-circle" style="color:red"></i> Sin lluvia prevista (<10%)</p>
+    </div>
+    '''
+    m.get_root().html.add_child(folium.Element(legend_html))
+    
+    if superficie is not None:
+        folium.LayerControl().add_to(m)
+    
+    return m
+
+# Función para generar el HTML completo del mapa (lo que se inserta en la página)
+def render_map_html(m):
+    """Devuelve el HTML del mapa dentro de una figura, igual que folium_static"""
+    
+    return folium.Figure().add_child(m).render()
@@ -0,0 +1,225 @@
+"""Instrumentación de rendimiento: temporizadores por etapa, contadores e histogramas de latencia.
+
+Está desactivada por defecto (RAIN_METRICS=1 la activa) y en ese caso cada llamada se reduce
+a una comprobación de un booleano. Las métricas se pueden exportar en formato de texto de
+Prometheus, servir en un endpoint HTTP o escribir como líneas de log estructuradas:
+
+    RAIN_METRICS=1 RAIN_METRICS_PORT=9108 streamlit run app.py
+    curl http://127.0.0.1:9108/metrics
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Activar la instrumentación desde el entorno
+ENABLED = os.environ.get("RAIN_METRICS", "").lower() in ("1", "true", "yes")
+
+# Puerto opcional del endpoint /metrics
+METRICS_PORT = os.environ.get("RAIN_METRICS_PORT")
+
+# Prefijo de los nombres de métricas exportadas
+PREFIX = "rain_"
+
+# Límites superiores (segundos) de los buckets de los histogramas
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Descripción de cada métrica para el formato de Prometheus
+DESCRIPCIONES = {
+    "stage_seconds": "Duración de cada etapa del pipeline y del render",
+    "upstream_latency_seconds": "Latencia de las respuestas de OpenWeather",
+    "cache_total": "Consultas a la caché de respuestas por resultado",
+    "upstream_requests_total": "Solicitudes enviadas a OpenWeather por código de respuesta",
+    "analysis_rows_total": "Ubicaciones analizadas de nuevo o reutilizadas en cada actualización",
+    "api_requests_total": "Consultas a la API de datos por ruta y resultado",
+    "api_seconds": "Tiempo de serialización de las respuestas de la API de datos"
+}
+
+_NULL = nullcontext()
+_lock = threading.Lock()
+_contadores = {}
+_histogramas = {}
+
+
+class _Histograma:
+    """Histograma acumulado con buckets fijos"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.conteos = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.ultimo = 0.0
+
+    def observe(self, valor):
+        self.count += 1
+        self.sum += valor
+        self.ultimo = valor
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.conteos[i] += 1
+                break
+
+
+def _clave(nombre, etiquetas):
+    return nombre, tuple(sorted(etiquetas.items()))
+
+
+def enable(valor=True):
+    """Activa o desactiva la instrumentación en este proceso"""
+
+    global ENABLED
+    ENABLED = valor
+
+
+def increment(nombre, valor=1, **etiquetas):
+    """Suma `valor` a un contador"""
+
+    if not ENABLED:
+        return
+    clave = _clave(nombre, etiquetas)
+    with _lock:
+        _contadores[clave] = _contadores.get(clave, 0) + valor
+
+
+def observe(nombre, valor, **etiquetas):
+    """Registra una duración (segundos) en un histograma"""
+
+    if not ENABLED:
+        return
+    clave = _clave(nombre, etiquetas)
+    with _lock:
+        histograma = _histogramas.get(clave)
+        if histograma is None:
+            histograma = _histogramas[clave] = _Histograma()
+        histograma.observe(valor)
+
+
+@contextmanager
+def _timer(nombre, etiquetas):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(nombre, time.perf_counter() - inicio, **etiquetas)
+
+
+def timer(nombre="stage_seconds", **etiquetas):
+    """Context manager que mide un bloque; no hace nada si la instrumentación está desactivada"""
+
+    if not ENABLED:
+        return _NULL
+    return _timer(nombre, etiquetas)
+
+
+def stage(etapa):
+    """Temporizador de una etapa del pipeline o del render"""
+
+    return timer("stage_seconds", etapa=etapa)
+
+
+def reset():
+    """Elimina todas las métricas registradas"""
+
+    with _lock:
+        _contadores.clear()
+        _histogramas.clear()
+
+
+def collect():
+    """Copia de las métricas: lista de filas con nombre, etiquetas y valores"""
+
+    filas = []
+    with _lock:
+        for (nombre, etiquetas), valor in sorted(_contadores.items()):
+            filas.append({"metrica": nombre, "etiquetas": dict(etiquetas), "tipo": "counter", "valor": valor})
+        for (nombre, etiquetas), h in sorted(_histogramas.items()):
+            filas.append({
+                "metrica": nombre,
+                "etiquetas": dict(etiquetas),
+                "tipo": "histogram",
+                "count": h.count,
+                "sum": round(h.sum, 6),
+                "promedio": round(h.sum / h.count, 6) if h.count else 0.0,
+                "ultimo": round(h.ultimo, 6)
+            })
+    return filas
+
+
+def _formatear_etiquetas(etiquetas):
+    if not etiquetas:
+        return ""
+    partes = []
+    for clave, valor in etiquetas:
+        valor = str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        partes.append(f'{clave}="{valor}"')
+    return "{" + ",".join(partes) + "}"
+
+
+def prometheus_text():
+    """Métricas en el formato de texto de exposición de Prometheus"""
+
+    lineas = []
+    with _lock:
+        contadores = sorted(_contadores.items())
+        histogramas = sorted((clave, (list(h.conteos), h.count, h.sum, h.buckets)) for clave, h in _histogramas.items())
+
+    declaradas = set()
+
+    def encabezado(nombre, tipo):
+        if nombre not in declaradas:
+            declaradas.add(nombre)
+            lineas.append(f"# HELP {PREFIX}{nombre} {DESCRIPCIONES.get(nombre, nombre)}")
+            lineas.append(f"# TYPE {PREFIX}{nombre} {tipo}")
+
+    for (nombre, etiquetas), valor in contadores:
+        encabezado(nombre, "counter")
+        lineas.append(f"{PREFIX}{nombre}{_formatear_etiquetas(etiquetas)} {valor}")
+
+    for (nombre, etiquetas), (conteos, count, suma, buckets) in histogramas:
+        encabezado(nombre, "histogram")
+        acumulado = 0
+        for limite, conteo in zip(buckets, conteos):
+            acumulado += conteo
+            lineas.append(f"{PREFIX}{nombre}_bucket{_formatear_etiquetas(etiquetas + (('le', limite),))} {acumulado}")
+        lineas.append(f"{PREFIX}{nombre}_bucket{_formatear_etiquetas(etiquetas + (('le', '+Inf'),))} {count}")
+        lineas.append(f"{PREFIX}{nombre}_sum{_formatear_etiquetas(etiquetas)} {suma}")
+        lineas.append(f"{PREFIX}{nombre}_count{_formatear_etiquetas(etiquetas)} {count}")
+
+    return "\n".join(lineas) + "\n"
+
+
+def log_metrics(logger):
+    """Escribe una línea de log JSON por cada métrica"""
+
+    for fila in collect():
+        logger.info(json.dumps(fila, ensure_ascii=False))
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        cuerpo = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """Sirve /metrics en un hilo de fondo y devuelve el servidor"""
+
+    servidor = ThreadingHTTPServer((host, int(port)), _Handler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="metrics-endpoint", daemon=True).start()
+    return servidor
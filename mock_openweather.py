@@ -0,0 +1,302 @@
+"""Servidor local que imita la API de OpenWeather para pruebas de carga sin red ni cuota.
+
+Sirve /weather, /forecast y /group con respuestas grabadas (si existen en el directorio de
+fixtures) o sintéticas y deterministas para cualquier lat/lon, con latencia, errores y
+respuestas 429 configurables:
+
+    python mock_openweather.py serve --port 8765 --latency 0.05 --error-rate 0.01 --rate-429 0.02
+    OPENWEATHER_BASE_URL=http://127.0.0.1:8765/data/2.5 OPENWEATHER_API_KEY=demo streamlit run app.py
+
+Para grabar fixtures reales de los estados (requiere API key y red):
+
+    OPENWEATHER_API_KEY=... python mock_openweather.py record --fixtures fixtures
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Límites aproximados del territorio mexicano para generar ubicaciones sintéticas
+MEXICO_BOUNDS = {"lat_min": 14.5, "lat_max": 32.7, "lon_min": -117.1, "lon_max": -86.7}
+
+# Descripciones de OpenWeather (lang=es) según la condición
+CONDICIONES = {
+    800: ("cielo claro", "01d"),
+    802: ("nubes dispersas", "03d"),
+    804: ("nubes", "04d"),
+    500: ("lluvia ligera", "10d"),
+    501: ("lluvia moderada", "10d"),
+    211: ("tormenta", "11d")
+}
+
+
+def _semilla(*partes):
+    """Semilla estable (entre procesos) a partir de los valores dados"""
+
+    return zlib.crc32(repr(partes).encode())
+
+
+def _region(lat):
+    if lat >= 24:
+        return "Norte"
+    if lat >= 19.5:
+        return "Centro"
+    return "Sur"
+
+
+def synthetic_locations(n, seed=0):
+    """Genera `n` ubicaciones sintéticas dentro de México con el formato de estados_mexico"""
+
+    rnd = random.Random(seed)
+    ubicaciones = []
+    for i in range(n):
+        lat = round(rnd.uniform(MEXICO_BOUNDS["lat_min"], MEXICO_BOUNDS["lat_max"]), 4)
+        lon = round(rnd.uniform(MEXICO_BOUNDS["lon_min"], MEXICO_BOUNDS["lon_max"]), 4)
+        ubicaciones.append({"nombre": f"Punto {i:05d}", "lat": lat, "lon": lon, "region": _region(lat)})
+    return ubicaciones
+
+
+def _probabilidad_lluvia(lat, dia):
+    """Probabilidad base de lluvia por período: más alta en el sur y variable por día"""
+
+    base = 0.05 + 0.35 * (MEXICO_BOUNDS["lat_max"] - lat) / (MEXICO_BOUNDS["lat_max"] - MEXICO_BOUNDS["lat_min"])
+    return min(0.9, max(0.0, base * random.Random(_semilla(round(lat, 1), dia)).uniform(0.3, 1.7)))
+
+
+def _temperatura(lat, lon, dt):
+    """Temperatura base: más cálida hacia el sur, con ciclo diario según la hora local"""
+
+    hora_local = ((dt / 3600) + lon / 15) % 24
+    return 12 + 0.5 * (MEXICO_BOUNDS["lat_max"] - lat) + 8 * math.sin((hora_local - 9) / 24 * 2 * math.pi)
+
+
+def synthetic_current(lat, lon, city_id=None, ahora=None):
+    """Respuesta sintética de /weather para una coordenada"""
+
+    ahora = int(ahora or time.time())
+    # Las condiciones cambian cada 10 minutos, como las observaciones reales
+    dt = ahora - ahora % 600
+    rnd = random.Random(_semilla(round(lat, 4), round(lon, 4), dt))
+    temp = _temperatura(lat, lon, dt)
+    llueve = rnd.random() < _probabilidad_lluvia(lat, dt // 86400)
+    condicion = rnd.choice([500, 501, 211]) if llueve else rnd.choice([800, 802, 804])
+    descripcion, icono = CONDICIONES[condicion]
+
+    payload = {
+        "coord": {"lon": lon, "lat": lat},
+        "weather": [{"id": condicion, "main": "Rain" if llueve else "Clouds", "description": descripcion, "icon": icono}],
+        "main": {
+            "temp": round(temp + rnd.uniform(-1.5, 1.5), 2),
+            "humidity": rnd.randint(55, 95) if llueve else rnd.randint(10, 60),
+            "pressure": rnd.randint(1005, 1022)
+        },
+        "wind": {"speed": round(rnd.uniform(0, 9), 2)},
+        "dt": dt,
+        "id": city_id or _semilla(round(lat, 4), round(lon, 4)) % 10_000_000,
+        "name": f"Sintético {lat:.2f},{lon:.2f}",
+        "cod": 200
+    }
+    if llueve:
+        payload["rain"] = {"1h": round(rnd.uniform(0.2, 6), 2)}
+    return payload
+
+
+def synthetic_forecast(lat, lon, ahora=None):
+    """Respuesta sintética de /forecast (40 períodos de 3 horas) para una coordenada"""
+
+    ahora = int(ahora or time.time())
+    inicio = ahora - ahora % 10800 + 10800
+    lista = []
+    for k in range(40):
+        dt = inicio + k * 10800
+        rnd = random.Random(_semilla(round(lat, 4), round(lon, 4), dt))
+        temp = _temperatura(lat, lon, dt)
+        periodo = {
+            "dt": dt,
+            "main": {"temp": round(temp + rnd.uniform(-2, 2), 2), "humidity": rnd.randint(10, 95)},
+            "weather": [{"id": 800, "description": CONDICIONES[800][0], "icon": CONDICIONES[800][1]}]
+        }
+        if rnd.random() < _probabilidad_lluvia(lat, dt // 86400):
+            periodo["rain"] = {"3h": round(rnd.expovariate(1 / 2.5), 2)}
+            periodo["weather"] = [{"id": 500, "description": CONDICIONES[500][0], "icon": CONDICIONES[500][1]}]
+        lista.append(periodo)
+    return {"cod": "200", "cnt": len(lista), "list": lista, "city": {"coord": {"lat": lat, "lon": lon}}}
+
+
+class MockConfig:
+    """Configuración del servidor simulado"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_429=0.0, fixtures=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.fixtures = fixtures
+        self.random = random.Random(seed)
+        self.city_coords = {}
+        self.contadores = {"solicitudes": 0, "errores": 0, "respuestas_429": 0}
+        self.lock = threading.Lock()
+
+    def fixture(self, endpoint, lat, lon):
+        """Devuelve una respuesta grabada si existe en el directorio de fixtures"""
+
+        if not self.fixtures:
+            return None
+        ruta = os.path.join(self.fixtures, endpoint, f"{round(lat, 4)}_{round(lon, 4)}.json")
+        if not os.path.exists(ruta):
+            return None
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "MockOpenWeather/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _responder(self, status, payload, headers=None):
+        cuerpo = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for nombre, valor in (headers or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_GET(self):
+        config = self.server.config
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        endpoint = url.path.rstrip("/").rsplit("/", 1)[-1]
+
+        with config.lock:
+            config.contadores["solicitudes"] += 1
+            sorteo = config.random.random()
+            espera = config.latency + config.random.uniform(0, config.jitter)
+
+        if espera > 0:
+            time.sleep(espera)
+
+        if sorteo < config.rate_429:
+            with config.lock:
+                config.contadores["respuestas_429"] += 1
+            self._responder(429, {"cod": 429, "message": "Your account is temporary blocked due to exceeding of requests limitation"}, {"Retry-After": "1"})
+            return
+        if sorteo < config.rate_429 + config.error_rate:
+            with config.lock:
+                config.contadores["errores"] += 1
+            self._responder(500, {"cod": 500, "message": "Internal error"})
+            return
+
+        try:
+            if endpoint in ("weather", "forecast"):
+                lat, lon = float(params["lat"]), float(params["lon"])
+                payload = config.fixture(endpoint, lat, lon)
+                if payload is None:
+                    payload = synthetic_current(lat, lon) if endpoint == "weather" else synthetic_forecast(lat, lon)
+            elif endpoint == "group":
+                lista = []
+                for city_id in (int(x) for x in params["id"].split(",")):
+                    lat, lon = config.city_coords.get(city_id, (20.0 + city_id % 1000 / 100, -100.0 + city_id % 700 / 100))
+                    lista.append(config.fixture("weather", lat, lon) or synthetic_current(lat, lon, city_id))
+                payload = {"cnt": len(lista), "list": lista}
+            else:
+                self._responder(404, {"cod": "404", "message": "Internal error: not found"})
+                return
+        except (KeyError, ValueError) as e:
+            self._responder(400, {"cod": "400", "message": f"Parámetros inválidos: {e}"})
+            return
+
+        self._responder(200, payload)
+
+
+def start_server(host="127.0.0.1", port=0, config=None):
+    """Inicia el servidor en un hilo de fondo y devuelve (servidor, URL base de la API)"""
+
+    servidor = ThreadingHTTPServer((host, port), _Handler)
+    servidor.daemon_threads = True
+    servidor.config = config or MockConfig()
+
+    # Coordenadas de las ciudades de referencia de los estados para el endpoint de grupo
+    from pipeline import estados_mexico
+    for estado in estados_mexico:
+        servidor.config.city_coords.setdefault(estado["owm_id"], (estado["lat"], estado["lon"]))
+
+    threading.Thread(target=servidor.serve_forever, name="mock-openweather", daemon=True).start()
+    return servidor, f"http://{host}:{servidor.server_address[1]}/data/2.5"
+
+
+def record_fixtures(api_key, estados, directorio):
+    """Graba las respuestas reales de /weather y /forecast de cada ubicación en `directorio`"""
+
+    from pipeline import OPENWEATHER_BASE_URL, get_scheduler
+    from request_scheduler import RequestError
+
+    # Se piden directamente (sin la caché) para grabar las respuestas completas
+    rutas = []
+    for endpoint in ("weather", "forecast"):
+        os.makedirs(os.path.join(directorio, endpoint), exist_ok=True)
+        for estado in estados:
+            url = (f"{OPENWEATHER_BASE_URL}/{endpoint}?lat={estado['lat']}&lon={estado['lon']}"
+                   f"&appid={api_key}&units=metric&lang=es")
+            try:
+                payload = get_scheduler().get_json(url)
+            except RequestError:
+                continue
+            ruta = os.path.join(directorio, endpoint, f"{round(estado['lat'], 4)}_{round(estado['lon'], 4)}.json")
+            with open(ruta, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False)
+            rutas.append(ruta)
+    return rutas
+
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos"""
+
+    parser = argparse.ArgumentParser(description="Servidor local que imita la API de OpenWeather")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    serve = subparsers.add_parser("serve", help="Iniciar el servidor")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--latency", type=float, default=0.0, help="Latencia fija por respuesta (segundos)")
+    serve.add_argument("--jitter", type=float, default=0.0, help="Latencia aleatoria adicional máxima (segundos)")
+    serve.add_argument("--error-rate", type=float, default=0.0, help="Fracción de respuestas 500")
+    serve.add_argument("--rate-429", type=float, default=0.0, help="Fracción de respuestas 429")
+    serve.add_argument("--fixtures", help="Directorio con respuestas grabadas")
+    serve.add_argument("--seed", type=int, default=None)
+
+    record = subparsers.add_parser("record", help="Grabar respuestas reales de los estados")
+    record.add_argument("--fixtures", default="fixtures")
+
+    args = parser.parse_args(argv)
+
+    if args.comando == "record":
+        from pipeline import estados_mexico, get_api_key
+        rutas = record_fixtures(get_api_key(), estados_mexico, args.fixtures)
+        print(f"{len(rutas)} respuestas grabadas en {args.fixtures}")
+        return 0
+
+    config = MockConfig(args.latency, args.jitter, args.error_rate, args.rate_429, args.fixtures, args.seed)
+    servidor, base_url = start_server(args.host, args.port, config)
+    print(f"Servidor simulado en {base_url} (Ctrl+C para detener)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
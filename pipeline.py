@@ -0,0 +1,691 @@
+"""Pipeline de datos climáticos sin interfaz: consulta a OpenWeather, análisis de lluvia y armado del snapshot.
+
+Se puede importar desde la app de Streamlit o ejecutar desde la línea de comandos:
+
+    python pipeline.py --out-dir datos --format parquet
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from drought_risk import AlertEngine
+from forecast_parser import forecast_arrays, parse_forecast
+from history_store import HistoryStore
+from request_scheduler import RequestScheduler, RequestError
+from rolling_stats import RollingStats
+from snapshot import Snapshot, save_snapshot
+from weather_cache import WeatherCache
+
+logger = logging.getLogger(__name__)
+
+# URL base de la API (se puede apuntar a un servidor local, ver mock_openweather.py)
+OPENWEATHER_BASE_URL = os.environ.get("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5").rstrip("/")
+
+# Número máximo de solicitudes simultáneas a la API
+MAX_WORKERS = 8
+
+# Máximo de ciudades por consulta al endpoint de grupo de OpenWeather
+GROUP_BATCH_SIZE = 20
+
+# Sesión HTTP compartida por todo el proceso para reutilizar conexiones (keep-alive)
+@lru_cache(maxsize=None)
+def get_http_session():
+    """Crea una sesión HTTP con un pool de conexiones persistentes"""
+    
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# Planificador de solicitudes (límite de cuota, reintentos y solicitudes unificadas)
+@lru_cache(maxsize=None)
+def get_scheduler():
+    """Crea el planificador de solicitudes a OpenWeather del proceso"""
+    
+    return RequestScheduler(get_http_session())
+
+# Caché en disco compartida entre procesos y reinicios (fuente de verdad de las respuestas)
+@lru_cache(maxsize=None)
+def get_weather_cache():
+    """Abre la caché persistente de respuestas de OpenWeather"""
+    
+    return WeatherCache()
+
+# Función para obtener datos climáticos actuales de OpenWeather
+def get_current_weather(lat, lon, api_key, max_age=None, with_fingerprint=False):
+    """Obtiene datos actuales de clima usando la API gratuita (con su huella si `with_fingerprint`)"""
+    
+    def fetch():
+        url = f"{OPENWEATHER_BASE_URL}/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric&lang=es"
+        
+        try:
+            return get_scheduler().get_json(url)
+        except RequestError as e:
+            logger.error(f"Error al obtener datos actuales: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Error en la solicitud: {e}")
+            return None
+    
+    return get_weather_cache().get_or_fetch("weather", lat, lon, fetch, units="metric", lang="es",
+                                            max_age=max_age, with_fingerprint=with_fingerprint)
+
+# Función para obtener pronóstico de 5 días
+def get_forecast(lat, lon, api_key, max_age=None, with_fingerprint=False):
+    """Obtiene pronóstico de 5 días usando la API gratuita (con su huella si `with_fingerprint`).
+
+    Devuelve solo los campos que usa el análisis, como ForecastArrays.
+    """
+    
+    def fetch():
+        url = f"{OPENWEATHER_BASE_URL}/forecast?lat={lat}&lon={lon}&appid={api_key}&units=metric&lang=es"
+        
+        try:
+            return get_scheduler().get_json(url, parse=parse_forecast)
+        except RequestError as e:
+            logger.error(f"Error al obtener pronóstico: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Error en la solicitud: {e}")
+            return None
+    
+    return get_weather_cache().get_or_fetch("forecast", lat, lon, fetch, units="metric", lang="es",
+                                            max_age=max_age, with_fingerprint=with_fingerprint)
+
+# Función para obtener datos actuales de varias ubicaciones con el endpoint de grupo
+def get_current_weather_bulk(estados, api_key, max_age=None, with_fingerprint=False):
+    """Obtiene las condiciones actuales en lotes de hasta 20 ciudades por solicitud.
+    
+    Devuelve una respuesta por estado (en el mismo orden), con el mismo formato que
+    get_current_weather. Los estados sin owm_id, los que faltan en la respuesta y los
+    de un lote fallido se consultan uno por uno.
+    """
+    
+    cache = get_weather_cache()
+    actuales = [None] * len(estados)
+    huellas = [None] * len(estados)
+    por_id = {}
+    
+    # Usar la caché por ubicación y agrupar por ID solo las que faltan
+    for i, estado in enumerate(estados):
+        entrada = cache.get("weather", estado["lat"], estado["lon"], units="metric", lang="es")
+        limite = cache.ttl if max_age is None else min(max_age, cache.ttl)
+        if entrada is not None and entrada[1] <= limite:
+            actuales[i], huellas[i] = entrada[0], entrada[2]
+            metrics.increment("cache_total", endpoint="weather", resultado="hit")
+        elif estado.get("owm_id"):
+            por_id.setdefault(estado["owm_id"], []).append(i)
+    
+    ids = list(por_id)
+    for inicio in range(0, len(ids), GROUP_BATCH_SIZE):
+        lote = ids[inicio:inicio + GROUP_BATCH_SIZE]
+        url = f"{OPENWEATHER_BASE_URL}/group?id={','.join(str(x) for x in lote)}&appid={api_key}&units=metric&lang=es"
+        
+        try:
+            respuesta = get_scheduler().get_json(url)
+        except Exception as e:
+            logger.error(f"Error al obtener datos actuales en lote: {e}")
+            continue
+        
+        # Repartir cada ciudad del lote a sus estados y guardarla en la caché por ubicación
+        for ciudad in respuesta.get("list", []):
+            for i in por_id.get(ciudad.get("id"), []):
+                actuales[i] = ciudad
+                huellas[i] = cache.set("weather", estados[i]["lat"], estados[i]["lon"], ciudad, units="metric", lang="es")
+    
+    # Consultas individuales para lo que no se obtuvo en lote
+    for i, estado in enumerate(estados):
+        if actuales[i] is None:
+            actuales[i], huellas[i] = get_current_weather(estado["lat"], estado["lon"], api_key, max_age, with_fingerprint=True)
+    
+    if with_fingerprint:
+        return list(zip(actuales, huellas))
+    return actuales
+
+# Función para analizar si hay lluvia en el pronóstico
+def analyze_rain_forecast(forecast_data):
+    """Analiza si hay lluvia en el pronóstico de 5 días y calcula la probabilidad"""
+    
+    forecast_data = forecast_arrays(forecast_data)
+    if forecast_data is None or len(forecast_data) == 0:
+        return {
+            "lluvia_proximos_dias": False,
+            "probabilidad_lluvia": 0,
+            "dias_con_lluvia": 0,
+            "proxima_lluvia": None,
+            "datos_diarios": []
+        }
+    
+    rain_days = 0
+    first_rain = None
+    total_periods = len(forecast_data)
+    rain_periods = 0
+    
+    # Umbral para considerar lluvia (en mm)
+    threshold = 1.0
+    
+    # Diccionario para almacenar datos diarios
+    daily_data = {}
+    
+    # Analizar cada período del pronóstico (cada 3 horas durante 5 días)
+    for timestamp, temp, rain_amount in forecast_data.periods():
+        # Obtener fecha
+        date_time = datetime.fromtimestamp(timestamp)
+        date_str = date_time.strftime('%Y-%m-%d')
+        
+        # Si hay lluvia significativa
+        if rain_amount >= threshold:
+            rain_periods += 1
+            
+            # Si es el primer período con lluvia, guardar la fecha
+            if first_rain is None:
+                first_rain = date_time
+        
+        # Agregar o actualizar datos diarios
+        if date_str not in daily_data:
+            daily_data[date_str] = {
+                'fecha': date_time.date(),
+                'min_temp': temp,
+                'max_temp': temp,
+                'precipitacion': rain_amount,
+                'tiene_lluvia': rain_amount >= threshold
+            }
+        else:
+            daily_data[date_str]['min_temp'] = min(daily_data[date_str]['min_temp'], temp)
+            daily_data[date_str]['max_temp'] = max(daily_data[date_str]['max_temp'], temp)
+            daily_data[date_str]['precipitacion'] += rain_amount
+            daily_data[date_str]['tiene_lluvia'] = daily_data[date_str]['tiene_lluvia'] or (rain_amount >= threshold)
+    
+    # Contar días únicos con lluvia
+    for day_data in daily_data.values():
+        if day_data['tiene_lluvia']:
+            rain_days += 1
+    
+    # Convertir diccionario a lista
+    daily_data_list = list(daily_data.values())
+    
+    # Calcular probabilidad de lluvia
+    rain_probability = (rain_periods / total_periods) * 100 if total_periods > 0 else 0
+    
+    return {
+        "lluvia_proximos_dias": rain_periods > 0,
+        "probabilidad_lluvia": round(rain_probability, 1),
+        "dias_con_lluvia": rain_days,
+        "proxima_lluvia": first_rain,
+        "datos_diarios": daily_data_list
+    }
+
+# Función para obtener los datos de varios estados en paralelo
+def fetch_weather_data(estados, api_key, on_progress=None, max_age=None, current=True, on_state=None):
+    """Obtiene clima actual y pronóstico de cada estado usando un pool de hilos.
+    
+    Con `current=False` solo se piden los pronósticos (el clima actual queda en None).
+    Cada elemento incluye en "huellas" la huella del contenido de cada respuesta.
+    `on_state(i, datos_estado)` se llama en cuanto llegan todas las respuestas de un estado.
+    """
+    
+    # Resultados en el mismo orden que la lista de estados
+    datos = [{"current": None, "forecast": None, "huellas": {"current": None, "forecast": None}} for _ in estados]
+    pendientes = [2 if current else 1] * len(estados)
+    completados = 0
+    
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {}
+        # Condiciones actuales en lote para las ubicaciones con ID de ciudad: una tarea por
+        # solicitud /group, para que cada lote complete sus estados en cuanto llega;
+        # las demás se consultan individualmente en el pool
+        por_id = {}
+        for i, estado in enumerate(estados):
+            if current and estado.get("owm_id"):
+                por_id.setdefault(estado["owm_id"], []).append(i)
+        ids = list(por_id)
+        for inicio in range(0, len(ids), GROUP_BATCH_SIZE):
+            lote = [i for owm_id in ids[inicio:inicio + GROUP_BATCH_SIZE] for i in por_id[owm_id]]
+            futures[executor.submit(get_current_weather_bulk, [estados[i] for i in lote], api_key, max_age, True)] = (lote, "current")
+        for i, estado in enumerate(estados):
+            if current and not estado.get("owm_id"):
+                futures[executor.submit(get_current_weather, estado["lat"], estado["lon"], api_key, max_age, True)] = (i, "current")
+            futures[executor.submit(get_forecast, estado["lat"], estado["lon"], api_key, max_age, True)] = (i, "forecast")
+        
+        for future in as_completed(futures):
+            indice, tipo = futures[future]
+            if isinstance(indice, list):
+                indices = indice
+                respuestas = future.result()
+            else:
+                indices = [indice]
+                respuestas = [future.result()]
+            for i, (payload, huella) in zip(indices, respuestas):
+                datos[i][tipo] = payload
+                datos[i]["huellas"][tipo] = huella
+            
+            for i in indices:
+                pendientes[i] -= 1
+                
+                # Un estado está completo cuando llegan sus dos respuestas
+                if pendientes[i] == 0:
+                    completados += 1
+                    if on_state is not None:
+                        on_state(i, datos[i])
+                    if on_progress is not None:
+                        on_progress(completados / len(estados))
+    
+    return datos
+
+# Función para analizar el pronóstico de muchas ubicaciones a la vez
+def analyze_rain_forecast_batch(forecasts, threshold=1.0):
+    """Versión vectorizada de analyze_rain_forecast para una lista de pronósticos"""
+    
+    # Construir una tabla columnar (ubicación, dt, temp, lluvia 3h) con todos los períodos
+    loc_ids, timestamps, temps, rains = [], [], [], []
+    for i, forecast_data in enumerate(forecasts):
+        forecast_data = forecast_arrays(forecast_data)
+        if forecast_data is None:
+            continue
+        loc_ids.append(np.full(len(forecast_data), i, dtype=np.int64))
+        timestamps.append(forecast_data.dt)
+        temps.append(forecast_data.temp)
+        rains.append(forecast_data.rain_3h)
+    
+    tabla = pd.DataFrame({
+        "location": np.concatenate(loc_ids or [np.empty(0)]).astype(np.int64, copy=False),
+        "dt": np.concatenate(timestamps or [np.empty(0)]).astype(np.int64, copy=False),
+        "temp": np.concatenate(temps or [np.empty(0)]).astype(np.float64, copy=False),
+        "rain_3h": np.concatenate(rains or [np.empty(0)]).astype(np.float64, copy=False)
+    })
+    
+    n = len(forecasts)
+    loc = tabla["location"].to_numpy()
+    rain = tabla["rain_3h"].to_numpy()
+    temp = tabla["temp"].to_numpy()
+    lluvia = rain >= threshold
+    
+    # Los pronósticos comparten los mismos instantes de 3 horas: convertir solo los valores únicos
+    dt_unicos, dt_idx = np.unique(tabla["dt"].to_numpy(), return_inverse=True)
+    fechas_hora = [datetime.fromtimestamp(ts) for ts in dt_unicos]
+    dias_unicos = np.array([f.toordinal() for f in fechas_hora], dtype=np.int64)
+    
+    # Totales por ubicación
+    total_periods = np.bincount(loc, minlength=n)
+    rain_periods = np.bincount(loc, weights=lluvia, minlength=n).astype(np.int64)
+    
+    # Primer período con lluvia de cada ubicación (las filas conservan el orden del pronóstico)
+    locs_lluvia, primera_fila = np.unique(loc[lluvia], return_index=True)
+    first_rain = dict(zip(locs_lluvia.tolist(), dt_idx[lluvia][primera_fila].tolist()))
+    
+    # Agrupar por (ubicación, día) en orden de aparición, como el diccionario diario original
+    dias = dias_unicos[dt_idx]
+    rango_dias = int(dias.max() - dias.min()) + 1 if len(dias) else 1
+    clave = loc * rango_dias + (dias - (dias.min() if len(dias) else 0))
+    grupo, claves = pd.factorize(clave, sort=False)
+    n_grupos = len(claves)
+    primera_fila_grupo = np.unique(grupo, return_index=True)[1]
+    grupo_loc = loc[primera_fila_grupo]
+    grupo_dt = dt_idx[primera_fila_grupo]
+    
+    min_temp = np.full(n_grupos, np.inf)
+    max_temp = np.full(n_grupos, -np.inf)
+    precipitacion = np.zeros(n_grupos)
+    np.minimum.at(min_temp, grupo, temp)
+    np.maximum.at(max_temp, grupo, temp)
+    # np.add.at suma en el orden de las filas, igual que la acumulación período a período
+    np.add.at(precipitacion, grupo, rain)
+    tiene_lluvia = np.bincount(grupo, weights=lluvia, minlength=n_grupos) > 0
+    rain_days = np.bincount(grupo_loc, weights=tiene_lluvia, minlength=n).astype(np.int64)
+    
+    # Reconstruir los datos diarios de cada ubicación
+    datos_diarios = [[] for _ in range(n)]
+    for g, i in enumerate(grupo_loc.tolist()):
+        datos_diarios[i].append({
+            'fecha': fechas_hora[grupo_dt[g]].date(),
+            'min_temp': float(min_temp[g]),
+            'max_temp': float(max_temp[g]),
+            'precipitacion': float(precipitacion[g]),
+            'tiene_lluvia': bool(tiene_lluvia[g])
+        })
+    
+    resultados = []
+    for i in range(n):
+        total = int(total_periods[i])
+        lluvias = int(rain_periods[i])
+        rain_probability = (lluvias / total) * 100 if total > 0 else 0
+        resultados.append({
+            "lluvia_proximos_dias": lluvias > 0,
+            "probabilidad_lluvia": round(rain_probability, 1),
+            "dias_con_lluvia": int(rain_days[i]),
+            "proxima_lluvia": fechas_hora[first_rain[i]] if i in first_rain else None,
+            "datos_diarios": datos_diarios[i]
+        })
+    
+    return resultados
+
+# Datos de los estados de México (nombre, latitud, longitud).
+# owm_id es el ID de ciudad de OpenWeather (GeoNames) más cercano a cada coordenada
+# y se usa para consultar las condiciones actuales en lote
+estados_mexico = [
+    {"nombre": "Aguascalientes", "lat": 21.8818, "lon": -102.2916, "region": "Centro", "owm_id": 4019233},
+    {"nombre": "Baja California", "lat": 30.8406, "lon": -115.2838, "region": "Norte", "owm_id": 3987224},
+    {"nombre": "Baja California Sur", "lat": 26.0444, "lon": -111.6661, "region": "Norte", "owm_id": 4013723},
+    {"nombre": "Campeche", "lat": 19.8301, "lon": -90.5349, "region": "Sur", "owm_id": 3531732},
+    {"nombre": "Chiapas", "lat": 16.7569, "lon": -93.1292, "region": "Sur", "owm_id": 3515001},
+    {"nombre": "Chihuahua", "lat": 28.6353, "lon": -106.0889, "region": "Norte", "owm_id": 4014338},
+    {"nombre": "Ciudad de México", "lat": 19.4326, "lon": -99.1332, "region": "Centro", "owm_id": 3530597},
+    {"nombre": "Coahuila", "lat": 27.0587, "lon": -101.7068, "region": "Norte", "owm_id": 3987500},
+    {"nombre": "Colima", "lat": 19.2452, "lon": -103.7241, "region": "Centro", "owm_id": 4013516},
+    {"nombre": "Durango", "lat": 24.0277, "lon": -104.6532, "region": "Norte", "owm_id": 4011743},
+    {"nombre": "Estado de México", "lat": 19.4969, "lon": -99.7233, "region": "Centro", "owm_id": 3518138},
+    {"nombre": "Guanajuato", "lat": 20.9170, "lon": -101.1617, "region": "Centro", "owm_id": 4005270},
+    {"nombre": "Guerrero", "lat": 17.4392, "lon": -99.5451, "region": "Sur", "owm_id": 3530870},
+    {"nombre": "Hidalgo", "lat": 20.0911, "lon": -98.7624, "region": "Centro", "owm_id": 3522210},
+    {"nombre": "Jalisco", "lat": 20.6595, "lon": -103.3494, "region": "Centro", "owm_id": 4005539},
+    {"nombre": "Michoacán", "lat": 19.5665, "lon": -101.7068, "region": "Centro", "owm_id": 3993179},
+    {"nombre": "Morelos", "lat": 18.6813, "lon": -99.1013, "region": "Centro", "owm_id": 3515373},
+    {"nombre": "Nayarit", "lat": 21.7514, "lon": -104.8455, "region": "Centro", "owm_id": 3981941},
+    {"nombre": "Nuevo León", "lat": 25.5922, "lon": -99.9962, "region": "Norte", "owm_id": 3531862},
+    {"nombre": "Oaxaca", "lat": 17.0732, "lon": -96.7266, "region": "Sur", "owm_id": 3522507},
+    {"nombre": "Puebla", "lat": 19.0414, "lon": -98.2063, "region": "Centro", "owm_id": 3521081},
+    {"nombre": "Querétaro", "lat": 20.5888, "lon": -100.3899, "region": "Centro", "owm_id": 3991164},
+    {"nombre": "Quintana Roo", "lat": 19.1817, "lon": -88.4791, "region": "Sur", "owm_id": 3527639},
+    {"nombre": "San Luis Potosí", "lat": 22.1565, "lon": -100.9855, "region": "Centro", "owm_id": 3985606},
+    {"nombre": "Sinaloa", "lat": 25.1721, "lon": -107.4795, "region": "Norte", "owm_id": 4012176},
+    {"nombre": "Sonora", "lat": 29.2970, "lon": -110.3309, "region": "Norte", "owm_id": 4004898},
+    {"nombre": "Tabasco", "lat": 17.8409, "lon": -92.6189, "region": "Sur", "owm_id": 3523791},
+    {"nombre": "Tamaulipas", "lat": 24.2669, "lon": -98.8363, "region": "Norte", "owm_id": 3530580},
+    {"nombre": "Tlaxcala", "lat": 19.3139, "lon": -98.2404, "region": "Centro", "owm_id": 3815415},
+    {"nombre": "Veracruz", "lat": 19.1738, "lon": -96.1342, "region": "Sur", "owm_id": 3514783},
+    {"nombre": "Yucatán", "lat": 20.7099, "lon": -89.0943, "region": "Sur", "owm_id": 3526662},
+    {"nombre": "Zacatecas", "lat": 22.7709, "lon": -102.5832, "region": "Centro", "owm_id": 3979844}
+]
+
+# Función para obtener la API key fuera de Streamlit
+def get_api_key():
+    """Lee la API key de OpenWeather de la variable de entorno OPENWEATHER_API_KEY"""
+    
+    api_key = os.environ.get("OPENWEATHER_API_KEY")
+    if not api_key:
+        raise RuntimeError("Falta la variable de entorno OPENWEATHER_API_KEY")
+    return api_key
+
+# Función para armar la fila de resultados de una ubicación
+def result_row(estado, current_data, rain_analysis):
+    """Fila del snapshot a partir del clima actual y del análisis de lluvia de una ubicación"""
+    
+    # Obtener información actual
+    temp_actual = None
+    clima_actual = None
+    humedad_actual = None
+    presion_actual = None
+    viento_actual = None
+    icon_code = None
+    
+    if current_data and 'main' in current_data:
+        temp_actual = current_data['main'].get('temp')
+        humedad_actual = current_data['main'].get('humidity')
+        presion_actual = current_data['main'].get('pressure')
+        
+        if 'wind' in current_data:
+            viento_actual = current_data['wind'].get('speed')
+        
+        if 'weather' in current_data and len(current_data['weather']) > 0:
+            clima_actual = current_data['weather'][0].get('description')
+            icon_code = current_data['weather'][0].get('icon')
+    
+    return {
+        "nombre": estado["nombre"],
+        "region": estado["region"],
+        "lat": estado["lat"],
+        "lon": estado["lon"],
+        "temp_actual": temp_actual,
+        "clima_actual": clima_actual,
+        "humedad_actual": humedad_actual,
+        "presion_actual": presion_actual,
+        "viento_actual": viento_actual,
+        "icon_code": icon_code,
+        "lluvia_proximos_dias": rain_analysis["lluvia_proximos_dias"],
+        "probabilidad_lluvia": rain_analysis["probabilidad_lluvia"],
+        "dias_con_lluvia": rain_analysis["dias_con_lluvia"],
+        "proxima_lluvia": rain_analysis["proxima_lluvia"]
+    }
+
+class IncrementalResults:
+    """Análisis y fila de cada ubicación en la última actualización, con las huellas de sus respuestas.
+    
+    Mientras la huella del pronóstico de una ubicación no cambie se reutiliza su análisis, y si
+    tampoco cambia la del clima actual se reutiliza la misma fila (el mismo objeto), lo que permite
+    a Snapshot conservar los DataFrames y agregados de las filas que no cambiaron.
+    """
+    
+    def __init__(self):
+        self._entradas = {}
+        self._lock = threading.Lock()
+        # Último snapshot construido, base para actualizar el siguiente por diferencias
+        self.ultimo = None
+    
+    @staticmethod
+    def _clave(estado):
+        return (estado["nombre"], estado["region"], estado["lat"], estado["lon"])
+    
+    def previous(self, estados):
+        """Entradas anteriores de cada ubicación (None si no hay)"""
+        
+        with self._lock:
+            return [self._entradas.get(self._clave(estado)) for estado in estados]
+    
+    def update(self, estados, datos_api, analisis, results, snapshot):
+        """Reemplaza las entradas por las de la actualización más reciente"""
+        
+        entradas = {
+            self._clave(estado): {
+                "current": datos_estado["huellas"]["current"],
+                "forecast": datos_estado["huellas"]["forecast"],
+                "analisis": rain_analysis,
+                "fila": fila
+            }
+            for estado, datos_estado, rain_analysis, fila in zip(estados, datos_api, analisis, results)
+        }
+        with self._lock:
+            self._entradas = entradas
+            self.ultimo = snapshot
+    
+    def clear(self):
+        with self._lock:
+            self._entradas = {}
+            self.ultimo = None
+
+# Resultados reutilizables entre actualizaciones del proceso
+@lru_cache(maxsize=None)
+def get_incremental_results():
+    """Devuelve el registro de análisis y filas por ubicación del proceso"""
+    
+    return IncrementalResults()
+
+# Niveles de riesgo de sequía y alertas del proceso
+@lru_cache(maxsize=None)
+def get_alert_engine():
+    """Devuelve el motor de alertas de sequía del proceso"""
+    
+    return AlertEngine()
+
+# Estadísticas móviles (24 horas, 7 días, 30 días) de las actualizaciones del proceso
+@lru_cache(maxsize=None)
+def get_rolling_stats():
+    """Devuelve las estadísticas móviles del proceso"""
+    
+    return RollingStats()
+
+# Función para construir el snapshot completo de una lista de ubicaciones
+def build_snapshot(api_key, estados=None, on_progress=None, max_age=None, history=None, incremental=True,
+                   on_partial=None):
+    """Obtiene y analiza los datos de los estados (todos por defecto) y arma las filas de resultados.
+    
+    Si se pasa un HistoryStore, el lote se agrega al historial y se actualizan los días secos.
+    Con `incremental` solo se analizan los pronósticos cuyo contenido cambió desde la
+    actualización anterior y el snapshot se arma por diferencias con el anterior.
+    Con `on_partial(fila, datos_diarios)` cada estado se analiza en cuanto llegan sus
+    respuestas y su fila se entrega antes de que termine la descarga de los demás.
+    """
+    
+    if estados is None:
+        estados = estados_mexico
+    
+    registro = get_incremental_results() if incremental else None
+    previas = registro.previous(estados) if registro is not None else [None] * len(estados)
+    
+    results = []
+    datos_diarios_por_estado = {}
+    errores = []
+    analisis = [None] * len(estados)
+    filas_parciales = {}
+    
+    def cambio(i, datos_estado, tipo):
+        previa = previas[i]
+        return previa is None or previa[tipo] != datos_estado["huellas"][tipo]
+    
+    def fila(i, datos_estado):
+        # Reutilizar la fila si no cambió ninguna de las dos respuestas
+        if not cambio(i, datos_estado, "forecast") and not cambio(i, datos_estado, "current"):
+            return previas[i]["fila"]
+        return result_row(estados[i], datos_estado["current"], analisis[i])
+    
+    # Análisis y fila de cada estado en cuanto llegan sus respuestas (solo con on_partial)
+    def on_state(i, datos_estado):
+        if cambio(i, datos_estado, "forecast"):
+            analisis[i] = analyze_rain_forecast(datos_estado["forecast"])
+        else:
+            analisis[i] = previas[i]["analisis"]
+        filas_parciales[i] = fila(i, datos_estado)
+        on_partial(filas_parciales[i], analisis[i]["datos_diarios"])
+    
+    # Obtener datos actuales y pronósticos en paralelo
+    with metrics.stage("fetch"):
+        datos_api = fetch_weather_data(estados, api_key, on_progress=on_progress, max_age=max_age,
+                                       on_state=on_state if on_partial is not None else None)
+    
+    # Analizar en una sola pasada los pronósticos nuevos o que cambiaron (los que aún no se analizaron)
+    with metrics.stage("analisis"):
+        cambiados = [i for i, datos_estado in enumerate(datos_api) if cambio(i, datos_estado, "forecast")]
+        pendientes = [i for i in cambiados if analisis[i] is None]
+        for i, rain_analysis in zip(pendientes, analyze_rain_forecast_batch([datos_api[i]["forecast"] for i in pendientes])):
+            analisis[i] = rain_analysis
+        for i, previa in enumerate(previas):
+            if analisis[i] is None:
+                analisis[i] = previa["analisis"]
+    metrics.increment("analysis_rows_total", len(cambiados), resultado="changed")
+    metrics.increment("analysis_rows_total", len(estados) - len(cambiados), resultado="reused")
+    
+    inicio = time.perf_counter()
+    for i, (estado, datos_estado, rain_analysis) in enumerate(zip(estados, datos_api, analisis)):
+        current_data = datos_estado["current"]
+        
+        if current_data is None or datos_estado["forecast"] is None:
+            errores.append(estado["nombre"])
+        
+        # Guardar datos diarios por estado
+        datos_diarios_por_estado[estado["nombre"]] = rain_analysis["datos_diarios"]
+        
+        results.append(filas_parciales[i] if i in filas_parciales else fila(i, datos_estado))
+    
+    metrics.observe("stage_seconds", time.perf_counter() - inicio, etapa="filas")
+    
+    timestamp = datetime.now()
+    
+    # Agregar el lote al historial y obtener los días secos consecutivos por estado
+    dias_secos = None
+    if history is not None:
+        with metrics.stage("historial"):
+            dias_secos = history.append_batch(estados, datos_api, emitido=timestamp.timestamp())
+    
+    with metrics.stage("dataframes"):
+        base = registro.ultimo if registro is not None else None
+        snapshot = Snapshot(results, datos_diarios_por_estado, timestamp=timestamp, errores=errores,
+                            dias_secos=dias_secos, base=base)
+    
+    # Riesgo de sequía de todas las ubicaciones y alertas por cambio de nivel
+    # (con historial, los niveles y las últimas alertas se comparten con otros procesos y reinicios)
+    with metrics.stage("riesgo"):
+        motor = get_alert_engine()
+        if history is not None:
+            motor.restore(*history.risk_state())
+        snapshot.riesgo, snapshot.alertas = motor.evaluate(snapshot.df_estados, dias_secos, timestamp)
+        if history is not None:
+            history.save_risk_state(*motor.state(snapshot.df_estados["nombre"]))
+    
+    # Agregar las filas a las estadísticas móviles y tomar la vista de esta actualización
+    with metrics.stage("estadisticas"):
+        rolling = get_rolling_stats()
+        rolling.update(snapshot.df_estados, timestamp)
+        snapshot.tendencias = rolling.view()
+    
+    if registro is not None:
+        registro.update(estados, datos_api, analisis, results, snapshot)
+    return snapshot
+
+
+# Función para leer una lista de ubicaciones desde un archivo JSON
+def load_locations(path):
+    """Lee una lista de ubicaciones ({"nombre", "lat", "lon", "region"}) desde un archivo JSON"""
+    
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos"""
+    
+    parser = argparse.ArgumentParser(description="Genera el snapshot de probabilidad de lluvia por estado")
+    parser.add_argument("--out-dir", default="snapshot", help="Directorio de salida")
+    parser.add_argument("--format", choices=["parquet", "json"], default="parquet", help="Formato de salida")
+    parser.add_argument("--locations", help="Archivo JSON con las ubicaciones (por defecto, los 32 estados)")
+    parser.add_argument("--region", choices=["Norte", "Centro", "Sur"], help="Procesar solo una región")
+    parser.add_argument("--max-age", type=int, default=None, help="Edad máxima en segundos de las respuestas en caché")
+    parser.add_argument("--history-dir", help="Directorio del historial donde agregar el lote")
+    parser.add_argument("--compact", action="store_true", help="Compactar las particiones antiguas del historial")
+    parser.add_argument("--metrics", choices=["log", "prometheus"], help="Medir las etapas y escribir las métricas al terminar")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.metrics:
+        metrics.enable()
+    
+    estados = load_locations(args.locations) if args.locations else estados_mexico
+    if args.region:
+        estados = [estado for estado in estados if estado["region"] == args.region]
+    
+    history = HistoryStore(args.history_dir) if args.history_dir else None
+    snapshot = build_snapshot(get_api_key(), estados, max_age=args.max_age, history=history)
+    
+    if history is not None and args.compact:
+        logger.info(f"Particiones compactadas: {history.compact()}")
+    rutas = save_snapshot(snapshot, args.out_dir, fmt=args.format)
+    
+    for ruta in rutas:
+        logger.info(f"Snapshot guardado en {ruta}")
+    for alerta in snapshot.alertas.itertuples():
+        logger.warning(f"Alerta de sequía: {alerta.nombre} pasó de riesgo {alerta.nivel_anterior} a {alerta.nivel} "
+                       f"(índice {alerta.indice_riesgo})")
+    logger.info(f"Uso de la API: {get_scheduler().stats()}")
+    if args.metrics == "log":
+        metrics.log_metrics(logger)
+    elif args.metrics == "prometheus":
+        sys.stdout.write(metrics.prometheus_text())
+    if snapshot.errores:
+        logger.warning("Sin datos completos para: " + ", ".join(snapshot.errores))
+    
+    return 0 if len(snapshot.errores) < len(estados) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from urllib.parse import urlsplit
+
+import requests
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Cuota por minuto del plan gratuito de OpenWeather
+DEFAULT_CALLS_PER_MINUTE = int(os.environ.get("OPENWEATHER_CALLS_PER_MINUTE", 60))
+
+# Tiempos máximos de conexión y de lectura (segundos)
+DEFAULT_TIMEOUT = (5, 15)
+
+# Reintentos ante errores temporales (timeouts, 429 y 5xx)
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 30
+
+# Códigos HTTP que vale la pena reintentar
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class RequestError(Exception):
+    """Error definitivo de una solicitud después de agotar los reintentos"""
+
+    def __init__(self, mensaje, status_code=None, text=None):
+        super().__init__(mensaje)
+        self.status_code = status_code
+        self.text = text
+
+
+class TokenBucket:
+    """Limitador de tasa: `rate` fichas por segundo con capacidad máxima `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Toma una ficha, esperando si hace falta; devuelve los segundos esperados"""
+
+        esperado = 0.0
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (ahora - self._updated) * self.rate)
+                self._updated = ahora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return esperado
+                espera = (1 - self._tokens) / self.rate
+            time.sleep(espera)
+            esperado += espera
+
+
+class RequestScheduler:
+    """Planificador de solicitudes a OpenWeather.
+
+    Limita la tasa con un token bucket, une las solicitudes idénticas que están en curso
+    (single-flight), reintenta con backoff exponencial con jitter y usa timeouts explícitos.
+    """
+
+    def __init__(self, session, calls_per_minute=DEFAULT_CALLS_PER_MINUTE, burst=None,
+                 timeout=DEFAULT_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_base=DEFAULT_BACKOFF_BASE, backoff_max=DEFAULT_BACKOFF_MAX):
+        self.session = session
+        self.calls_per_minute = calls_per_minute
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Ráfaga + reposición en 60 s no superan la cuota por minuto en ninguna ventana
+        burst = burst or max(1, calls_per_minute // 6)
+        self._bucket = TokenBucket(max(calls_per_minute - burst, 1) / 60.0, burst)
+        self._en_curso = {}
+        self._lock = threading.Lock()
+        self._llamadas = deque()
+        self._contadores = {
+            "solicitudes": 0,
+            "enviadas": 0,
+            "exitosas": 0,
+            "fallidas": 0,
+            "reintentos": 0,
+            "respuestas_429": 0,
+            "coalescidas": 0,
+            "espera_limitador_s": 0.0
+        }
+
+    def _incrementar(self, contador, valor=1):
+        with self._lock:
+            self._contadores[contador] += valor
+
+    def get_json(self, url, parse=None):
+        """Devuelve el JSON de `url`; si ya hay una solicitud idéntica en curso, espera su resultado.
+
+        Con `parse` se devuelve parse(contenido en bytes) en lugar de response.json().
+        """
+
+        clave = (url, parse)
+        with self._lock:
+            self._contadores["solicitudes"] += 1
+            future = self._en_curso.get(clave)
+            propia = future is None
+            if propia:
+                future = Future()
+                self._en_curso[clave] = future
+            else:
+                self._contadores["coalescidas"] += 1
+
+        if not propia:
+            return future.result()
+
+        try:
+            resultado = self._send(url, parse)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(resultado)
+            return resultado
+        finally:
+            with self._lock:
+                self._en_curso.pop(clave, None)
+
+    def _backoff(self, intento, retry_after=None):
+        """Espera antes de un reintento (backoff exponencial con jitter completo)"""
+
+        espera = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** intento))
+        if retry_after is not None:
+            espera = max(espera, retry_after)
+        time.sleep(espera)
+
+    def _send(self, url, parse=None):
+        for intento in range(self.max_retries + 1):
+            self._incrementar("espera_limitador_s", self._bucket.acquire())
+            with self._lock:
+                self._contadores["enviadas"] += 1
+                self._llamadas.append(time.time())
+
+            retry_after = None
+            inicio = time.perf_counter()
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                error = RequestError(f"Error en la solicitud: {e}")
+                if metrics.ENABLED:
+                    endpoint = urlsplit(url).path.rsplit("/", 1)[-1]
+                    metrics.increment("upstream_requests_total", endpoint=endpoint, codigo="error")
+            else:
+                if metrics.ENABLED:
+                    endpoint = urlsplit(url).path.rsplit("/", 1)[-1]
+                    metrics.observe("upstream_latency_seconds", time.perf_counter() - inicio, endpoint=endpoint)
+                    metrics.increment("upstream_requests_total", endpoint=endpoint, codigo=response.status_code)
+                if response.status_code == 200:
+                    self._incrementar("exitosas")
+                    if parse is not None:
+                        return parse(response.content)
+                    return response.json()
+                error = RequestError(
+                    f"{response.status_code} - {response.text}",
+                    status_code=response.status_code,
+                    text=response.text
+                )
+                if response.status_code == 429:
+                    self._incrementar("respuestas_429")
+                    try:
+                        retry_after = float(response.headers.get("Retry-After", ""))
+                    except ValueError:
+                        retry_after = None
+                if response.status_code not in RETRY_STATUS:
+                    break
+
+            if intento < self.max_retries:
+                self._incrementar("reintentos")
+                logger.warning(f"Reintentando solicitud ({intento + 1}/{self.max_retries}): {error}")
+                self._backoff(intento, retry_after)
+
+        self._incrementar("fallidas")
+        raise error
+
+    def stats(self):
+        """Contadores del planificador y uso de la cuota en el último minuto"""
+
+        with self._lock:
+            limite = time.time() - 60
+            while self._llamadas and self._llamadas[0] < limite:
+                self._llamadas.popleft()
+            stats = dict(self._contadores)
+            stats["llamadas_ultimo_minuto"] = len(self._llamadas)
+        stats["cuota_por_minuto"] = self.calls_per_minute
+        stats["uso_cuota_pct"] = round(100 * stats["llamadas_ultimo_minuto"] / self.calls_per_minute, 1)
+        return stats
@@ -0,0 +1,453 @@
+"""Estadísticas móviles (24 horas, 7 días, 30 días) de las filas de cada actualización.
+
+Las filas de cada actualización se agregan por estado y por región en la cubeta de su hora.
+Los momentos (conteo, media, suma de cuadrados y co-momentos centrados) se combinan con las
+fórmulas de Welford/Chan, así que el total de cada ventana se mantiene sumando cada lote
+nuevo y restando las cubetas que salen de la ventana, sin volver a recorrer el historial.
+
+Los momentos de las regiones son por pares de columnas, de modo que la correlación ignora
+los valores faltantes por par como DataFrame.corr(); los de cada estado son por columna.
+Los histogramas por región dan la distribución y aproximan los percentiles.
+"""
+
+import math
+import threading
+
+import numpy as np
+import pandas as pd
+
+from aggregates import CORRELATION_COLUMNS
+
+# Ventanas disponibles (nombre -> segundos)
+ROLLING_WINDOWS = {
+    "24 h": 24 * 3600,
+    "7 días": 7 * 24 * 3600,
+    "30 días": 30 * 24 * 3600
+}
+
+# Duración de cada cubeta (segundos)
+BUCKET_SECONDS = 3600
+
+# Restas de cubetas tras las cuales el total de una ventana se recalcula desde sus cubetas
+# (acota el error de redondeo acumulado)
+REBUILD_EVERY = 7 * 24
+
+# Bordes de los histogramas por columna; los valores fuera de rango caen en el primer o último intervalo
+HISTOGRAM_BINS = {
+    "temp_actual": np.arange(-10, 51, 1.0),
+    "humedad_actual": np.arange(0, 101, 2.0),
+    "probabilidad_lluvia": np.arange(0, 101, 5.0)
+}
+
+# Columnas de las estadísticas descriptivas
+DESCRIBE_COLUMNS = list(HISTOGRAM_BINS)
+
+
+class _Grupos:
+    """Filas ordenadas por grupo para reducir cada grupo con ufunc.reduceat"""
+
+    def __init__(self, grupos, n_grupos):
+        self.n_grupos = n_grupos
+        self.orden = np.argsort(grupos, kind="stable")
+        ordenados = grupos[self.orden]
+        self.inicios = np.flatnonzero(np.r_[True, ordenados[1:] != ordenados[:-1]]) if len(grupos) else np.empty(0, dtype=np.intp)
+        self.presentes = ordenados[self.inicios]
+
+    def reduce(self, ufunc, valores, vacio=0.0):
+        resultado = np.full((self.n_grupos,) + valores.shape[1:], vacio)
+        if len(self.inicios):
+            resultado[self.presentes] = ufunc.reduceat(valores[self.orden], self.inicios, axis=0)
+        return resultado
+
+
+def _ampliar(array, n_grupos, vacio=0.0):
+    """Agrega grupos vacíos al final del primer eje hasta tener `n_grupos`"""
+
+    if array is None or len(array) >= n_grupos:
+        return array
+    relleno = np.full((n_grupos - len(array),) + array.shape[1:], vacio)
+    return np.concatenate([array, relleno])
+
+
+class Moments:
+    """Momentos centrados por grupo, inmutables (merge y subtract devuelven objetos nuevos).
+
+    Por pares los arrays son (grupos, k, k) y la celda [g, i, j] corresponde a las filas del
+    grupo g con las columnas i y j presentes: su conteo, la media y la suma de cuadrados
+    centrados de la columna i, y el co-momento de i y j. Por columna son (grupos, k).
+    """
+
+    __slots__ = ("n", "media", "m2", "co")
+
+    def __init__(self, n, media, m2, co=None):
+        self.n = n
+        self.media = media
+        self.m2 = m2
+        self.co = co
+
+    @classmethod
+    def zeros(cls, n_grupos, k, pares):
+        forma = (n_grupos, k, k) if pares else (n_grupos, k)
+        return cls(np.zeros(forma), np.zeros(forma), np.zeros(forma), np.zeros(forma) if pares else None)
+
+    @classmethod
+    def from_rows(cls, x, grupos, pares):
+        """Momentos de las filas `x` (n, k) por grupo, con una pasada para la media y otra para los centrados"""
+
+        presentes = ~np.isnan(x)
+        if pares:
+            mascara = presentes[:, :, None] & presentes[:, None, :]
+            valores = np.broadcast_to(x[:, :, None], mascara.shape)
+        else:
+            mascara, valores = presentes, x
+
+        n = grupos.reduce(np.add, mascara.astype(np.float64))
+        suma = grupos.reduce(np.add, np.where(mascara, valores, 0.0))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            media = np.where(n > 0, suma / n, 0.0)
+
+        centrados = np.where(mascara, valores - media[_grupo_de_cada_fila(grupos, len(x))], 0.0)
+        m2 = grupos.reduce(np.add, centrados * centrados)
+        co = grupos.reduce(np.add, centrados * np.swapaxes(centrados, 1, 2)) if pares else None
+        return cls(n, media, m2, co)
+
+    def _igualar(self, otro):
+        n_grupos = max(len(self.n), len(otro.n))
+        return (
+            Moments(*(_ampliar(a, n_grupos) for a in (self.n, self.media, self.m2, self.co))),
+            Moments(*(_ampliar(a, n_grupos) for a in (otro.n, otro.media, otro.m2, otro.co)))
+        )
+
+    def merge(self, otro):
+        """Momentos de la unión de las filas de self y de `otro` (fórmula de Chan)"""
+
+        a, b = self._igualar(otro)
+        n = a.n + b.n
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fraccion = np.where(n > 0, b.n / n, 0.0)
+        delta = b.media - a.media
+        co = None
+        if a.co is not None:
+            co = a.co + b.co + delta * np.swapaxes(delta, -1, -2) * a.n * fraccion
+        return Moments(n, a.media + delta * fraccion, a.m2 + b.m2 + delta * delta * a.n * fraccion, co)
+
+    def subtract(self, otro):
+        """Momentos tras quitar las filas de `otro`, que deben formar parte de self"""
+
+        a, b = self._igualar(otro)
+        n = a.n - b.n
+        vacios = n < 0.5
+        with np.errstate(invalid="ignore", divide="ignore"):
+            media = np.where(vacios, 0.0, (a.n * a.media - b.n * b.media) / n)
+            fraccion = np.where(vacios, 0.0, b.n / a.n)
+        delta = b.media - media
+        m2 = np.where(vacios, 0.0, np.maximum(a.m2 - b.m2 - delta * delta * n * fraccion, 0.0))
+        co = None
+        if a.co is not None:
+            co = np.where(vacios, 0.0, a.co - b.co - delta * np.swapaxes(delta, -1, -2) * n * fraccion)
+        return Moments(np.where(vacios, 0.0, n), media, m2, co)
+
+    def combine(self, indices):
+        """Momentos (un solo grupo) de la unión de los grupos indicados"""
+
+        resultado = None
+        for g in indices:
+            if g >= len(self.n):
+                continue
+            grupo = Moments(*(a[g:g + 1] if a is not None else None for a in (self.n, self.media, self.m2, self.co)))
+            resultado = grupo if resultado is None else resultado.merge(grupo)
+        if resultado is None:
+            return Moments.zeros(1, self.n.shape[-1], self.co is not None)
+        return resultado
+
+
+def _grupo_de_cada_fila(grupos, n_filas):
+    """Grupo de cada fila en el orden original"""
+
+    resultado = np.empty(n_filas, dtype=np.intp)
+    if n_filas:
+        tamanos = np.diff(np.r_[grupos.inicios, n_filas])
+        resultado[grupos.orden] = np.repeat(grupos.presentes, tamanos)
+    return resultado
+
+
+class _Cubeta:
+    """Estadísticas de un conjunto de filas: momentos por estado y por región, histogramas,
+    filas, mínimos y máximos por región"""
+
+    __slots__ = ("estados", "regiones", "filas", "histogramas", "minimos", "maximos")
+
+    def __init__(self, estados, regiones, filas, histogramas, minimos=None, maximos=None):
+        self.estados = estados
+        self.regiones = regiones
+        self.filas = filas
+        self.histogramas = histogramas
+        self.minimos = minimos
+        self.maximos = maximos
+
+    @classmethod
+    def from_rows(cls, x, posiciones_estado, n_estados, posiciones_region, n_regiones, columnas):
+        por_estado = _Grupos(posiciones_estado, n_estados)
+        por_region = _Grupos(posiciones_region, n_regiones)
+
+        histogramas = {}
+        for columna, bordes in HISTOGRAM_BINS.items():
+            valores = x[:, columnas.index(columna)]
+            validos = ~np.isnan(valores)
+            intervalo = np.clip(np.searchsorted(bordes, valores[validos], side="right") - 1, 0, len(bordes) - 2)
+            conteos = np.bincount(posiciones_region[validos] * (len(bordes) - 1) + intervalo,
+                                  minlength=n_regiones * (len(bordes) - 1))
+            histogramas[columna] = conteos.reshape(n_regiones, len(bordes) - 1).astype(np.float64)
+
+        return cls(
+            Moments.from_rows(x, por_estado, pares=False),
+            Moments.from_rows(x, por_region, pares=True),
+            np.bincount(posiciones_region, minlength=n_regiones).astype(np.float64),
+            histogramas,
+            por_region.reduce(np.fmin, x, vacio=np.nan),
+            por_region.reduce(np.fmax, x, vacio=np.nan)
+        )
+
+    @classmethod
+    def empty(cls, n_estados, n_regiones, k):
+        histogramas = {c: np.zeros((n_regiones, len(b) - 1)) for c, b in HISTOGRAM_BINS.items()}
+        return cls(Moments.zeros(n_estados, k, False), Moments.zeros(n_regiones, k, True), np.zeros(n_regiones), histogramas)
+
+    def _combinar(self, otra, signo):
+        n_regiones = max(len(self.filas), len(otra.filas))
+        operar = Moments.merge if signo > 0 else Moments.subtract
+        histogramas = {
+            c: np.maximum(_ampliar(h, n_regiones) + signo * _ampliar(otra.histogramas[c], n_regiones), 0.0)
+            for c, h in self.histogramas.items()
+        }
+        extremos = (None, None)
+        if signo > 0 and self.minimos is not None and otra.minimos is not None:
+            extremos = (
+                np.fmin(_ampliar(self.minimos, n_regiones, np.nan), _ampliar(otra.minimos, n_regiones, np.nan)),
+                np.fmax(_ampliar(self.maximos, n_regiones, np.nan), _ampliar(otra.maximos, n_regiones, np.nan))
+            )
+        return _Cubeta(
+            operar(self.estados, otra.estados),
+            operar(self.regiones, otra.regiones),
+            np.maximum(_ampliar(self.filas, n_regiones) + signo * _ampliar(otra.filas, n_regiones), 0.0),
+            histogramas,
+            *extremos
+        )
+
+    def merge(self, otra):
+        return self._combinar(otra, 1)
+
+    def subtract(self, otra):
+        return self._combinar(otra, -1)
+
+
+def _posiciones(registro, nombres):
+    """Posición de cada nombre en `registro` (dict nombre -> posición), agregando los nuevos"""
+
+    for nombre in pd.unique(nombres):
+        if nombre not in registro:
+            registro[nombre] = len(registro)
+    return np.fromiter((registro[nombre] for nombre in nombres), dtype=np.intp, count=len(nombres))
+
+
+class RollingStats:
+    """Totales por ventana de las filas agregadas con update(), actualizados por cubetas.
+
+    update() suma el lote a la cubeta de su hora y al total de cada ventana, y resta del total
+    las cubetas que quedaron fuera. view() devuelve una vista inmutable para consultar
+    correlaciones, estadísticas e histogramas sin recorrer las filas.
+    """
+
+    def __init__(self, windows=ROLLING_WINDOWS, bucket_seconds=BUCKET_SECONDS, columns=CORRELATION_COLUMNS):
+        self.windows = dict(windows)
+        self.bucket_seconds = bucket_seconds
+        self.columns = list(columns)
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._estados = {}
+            self._regiones = {}
+            self._cubetas = {}
+            self._ultima = None
+            self._totales = {ventana: _Cubeta.empty(0, 0, len(self.columns)) for ventana in self.windows}
+            # Primera cubeta incluida en el total de cada ventana y restas desde el último recálculo
+            self._desde = {ventana: -math.inf for ventana in self.windows}
+            self._restas = {ventana: 0 for ventana in self.windows}
+
+    def _limite(self, ventana):
+        return self._ultima - math.ceil(self.windows[ventana] / self.bucket_seconds) + 1
+
+    def update(self, df_estados, timestamp=None):
+        """Agrega las filas de una actualización (df_estados) con el instante `timestamp`"""
+
+        if df_estados.empty:
+            return
+        ts = timestamp.timestamp() if timestamp is not None else pd.Timestamp.now().timestamp()
+        cubeta = int(ts // self.bucket_seconds)
+        x = df_estados[self.columns].to_numpy(dtype=np.float64, na_value=np.nan)
+
+        with self._lock:
+            lote = _Cubeta.from_rows(
+                x,
+                _posiciones(self._estados, df_estados["nombre"].to_numpy()), len(self._estados),
+                _posiciones(self._regiones, df_estados["region"].to_numpy()), len(self._regiones),
+                self.columns
+            )
+            anterior = self._cubetas.get(cubeta)
+            self._cubetas[cubeta] = lote if anterior is None else anterior.merge(lote)
+            self._ultima = cubeta if self._ultima is None else max(self._ultima, cubeta)
+
+            for ventana in self.windows:
+                limite = self._limite(ventana)
+                if cubeta >= limite:
+                    self._totales[ventana] = self._totales[ventana].merge(lote)
+                self._expirar(ventana, limite)
+
+            # Las cubetas fuera de la ventana más larga ya no se necesitan
+            limite = min(self._limite(ventana) for ventana in self.windows)
+            for vieja in [c for c in self._cubetas if c < limite]:
+                del self._cubetas[vieja]
+
+    def _expirar(self, ventana, limite):
+        """Resta del total de la ventana las cubetas anteriores a `limite`"""
+
+        if limite <= self._desde[ventana]:
+            return
+        salientes = sorted(c for c in self._cubetas if self._desde[ventana] <= c < limite)
+        self._desde[ventana] = limite
+        if self._restas[ventana] + len(salientes) >= REBUILD_EVERY:
+            total = _Cubeta.empty(len(self._estados), len(self._regiones), len(self.columns))
+            for c in sorted(self._cubetas):
+                if c >= limite:
+                    total = total.merge(self._cubetas[c])
+            self._totales[ventana] = total
+            self._restas[ventana] = 0
+            return
+        for c in salientes:
+            self._totales[ventana] = self._totales[ventana].subtract(self._cubetas[c])
+        self._restas[ventana] += len(salientes)
+
+    def view(self):
+        """Vista inmutable de los totales actuales de cada ventana"""
+
+        with self._lock:
+            extremos = {}
+            for ventana in self.windows:
+                if self._ultima is None:
+                    extremos[ventana] = (None, None)
+                    continue
+                limite = self._limite(ventana)
+                cubetas = [self._cubetas[c] for c in self._cubetas if c >= limite]
+                n_regiones = len(self._regiones)
+                minimos = [_ampliar(c.minimos, n_regiones, np.nan) for c in cubetas]
+                maximos = [_ampliar(c.maximos, n_regiones, np.nan) for c in cubetas]
+                extremos[ventana] = (np.fmin.reduce(minimos), np.fmax.reduce(maximos))
+            return RollingView(
+                self.columns,
+                list(self._estados),
+                list(self._regiones),
+                dict(self._totales),
+                extremos
+            )
+
+
+class RollingView:
+    """Consultas sobre los totales de cada ventana (no cambian aunque lleguen más datos)"""
+
+    def __init__(self, columns, estados, regiones, totales, extremos):
+        self.columns = columns
+        self.estados = estados
+        self.regiones = regiones
+        self._totales = totales
+        self._extremos = extremos
+
+    def _indices(self, regiones):
+        if regiones is None:
+            return list(range(len(self.regiones)))
+        return [i for i, region in enumerate(self.regiones) if region in regiones]
+
+    def observations(self, ventana, regiones=None):
+        """Filas agregadas en la ventana"""
+
+        filas = self._totales[ventana].filas
+        return int(round(sum(filas[i] for i in self._indices(regiones) if i < len(filas))))
+
+    def correlation(self, ventana, regiones=None):
+        """Matriz de correlación de Pearson por pares, como DataFrame.corr()"""
+
+        momentos = self._totales[ventana].regiones.combine(self._indices(regiones))
+        n, m2, co = momentos.n[0], momentos.m2[0], momentos.co[0]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = co / np.sqrt(m2 * m2.T)
+        corr = np.where(n > 1, np.clip(corr, -1.0, 1.0), np.nan)
+        np.fill_diagonal(corr, np.where(np.diag(m2) > 0, 1.0, np.nan))
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
+
+    def histogram(self, ventana, columna="probabilidad_lluvia", regiones=None):
+        """Conteos por intervalo y región: DataFrame (region, desde, hasta, conteo)"""
+
+        bordes = HISTOGRAM_BINS[columna]
+        conteos = self._totales[ventana].histogramas[columna]
+        partes = [
+            pd.DataFrame({"region": self.regiones[i], "desde": bordes[:-1], "hasta": bordes[1:], "conteo": conteos[i]})
+            for i in self._indices(regiones) if i < len(conteos)
+        ]
+        if not partes:
+            return pd.DataFrame(columns=["region", "desde", "hasta", "conteo"])
+        return pd.concat(partes, ignore_index=True)
+
+    def describe(self, ventana, regiones=None, columnas=DESCRIBE_COLUMNS):
+        """Estadísticas como DataFrame.describe(); los percentiles se aproximan con los histogramas"""
+
+        indices = self._indices(regiones)
+        total = self._totales[ventana]
+        momentos = total.regiones.combine(indices)
+        minimos, maximos = self._extremos[ventana]
+
+        resultado = {}
+        for columna in columnas:
+            j = self.columns.index(columna)
+            n, media, m2 = momentos.n[0, j, j], momentos.media[0, j, j], momentos.m2[0, j, j]
+            minimo = np.nanmin(minimos[indices, j]) if n and minimos is not None else np.nan
+            maximo = np.nanmax(maximos[indices, j]) if n and maximos is not None else np.nan
+            conteos = total.histogramas[columna][[i for i in indices if i < len(total.histogramas[columna])]].sum(axis=0)
+            percentiles = [_percentil(HISTOGRAM_BINS[columna], conteos, q, minimo, maximo) for q in (0.25, 0.5, 0.75)]
+            resultado[columna] = [
+                n,
+                media if n else np.nan,
+                math.sqrt(m2 / (n - 1)) if n > 1 else np.nan,
+                minimo,
+                *percentiles,
+                maximo
+            ]
+        return pd.DataFrame(resultado, index=["count", "mean", "std", "min", "25%", "50%", "75%", "max"])
+
+    def state_summary(self, ventana):
+        """Observaciones, media y desviación estándar de cada columna por estado en la ventana"""
+
+        momentos = self._totales[ventana].estados
+        n = momentos.n[:len(self.estados)]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            std = np.sqrt(momentos.m2[:len(self.estados)] / (n - 1))
+        df = pd.DataFrame({"nombre": self.estados, "observaciones": n.max(axis=1)})
+        for j, columna in enumerate(self.columns):
+            df[f"{columna}_media"] = np.where(n[:, j] > 0, momentos.media[:len(self.estados), j], np.nan)
+            df[f"{columna}_std"] = np.where(n[:, j] > 1, std[:, j], np.nan)
+        return df[df["observaciones"] > 0].reset_index(drop=True)
+
+
+def _percentil(bordes, conteos, q, minimo, maximo):
+    """Percentil `q` interpolado dentro del intervalo del histograma, acotado por el mínimo y el máximo"""
+
+    total = conteos.sum()
+    if total <= 0:
+        return np.nan
+    acumulado = np.cumsum(conteos)
+    objetivo = q * total
+    i = min(int(np.searchsorted(acumulado, objetivo, side="left")), len(conteos) - 1)
+    previo = acumulado[i - 1] if i > 0 else 0.0
+    fraccion = (objetivo - previo) / conteos[i] if conteos[i] else 0.0
+    valor = bordes[i] + fraccion * (bordes[i + 1] - bordes[i])
+    return float(np.clip(valor, minimo, maximo))
@@ -0,0 +1,291 @@
+"""Muestreo denso dentro de cada estado y agregación espacial de los resultados.
+
+Genera una malla de puntos sobre México, asigna cada punto a su estado con un índice
+espacial sobre los polígonos de data/estados_mexico.topo.json, consulta los pronósticos de
+los puntos por el camino normal (caché y planificador de solicitudes) y resume los
+valores por estado:
+
+    OPENWEATHER_API_KEY=... python sampling.py --spacing 0.25 --out muestreo.parquet
+"""
+
+import argparse
+import logging
+import sys
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from geometry import state_polygons
+from pipeline import analyze_rain_forecast_batch, estados_mexico, fetch_weather_data, get_api_key
+
+logger = logging.getLogger(__name__)
+
+# Separación por defecto de la malla de muestreo (grados)
+DEFAULT_SPACING = 0.25
+
+# Tamaño de las celdas del índice espacial (grados)
+DEFAULT_CELL_SIZE = 0.2
+
+# Puntos que se consultan y analizan por tanda (limita la memoria de las respuestas JSON)
+SAMPLE_CHUNK_SIZE = 1000
+
+# Máximo de pares (arista, punto) evaluados a la vez en la prueba de punto en polígono
+_MAX_PAIRS = 4_000_000
+
+
+def load_state_polygons():
+    """Polígonos de los estados con todos sus vértices (el nivel 0 de geometry.py).
+
+    Devuelve una lista de (nombre, region, poligonos); cada polígono es una lista de anillos
+    cerrados (el exterior y sus huecos) y cada anillo un array (n, 2) de lon/lat.
+    """
+
+    return state_polygons(0.0)
+
+
+def points_in_rings(lon, lat, anillos):
+    """Prueba de punto en polígono (regla par-impar) vectorizada sobre puntos y aristas.
+
+    Los huecos y las islas se resuelven solos al considerar todos los anillos juntos.
+    """
+
+    dentro = np.zeros(len(lon), dtype=bool)
+    if len(lon) == 0:
+        return dentro
+
+    x1 = np.concatenate([anillo[:-1, 0] for anillo in anillos])
+    y1 = np.concatenate([anillo[:-1, 1] for anillo in anillos])
+    x2 = np.concatenate([anillo[1:, 0] for anillo in anillos])
+    y2 = np.concatenate([anillo[1:, 1] for anillo in anillos])
+
+    # Procesar los puntos por tandas para no crear matrices enormes
+    paso = max(1, _MAX_PAIRS // len(x1))
+    for inicio in range(0, len(lon), paso):
+        px = lon[inicio:inicio + paso, None]
+        py = lat[inicio:inicio + paso, None]
+        cruza = (y1 > py) != (y2 > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_corte = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+        dentro[inicio:inicio + paso] = np.count_nonzero(cruza & (px < x_corte), axis=1) % 2 == 1
+    return dentro
+
+
+class StateIndex:
+    """Índice espacial de malla uniforme para asignar puntos a estados.
+
+    Cada polígono (un estado puede tener varios, por ejemplo sus islas) se registra en las
+    celdas de su rectángulo envolvente, separadas en celdas de borde (las cruza alguna
+    arista) y celdas interiores. Los puntos de una celda interior se asignan directamente;
+    solo los de las celdas de borde pasan por la prueba de punto en polígono.
+    """
+
+    def __init__(self, estados=None, cell_size=DEFAULT_CELL_SIZE):
+        self.estados = estados if estados is not None else load_state_polygons()
+        self.cell_size = cell_size
+        self.nombres = [nombre for nombre, _, _ in self.estados]
+        self.regiones = [region for _, region, _ in self.estados]
+
+        # Un polígono por entrada: (índice del estado, anillos)
+        self.poligonos = [(i, anillos) for i, (_, _, partes) in enumerate(self.estados) for anillos in partes]
+
+        puntos = np.concatenate([anillos[0] for _, anillos in self.poligonos])
+        self.lon0, self.lat0 = puntos.min(axis=0)
+        lon1, lat1 = puntos.max(axis=0)
+        self.columnas = int((lon1 - self.lon0) // cell_size) + 1
+        self.filas = int((lat1 - self.lat0) // cell_size) + 1
+
+        self.celdas_interiores = []
+        self.celdas_borde = []
+        for _, anillos in self.poligonos:
+            # Celdas del rectángulo envolvente del anillo exterior
+            c0, f0 = self._celda(*anillos[0].min(axis=0))
+            c1, f1 = self._celda(*anillos[0].max(axis=0))
+            columnas, filas = np.meshgrid(np.arange(c0, c1 + 1), np.arange(f0, f1 + 1))
+            celdas = (filas * self.columnas + columnas).ravel()
+
+            # Celdas que toca el rectángulo de cada arista
+            borde = set()
+            for anillo in anillos:
+                columna, fila = self._celda(anillo[:, 0], anillo[:, 1])
+                for ca, fa, cb, fb in zip(columna[:-1], fila[:-1], columna[1:], fila[1:]):
+                    for f in range(min(fa, fb), max(fa, fb) + 1):
+                        borde.update(range(f * self.columnas + min(ca, cb), f * self.columnas + max(ca, cb) + 1))
+            borde = np.array(sorted(borde), dtype=np.int64)
+
+            # Las demás celdas quedan enteras dentro o fuera: basta probar su centro
+            resto = np.setdiff1d(celdas, borde)
+            centro_lon = self.lon0 + (resto % self.columnas + 0.5) * cell_size
+            centro_lat = self.lat0 + (resto // self.columnas + 0.5) * cell_size
+            self.celdas_interiores.append(resto[points_in_rings(centro_lon, centro_lat, anillos)])
+            self.celdas_borde.append(borde)
+
+    def _celda(self, lon, lat):
+        columna = np.clip(((np.asarray(lon) - self.lon0) // self.cell_size).astype(np.int64), 0, self.columnas - 1)
+        fila = np.clip(((np.asarray(lat) - self.lat0) // self.cell_size).astype(np.int64), 0, self.filas - 1)
+        return columna, fila
+
+    def locate(self, lon, lat):
+        """Índice del estado de cada punto (-1 si queda fuera de todos)"""
+
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        resultado = np.full(len(lon), -1, dtype=np.int64)
+
+        # Puntos ordenados por celda y posición de cada celda en ese orden
+        columna, fila = self._celda(lon, lat)
+        celda = fila * self.columnas + columna
+        orden = np.argsort(celda, kind="stable")
+        limites = np.searchsorted(celda[orden], np.arange(self.filas * self.columnas + 1))
+
+        def puntos_en(celdas):
+            if len(celdas) == 0:
+                return np.empty(0, dtype=np.int64)
+            return np.concatenate([orden[limites[c]:limites[c + 1]] for c in celdas])
+
+        for (i, anillos), interiores, borde in zip(self.poligonos, self.celdas_interiores, self.celdas_borde):
+            resultado[puntos_en(interiores)] = i
+            candidatos = puntos_en(borde)
+            candidatos = candidatos[resultado[candidatos] == -1]
+            if len(candidatos) == 0:
+                continue
+            dentro = points_in_rings(lon[candidatos], lat[candidatos], anillos)
+            resultado[candidatos[dentro]] = i
+        return resultado
+
+
+@lru_cache(maxsize=None)
+def get_state_index():
+    """Índice espacial de los estados compartido por el proceso"""
+
+    return StateIndex()
+
+
+def sample_grid(spacing=DEFAULT_SPACING, index=None):
+    """Malla de puntos dentro de los estados con el formato de estados_mexico.
+
+    Cada punto incluye el nombre de su estado en "estado". Los estados sin ningún punto de
+    la malla (los más pequeños con una malla gruesa) reciben su coordenada de referencia.
+    """
+
+    index = index or get_state_index()
+    lon = np.arange(index.lon0 + spacing / 2, index.lon0 + index.columnas * index.cell_size, spacing)
+    lat = np.arange(index.lat0 + spacing / 2, index.lat0 + index.filas * index.cell_size, spacing)
+    malla_lon, malla_lat = np.meshgrid(lon, lat)
+    malla_lon = malla_lon.ravel()
+    malla_lat = malla_lat.ravel()
+
+    with metrics.stage("muestreo_malla"):
+        estado = index.locate(malla_lon, malla_lat)
+
+    dentro = estado >= 0
+    puntos = [
+        {
+            "nombre": f"{index.nombres[e]} ({la:.3f}, {lo:.3f})",
+            "lat": round(float(la), 4),
+            "lon": round(float(lo), 4),
+            "region": index.regiones[e],
+            "estado": index.nombres[e]
+        }
+        for lo, la, e in zip(malla_lon[dentro], malla_lat[dentro], estado[dentro])
+    ]
+
+    con_puntos = set(estado[dentro].tolist())
+    for referencia in estados_mexico:
+        i = index.nombres.index(referencia["nombre"])
+        if i not in con_puntos:
+            puntos.append({
+                "nombre": referencia["nombre"],
+                "lat": referencia["lat"],
+                "lon": referencia["lon"],
+                "region": referencia["region"],
+                "estado": referencia["nombre"]
+            })
+    return puntos
+
+
+def aggregate_samples(puntos, analisis):
+    """Resume por estado los valores de los puntos (media, mínimo, máximo y fracción con lluvia)"""
+
+    df = pd.DataFrame({
+        "estado": [punto["estado"] for punto in puntos],
+        "probabilidad_lluvia": [a["probabilidad_lluvia"] for a in analisis],
+        "precipitacion": [sum(dia["precipitacion"] for dia in a["datos_diarios"]) for a in analisis],
+        "con_lluvia": [a["lluvia_proximos_dias"] for a in analisis],
+        "con_datos": [bool(a["datos_diarios"]) for a in analisis]
+    })
+    df = df[df["con_datos"]]
+
+    resumen = df.groupby("estado", sort=False).agg(
+        puntos=("probabilidad_lluvia", "size"),
+        probabilidad_media=("probabilidad_lluvia", "mean"),
+        probabilidad_min=("probabilidad_lluvia", "min"),
+        probabilidad_max=("probabilidad_lluvia", "max"),
+        precipitacion_media=("precipitacion", "mean"),
+        precipitacion_min=("precipitacion", "min"),
+        precipitacion_max=("precipitacion", "max"),
+        fraccion_con_lluvia=("con_lluvia", "mean")
+    )
+
+    # Un renglón por estado en el orden de estados_mexico (NaN si ningún punto tuvo datos)
+    nombres = [estado["nombre"] for estado in estados_mexico]
+    resumen = resumen.reindex(nombres)
+    resumen["puntos"] = resumen["puntos"].fillna(0).astype(int)
+    return resumen.rename_axis("nombre").reset_index()
+
+
+def sample_states(api_key, spacing=DEFAULT_SPACING, on_progress=None, max_age=None, chunk_size=SAMPLE_CHUNK_SIZE):
+    """Consulta el pronóstico de cada punto de la malla y devuelve el resumen por estado.
+
+    Los puntos se procesan por tandas: de cada respuesta solo se conserva su análisis.
+    """
+
+    puntos = sample_grid(spacing)
+    analisis = []
+    for inicio in range(0, len(puntos), chunk_size):
+        tanda = puntos[inicio:inicio + chunk_size]
+
+        def progreso(fraccion, inicio=inicio, n=len(tanda)):
+            if on_progress is not None:
+                on_progress((inicio + fraccion * n) / len(puntos))
+
+        with metrics.stage("muestreo_fetch"):
+            datos = fetch_weather_data(tanda, api_key, on_progress=progreso, max_age=max_age, current=False)
+        with metrics.stage("muestreo_analisis"):
+            analisis.extend(analyze_rain_forecast_batch([d["forecast"] for d in datos]))
+
+    with metrics.stage("muestreo_agregacion"):
+        return aggregate_samples(puntos, analisis)
+
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos"""
+
+    parser = argparse.ArgumentParser(description="Muestreo denso de pronósticos dentro de cada estado")
+    parser.add_argument("--spacing", type=float, default=DEFAULT_SPACING, help="Separación de la malla (grados)")
+    parser.add_argument("--out", default="muestreo.parquet", help="Archivo de salida (.parquet o .csv)")
+    parser.add_argument("--max-age", type=int, default=None, help="Edad máxima en segundos de las respuestas en caché")
+    parser.add_argument("--dry-run", action="store_true", help="Solo contar los puntos de la malla por estado")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.dry_run:
+        puntos = sample_grid(args.spacing)
+        conteo = pd.Series([punto["estado"] for punto in puntos]).value_counts()
+        print(f"{len(puntos)} puntos con separación de {args.spacing}°")
+        print(conteo.to_string())
+        return 0
+
+    resumen = sample_states(get_api_key(), args.spacing, max_age=args.max_age)
+    if args.out.endswith(".csv"):
+        resumen.to_csv(args.out, index=False)
+    else:
+        resumen.to_parquet(args.out, index=False)
+    logger.info(f"Resumen de {int(resumen['puntos'].sum())} puntos guardado en {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,528 @@
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from aggregates import RegionAggregates
+
+logger = logging.getLogger(__name__)
+
+# Intervalo entre actualizaciones en segundos (menor que el TTL de la caché para adelantarse a su vencimiento)
+DEFAULT_REFRESH_INTERVAL = int(os.environ.get("RAIN_REFRESH_INTERVAL", 50 * 60))
+
+# Directorio donde la app guarda el último snapshot para mostrarlo al arrancar ("" lo desactiva)
+DEFAULT_SNAPSHOT_PATH = os.environ.get("RAIN_SNAPSHOT_PATH", os.path.join(".cache", "snapshot"))
+
+# Tipo de cada columna de la tabla de estados: mediciones en float32 (también humedad y presión,
+# enteras en OpenWeather, para que un estado sin datos actuales sea NaN y no pd.NA, que Plotly y
+# los popups no aceptan), textos repetidos como categorías y la próxima lluvia como instante en
+# segundos (int64 por debajo)
+STATE_DTYPES = {
+    "nombre": object,
+    "region": object,
+    "lat": np.float32,
+    "lon": np.float32,
+    "temp_actual": np.float32,
+    "clima_actual": "category",
+    "humedad_actual": np.float32,
+    "presion_actual": np.float32,
+    "viento_actual": np.float32,
+    "icon_code": "category",
+    "lluvia_proximos_dias": bool,
+    "probabilidad_lluvia": np.float32,
+    "dias_con_lluvia": np.int8,
+    "proxima_lluvia": "datetime64[s]"
+}
+
+# Columnas de la tabla diaria de pronóstico
+DAILY_COLUMNS = ["nombre", "fecha", "min_temp", "max_temp", "precipitacion", "tiene_lluvia"]
+
+
+# Ordinal (date.toordinal) del 1 de enero de 1970 y valor de NaT como entero
+_ORDINAL_1970 = date(1970, 1, 1).toordinal()
+_NAT = np.iinfo(np.int64).min
+
+
+def _segundos(valores):
+    """Fechas u horas locales (sin zona) como datetime64[s]; None es NaT.
+
+    Cada valor distinto (hay pocos: días y períodos de 3 horas) se convierte una sola vez con
+    el ordinal del día, mucho más rápido que convertir cada objeto con NumPy.
+    """
+
+    def segundos(valor):
+        if valor is None:
+            return _NAT
+        dia = (valor.toordinal() - _ORDINAL_1970) * 86400
+        if isinstance(valor, datetime):
+            return dia + valor.hour * 3600 + valor.minute * 60 + valor.second
+        return dia
+
+    tabla = {valor: segundos(valor) for valor in set(valores)}
+    return np.fromiter(map(tabla.__getitem__, valores), dtype=np.int64, count=len(valores)).view("datetime64[s]")
+
+
+def _columna(valores, dtype):
+    """Array tipado de una columna a partir de los valores de las filas (None es nulo)"""
+
+    if dtype == "datetime64[s]":
+        return _segundos(valores)
+    if dtype == "category":
+        return pd.Categorical(valores)
+    return np.array(valores, dtype=dtype)
+
+
+def state_frame(results):
+    """Tabla de estados con tipos compactos, armada por columnas a partir de las filas"""
+
+    return pd.DataFrame({
+        columna: _columna(list(map(itemgetter(columna), results)), dtype)
+        for columna, dtype in STATE_DTYPES.items()
+    })
+
+
+def daily_frame(datos_diarios_por_estado, nombres=None):
+    """Tabla diaria de los estados `nombres` (todos por defecto), en el orden de datos_diarios_por_estado.
+
+    El nombre es una categoría con todos los estados del snapshot (en su orden) y la fecha un
+    instante en segundos, así que las tablas parciales se pueden concatenar sin cambiar de tipo.
+    """
+
+    categorias = list(datos_diarios_por_estado)
+    if nombres is None:
+        nombres = categorias
+    posicion = {nombre: i for i, nombre in enumerate(categorias)}
+    dias = [dia for nombre in nombres for dia in datos_diarios_por_estado[nombre]]
+    codigos = np.repeat(
+        np.array([posicion[nombre] for nombre in nombres], dtype=np.int32),
+        [len(datos_diarios_por_estado[nombre]) for nombre in nombres]
+    )
+    def columna(clave, dtype):
+        return np.fromiter(map(itemgetter(clave), dias), dtype=dtype, count=len(dias))
+
+    return pd.DataFrame({
+        "nombre": pd.Categorical.from_codes(codigos, categories=categorias),
+        "fecha": _segundos(list(map(itemgetter("fecha"), dias))),
+        "min_temp": columna("min_temp", np.float32),
+        "max_temp": columna("max_temp", np.float32),
+        "precipitacion": columna("precipitacion", np.float32),
+        "tiene_lluvia": columna("tiene_lluvia", bool)
+    }, columns=DAILY_COLUMNS)
+
+
+class Snapshot:
+    """Resultado completo de una actualización, compartido de solo lectura por todas las sesiones.
+
+    Incluye las filas por estado, los datos diarios, sus DataFrames ya construidos y los
+    agregados por región. Ninguna sesión debe modificar estos objetos; los filtros devuelven
+    vistas en caché.
+
+    Con `base` (el snapshot anterior de las mismas ubicaciones) solo se procesa lo que cambió:
+    las filas y listas diarias que son el mismo objeto que en `base` se consideran iguales, se
+    reutilizan sus DataFrames y los agregados se corrigen con las filas distintas.
+    """
+
+    def __init__(self, results, datos_diarios_por_estado, timestamp=None, errores=(), dias_secos=None, base=None):
+        self.version = None
+        self.results = tuple(results)
+        self.datos_diarios_por_estado = datos_diarios_por_estado
+        self.timestamp = timestamp or datetime.now()
+        self.errores = tuple(errores)
+        # Días secos consecutivos por estado según el historial (None si no hay historial)
+        self.dias_secos = dias_secos
+        # Índice y nivel de riesgo de sequía por estado y alertas nuevas de esta actualización
+        # (los asigna quien construye el snapshot, antes de publicarlo)
+        self.riesgo = None
+        self.alertas = None
+        # Estadísticas móviles (RollingView) del proceso al momento de esta actualización
+        self.tendencias = None
+
+        if base is not None and len(base.results) != len(self.results):
+            base = None
+
+        # DataFrames construidos una sola vez por snapshot
+        self._build_estados(base)
+        self._build_diario(base)
+        self._por_region = {}
+        self._lock = threading.Lock()
+
+    def _build_estados(self, base):
+        """Tabla de estados y agregados por región, por diferencias con `base` si se puede"""
+
+        cambiados = None
+        if base is not None:
+            cambiados = [i for i, (fila, anterior) in enumerate(zip(self.results, base.results)) if fila is not anterior]
+
+        if cambiados == []:
+            self.df_estados = base.df_estados
+            self.agregados = base.agregados
+            return
+
+        self.df_estados = state_frame(self.results)
+        if cambiados is None:
+            self.agregados = RegionAggregates.from_frame(self.df_estados)
+        else:
+            self.agregados = base.agregados.patch(base.df_estados.iloc[cambiados], self.df_estados.iloc[cambiados])
+
+    def _build_diario(self, base):
+        """Tabla diaria; con `base` solo se arman las filas de los estados cuyo pronóstico cambió"""
+
+        anteriores = base.datos_diarios_por_estado if base is not None else {}
+        cambiados = [nombre for nombre, dias in self.datos_diarios_por_estado.items() if dias is not anteriores.get(nombre)]
+        if base is not None and list(anteriores) != list(self.datos_diarios_por_estado):
+            base = None
+
+        if base is not None and not cambiados:
+            self.df_diario = base.df_diario
+            self._diario_por_estado = base._diario_por_estado
+            return
+
+        if base is None:
+            self.df_diario = daily_frame(self.datos_diarios_por_estado)
+        else:
+            # Conservar las filas de los estados sin cambios y ordenar como una construcción completa
+            # (las categorías son los estados en orden, así que basta ordenar por código)
+            nuevas = daily_frame(self.datos_diarios_por_estado, cambiados)
+            conservadas = base.df_diario[~base.df_diario["nombre"].isin(cambiados)]
+            partes = [df for df in (conservadas, nuevas) if not df.empty]
+            df = pd.concat(partes, ignore_index=True) if partes else nuevas
+            orden = np.argsort(df["nombre"].cat.codes.to_numpy(), kind="stable")
+            self.df_diario = df.iloc[orden].reset_index(drop=True)
+
+        # Las filas de cada estado son contiguas: diario() devuelve una vista por rango
+        conteos = np.bincount(self.df_diario["nombre"].cat.codes.to_numpy(), minlength=len(self.datos_diarios_por_estado))
+        finales = np.cumsum(conteos)
+        self._diario_por_estado = {
+            nombre: slice(int(final - conteo), int(final))
+            for nombre, conteo, final in zip(self.datos_diarios_por_estado, conteos, finales) if conteo
+        }
+
+    def estados(self, region=None):
+        """DataFrame de estados filtrado por región (None o "Todos los estados" devuelve todos)"""
+
+        if region is None or region == "Todos los estados":
+            return self.df_estados
+
+        with self._lock:
+            df = self._por_region.get(region)
+            if df is None:
+                df = self.df_estados[self.df_estados["region"] == region].reset_index(drop=True)
+                self._por_region[region] = df
+        return df
+
+    def diario(self, nombre):
+        """DataFrame con el pronóstico diario de un estado (vacío si no hay datos)"""
+
+        filas = self._diario_por_estado.get(nombre)
+        if filas is None:
+            return self.df_diario.iloc[0:0]
+        return self.df_diario.iloc[filas]
+
+
+def _json_default(valor):
+    """Convierte fechas a texto ISO al serializar a JSON"""
+
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+def _write_atomic(ruta, escribir):
+    """Escribe en un archivo temporal y lo renombra para que nunca se lea un archivo a medias"""
+
+    temporal = f"{ruta}.tmp"
+    escribir(temporal)
+    os.replace(temporal, ruta)
+
+
+def save_snapshot(snapshot, directorio, fmt="parquet"):
+    """Guarda el snapshot en disco como Parquet (estados y diario) o como un único JSON.
+
+    Devuelve la lista de archivos escritos.
+    """
+
+    os.makedirs(directorio, exist_ok=True)
+    meta = {
+        "version": snapshot.version,
+        "timestamp": snapshot.timestamp.isoformat(),
+        "errores": list(snapshot.errores),
+        "dias_secos": snapshot.dias_secos,
+        "alertas": snapshot.alertas.to_dict("records") if snapshot.alertas is not None else []
+    }
+
+    if fmt == "parquet":
+        rutas = [
+            os.path.join(directorio, "estados.parquet"),
+            os.path.join(directorio, "diario.parquet"),
+            os.path.join(directorio, "snapshot_meta.json")
+        ]
+        _write_atomic(rutas[0], lambda ruta: snapshot.df_estados.to_parquet(ruta, index=False))
+        _write_atomic(rutas[1], lambda ruta: snapshot.df_diario.to_parquet(ruta, index=False))
+        ruta_riesgo = os.path.join(directorio, "riesgo.parquet")
+        # El meta registra si hay tabla de riesgo para no cargar la de un guardado anterior
+        meta["con_riesgo"] = snapshot.riesgo is not None
+        if meta["con_riesgo"]:
+            rutas.insert(2, ruta_riesgo)
+            _write_atomic(ruta_riesgo, lambda ruta: snapshot.riesgo.to_parquet(ruta, index=False))
+        elif os.path.exists(ruta_riesgo):
+            os.remove(ruta_riesgo)
+    elif fmt == "json":
+        rutas = [os.path.join(directorio, "snapshot.json")]
+        meta["results"] = list(snapshot.results)
+        meta["datos_diarios_por_estado"] = snapshot.datos_diarios_por_estado
+        if snapshot.riesgo is not None:
+            meta["riesgo"] = snapshot.riesgo.to_dict("records")
+    else:
+        raise ValueError(f"Formato no soportado: {fmt}")
+
+    def escribir_json(ruta):
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, default=_json_default)
+
+    _write_atomic(rutas[-1], escribir_json)
+    return rutas
+
+
+def _fecha_hora(valor):
+    """Convierte la próxima lluvia leída de disco (Timestamp, texto ISO o nulo) a datetime o None"""
+
+    if valor is None or pd.isnull(valor):
+        return None
+    if isinstance(valor, str):
+        return datetime.fromisoformat(valor)
+    return pd.Timestamp(valor).to_pydatetime()
+
+
+def _filas(df):
+    """Filas de una tabla leída de Parquet con los valores como en las filas originales.
+
+    Los float32 vuelven a su decimal más corto (OpenWeather no da más de 7 cifras) y los nulos de
+    cualquier tipo (NaN, NA, NaT) vuelven a ser None.
+    """
+
+    df = df.assign(**{
+        columna: df[columna].to_numpy().astype(str).astype(np.float64)
+        for columna, dtype in df.dtypes.items() if dtype == np.float32
+    })
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+def load_snapshot(directorio):
+    """Lee un snapshot guardado con save_snapshot (Parquet o JSON).
+
+    Devuelve None si el directorio no tiene ningún snapshot. La versión la asigna quien lo publica.
+    """
+
+    ruta_meta = os.path.join(directorio, "snapshot_meta.json")
+    ruta_json = os.path.join(directorio, "snapshot.json")
+    ruta_riesgo = os.path.join(directorio, "riesgo.parquet")
+
+    if os.path.exists(ruta_meta):
+        with open(ruta_meta, encoding="utf-8") as f:
+            meta = json.load(f)
+        results = _filas(pd.read_parquet(os.path.join(directorio, "estados.parquet")))
+        df_diario = pd.read_parquet(os.path.join(directorio, "diario.parquet"))
+        df_diario["fecha"] = pd.to_datetime(df_diario["fecha"]).dt.date
+        dias = _filas(df_diario.drop(columns="nombre"))
+        datos_diarios = {}
+        for nombre, dia in zip(df_diario["nombre"], dias):
+            datos_diarios.setdefault(nombre, []).append(dia)
+        con_riesgo = meta.get("con_riesgo", os.path.exists(ruta_riesgo))
+        riesgo = pd.read_parquet(ruta_riesgo) if con_riesgo else None
+    elif os.path.exists(ruta_json):
+        with open(ruta_json, encoding="utf-8") as f:
+            meta = json.load(f)
+        results = meta["results"]
+        datos_diarios = {
+            nombre: [dict(dia, fecha=date.fromisoformat(dia["fecha"])) for dia in dias]
+            for nombre, dias in meta["datos_diarios_por_estado"].items()
+        }
+        riesgo = pd.DataFrame(meta["riesgo"]) if "riesgo" in meta else None
+    else:
+        return None
+
+    for fila in results:
+        fila["proxima_lluvia"] = _fecha_hora(fila.get("proxima_lluvia"))
+
+    snapshot = Snapshot(
+        results,
+        {fila["nombre"]: datos_diarios.get(fila["nombre"], []) for fila in results},
+        timestamp=datetime.fromisoformat(meta["timestamp"]),
+        errores=meta["errores"],
+        dias_secos=meta["dias_secos"]
+    )
+    snapshot.riesgo = riesgo
+    snapshot.alertas = pd.DataFrame(meta["alertas"])
+    if "timestamp" in snapshot.alertas:
+        snapshot.alertas["timestamp"] = pd.to_datetime(snapshot.alertas["timestamp"])
+    return snapshot
+
+
+class SnapshotRefresher:
+    """Reconstruye el snapshot en un hilo de fondo cada `interval` segundos.
+
+    `build` recibe una función de progreso (0 a 1) y otra que recibe cada fila terminada con
+    sus datos diarios, y devuelve un Snapshot. El snapshot nuevo reemplaza al anterior de una
+    sola vez, así que los lectores nunca ven datos a medias; las filas que van llegando durante
+    una actualización se consultan aparte con partial().
+
+    Con `snapshot_dir` cada snapshot nuevo se guarda en disco y warm_start() publica el último
+    guardado, para servir la primera página sin esperar a la primera actualización.
+    """
+
+    def __init__(self, build, interval=DEFAULT_REFRESH_INTERVAL, snapshot_dir=None):
+        self._build = build
+        self.interval = interval
+        self.snapshot_dir = snapshot_dir
+        # Snapshot leído de disco al arrancar (None si no había o no se pidió)
+        self.restored = None
+        self.progress = 0.0
+        self.last_error = None
+        # Actualizaciones terminadas (con o sin error)
+        self.completed = 0
+        self._snapshot = None
+        self._parciales = []
+        self._parcial = None
+        self._siguiente_version = 1
+        self._lock = threading.Lock()
+        self._terminada = threading.Condition(self._lock)
+        self._ready = threading.Event()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Inicia el hilo de actualización si no está corriendo"""
+
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="snapshot-refresher", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def warm_start(self):
+        """Publica el último snapshot guardado en `snapshot_dir`, si hay; devuelve si se publicó"""
+
+        if not self.snapshot_dir or self._snapshot is not None:
+            return False
+        try:
+            with metrics.stage("snapshot_disco"):
+                snapshot = load_snapshot(self.snapshot_dir)
+        except Exception:
+            logger.exception("No se pudo leer el snapshot guardado")
+            return False
+        if snapshot is None:
+            return False
+        self.restored = snapshot
+        self.publish(snapshot)
+        return True
+
+    def _save(self, snapshot):
+        try:
+            save_snapshot(snapshot, self.snapshot_dir)
+        except Exception:
+            logger.exception("No se pudo guardar el snapshot")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _set_progress(self, valor):
+        self.progress = valor
+
+    def _add_partial(self, fila, datos_diarios):
+        with self._lock:
+            self._parciales.append((fila, datos_diarios))
+
+    def refresh(self):
+        """Construye y publica un snapshot nuevo; si falla se conserva el anterior"""
+
+        self.progress = 0.0
+        self.last_error = None
+        with self._lock:
+            self._parciales = []
+            self._parcial = None
+        snapshot = None
+        try:
+            with metrics.stage("actualizacion"):
+                snapshot = self._build(self._set_progress, self._add_partial)
+        except Exception as e:
+            logger.exception("Error al actualizar los datos climáticos")
+            self.last_error = e
+        if snapshot is not None:
+            self.publish(snapshot)
+            if self.snapshot_dir:
+                self._save(snapshot)
+        with self._terminada:
+            self._parciales = []
+            self._parcial = None
+            self.completed += 1
+            self._terminada.notify_all()
+        return snapshot
+
+    def publish(self, snapshot):
+        """Asigna una versión al snapshot y lo reemplaza como actual de forma atómica"""
+
+        with self._lock:
+            snapshot.version = self._siguiente_version
+            self._siguiente_version += 1
+            self._snapshot = snapshot
+        self._ready.set()
+
+    def request_refresh(self):
+        """Pide una actualización inmediata sin esperar a que termine"""
+
+        self._wake.set()
+
+    def latest(self):
+        """Devuelve el último snapshot publicado (o None si todavía no hay ninguno)"""
+
+        return self._snapshot
+
+    def wait(self, timeout=None):
+        """Espera al primer snapshot; devuelve None si se agota el tiempo"""
+
+        self._ready.wait(timeout)
+        return self._snapshot
+
+    def wait_completed(self, completed, timeout=None):
+        """Espera a que terminen más de `completed` actualizaciones; devuelve si terminaron"""
+
+        with self._terminada:
+            return self._terminada.wait_for(lambda: self.completed > completed, timeout)
+
+    def partial(self):
+        """Snapshot provisional con las filas que ya llegaron en la actualización en curso.
+
+        Devuelve None si no hay ninguna actualización en curso o todavía no llegó ninguna fila.
+        El snapshot se reconstruye solo cuando llegan filas nuevas.
+        """
+
+        with self._lock:
+            parciales = list(self._parciales)
+            parcial = self._parcial
+        if not parciales:
+            return None
+        if parcial is None or len(parcial.results) != len(parciales):
+            parcial = Snapshot(
+                [fila for fila, _ in parciales],
+                {fila["nombre"]: datos_diarios for fila, datos_diarios in parciales}
+            )
+            with self._lock:
+                # No guardar un provisional de una actualización que ya terminó
+                if len(self._parciales) >= len(parciales):
+                    self._parcial = parcial
+        return parcial
@@ -0,0 +1,28 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Caché y cuota aisladas; deben definirse antes de importar los módulos del pipeline
+_TMP = tempfile.mkdtemp(prefix="rain-tests-")
+os.environ["RAIN_CACHE_PATH"] = os.path.join(_TMP, "weather_cache.sqlite3")
+os.environ["RAIN_HISTORY_PATH"] = os.path.join(_TMP, "historial")
+os.environ["OPENWEATHER_CALLS_PER_MINUTE"] = "1000000"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def mock_api():
+    """Servidor local que imita OpenWeather; el pipeline apunta a él durante las pruebas"""
+
+    import pipeline
+    from mock_openweather import start_server
+
+    servidor, base_url = start_server()
+    anterior = pipeline.OPENWEATHER_BASE_URL
+    pipeline.OPENWEATHER_BASE_URL = base_url
+    yield base_url
+    pipeline.OPENWEATHER_BASE_URL = anterior
+    servidor.shutdown()
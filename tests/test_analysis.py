@@ -0,0 +1,44 @@
+import copy
+
+import pipeline
+from forecast_parser import forecast_arrays
+from mock_openweather import synthetic_forecast, synthetic_locations
+
+
+def _pronosticos():
+    """Pronósticos con lluvia, sin lluvia, sin la clave "rain", vacíos y faltantes"""
+
+    ubicaciones = synthetic_locations(20, seed=3)
+    con_lluvia = [synthetic_forecast(u["lat"], u["lon"], ahora=1717243200) for u in ubicaciones]
+    assert any("rain" in periodo for f in con_lluvia for periodo in f["list"])
+
+    sin_lluvia = copy.deepcopy(con_lluvia[0])
+    for periodo in sin_lluvia["list"]:
+        periodo["rain"] = {"3h": 0.0}
+
+    sin_clave = copy.deepcopy(con_lluvia[1])
+    for periodo in sin_clave["list"]:
+        periodo.pop("rain", None)
+
+    # Lluvia por debajo del umbral y justo en el umbral
+    umbral = copy.deepcopy(con_lluvia[2])
+    for k, periodo in enumerate(umbral["list"]):
+        periodo["rain"] = {"3h": 1.0 if k == 17 else 0.4}
+
+    return con_lluvia + [
+        sin_lluvia,
+        sin_clave,
+        umbral,
+        {"cod": "200", "cnt": 0, "list": []},
+        {"cod": "404", "message": "sin lista"},
+        None,
+        forecast_arrays(con_lluvia[3])
+    ]
+
+
+def test_batch_matches_single_analysis():
+    pronosticos = _pronosticos()
+    lote = pipeline.analyze_rain_forecast_batch(pronosticos)
+    assert len(lote) == len(pronosticos)
+    for pronostico, resultado in zip(pronosticos, lote):
+        assert resultado == pipeline.analyze_rain_forecast(pronostico)
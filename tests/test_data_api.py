@@ -0,0 +1,39 @@
+import json
+from urllib.parse import urlencode
+
+import pipeline
+from data_api import DataApi
+from mock_openweather import synthetic_current, synthetic_forecast
+from snapshot import SnapshotRefresher, Snapshot
+
+
+def _snapshot():
+    estados = pipeline.estados_mexico[:10]
+    results, diarios = [], {}
+    for estado in estados:
+        analisis = pipeline.analyze_rain_forecast(synthetic_forecast(estado["lat"], estado["lon"]))
+        results.append(pipeline.result_row(estado, synthetic_current(estado["lat"], estado["lon"]), analisis))
+        diarios[estado["nombre"]] = analisis["datos_diarios"]
+    snapshot = Snapshot(results, diarios)
+    SnapshotRefresher(None).publish(snapshot)
+    return snapshot
+
+
+def test_unknown_filters_are_rejected_before_filtering():
+    snapshot = _snapshot()
+    api = DataApi(lambda: snapshot)
+
+    for consulta in ({"region": "Atlántida"}, {"region": "norte"}, {"estado": "Sonora,Narnia"}):
+        status, _, cuerpo = api.respond("/v1/estados", urlencode(consulta))
+        assert status == 400, cuerpo
+    assert snapshot._por_region == {}
+
+    region = snapshot.results[0]["region"]
+    status, _, cuerpo = api.respond("/v1/estados", urlencode({"region": region}))
+    assert status == 200
+    assert {fila["region"] for fila in json.loads(cuerpo)["estados"]} == {region}
+    assert list(snapshot._por_region) == [region]
+
+    nombre = snapshot.results[1]["nombre"]
+    status, _, cuerpo = api.respond("/v1/diario", urlencode({"estado": nombre}))
+    assert status == 200 and list(json.loads(cuerpo)["diario"]) == [nombre]
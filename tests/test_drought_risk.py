@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from drought_risk import DEFAULT_DEDUPE_SECONDS, DEFAULT_HYSTERESIS, LEVEL_THRESHOLDS, AlertEngine, risk_index
+from history_store import HistoryStore
+
+INICIO = datetime(2024, 6, 1, 12)
+
+
+def _estados(indices):
+    """Tabla de estados cuyo índice de riesgo (sin historial) es exactamente `indices`"""
+
+    c = np.asarray(indices, dtype=float) / 100
+    return pd.DataFrame({
+        "nombre": [f"estado-{i}" for i in range(len(c))],
+        "region": "Norte",
+        "probabilidad_lluvia": 100 * (1 - c),
+        "dias_con_lluvia": 5 * (1 - c),
+        "humedad_actual": 100 * (1 - c),
+        "temp_actual": 15 + 25 * c
+    })
+
+
+def test_indices_of_helper():
+    indices = [10.0, 47.5, 80.0]
+    df = _estados(indices)
+    calculados = risk_index(df["probabilidad_lluvia"], df["dias_con_lluvia"], df["humedad_actual"], df["temp_actual"])
+    np.testing.assert_allclose(calculados, indices)
+
+
+def test_first_evaluation_seeds_without_alerts():
+    motor = AlertEngine()
+    riesgo, alertas = motor.evaluate(_estados([10, 40, 60, 95]), timestamp=INICIO)
+    assert list(riesgo["riesgo"]) == ["Bajo", "Moderado", "Alto", "Extremo"]
+    assert alertas.empty
+
+    # Una ubicación nueva en una evaluación posterior tampoco alerta
+    riesgo, alertas = motor.evaluate(_estados([10, 40, 60, 95, 90]), timestamp=INICIO + timedelta(hours=1))
+    assert riesgo["riesgo"].iloc[4] == "Extremo"
+    assert alertas.empty
+
+
+def test_hysteresis_and_repeated_evaluations():
+    motor = AlertEngine()
+    umbral_alto = LEVEL_THRESHOLDS[1]
+    motor.evaluate(_estados([umbral_alto - 10]), timestamp=INICIO)
+
+    # Cruzar el umbral sin superar el margen no cambia de nivel
+    hora = INICIO
+    for indice in (umbral_alto + 1, umbral_alto - 1, umbral_alto + DEFAULT_HYSTERESIS - 1):
+        hora += timedelta(minutes=10)
+        riesgo, alertas = motor.evaluate(_estados([indice]), timestamp=hora)
+        assert riesgo["riesgo"].iloc[0] == "Moderado" and alertas.empty
+
+    # Superarlo por el margen sube de nivel con una sola alerta
+    hora += timedelta(minutes=10)
+    riesgo, alertas = motor.evaluate(_estados([umbral_alto + DEFAULT_HYSTERESIS + 1]), timestamp=hora)
+    assert riesgo["riesgo"].iloc[0] == "Alto"
+    assert alertas[["nivel_anterior", "nivel", "sube"]].values.tolist() == [["Moderado", "Alto", True]]
+
+    # Las evaluaciones siguientes con los mismos datos no repiten la alerta
+    for _ in range(3):
+        hora += timedelta(minutes=10)
+        riesgo, alertas = motor.evaluate(_estados([umbral_alto + DEFAULT_HYSTERESIS + 1]), timestamp=hora)
+        assert alertas.empty
+
+    # Bajar dentro del margen conserva el nivel; bajar más allá del margen alerta
+    hora += timedelta(minutes=10)
+    assert motor.evaluate(_estados([umbral_alto - 1]), timestamp=hora)[0]["riesgo"].iloc[0] == "Alto"
+    hora += timedelta(minutes=10)
+    riesgo, alertas = motor.evaluate(_estados([umbral_alto - DEFAULT_HYSTERESIS - 1]), timestamp=hora)
+    assert alertas[["nivel_anterior", "nivel", "sube"]].values.tolist() == [["Alto", "Moderado", False]]
+
+    # Volver a subir dentro de la ventana de deduplicación no repite la alerta hacia "Alto"
+    hora += timedelta(minutes=10)
+    riesgo, alertas = motor.evaluate(_estados([umbral_alto + DEFAULT_HYSTERESIS + 1]), timestamp=hora)
+    assert riesgo["riesgo"].iloc[0] == "Alto" and alertas.empty
+
+    # Pasada la ventana, un nuevo cambio hacia "Alto" sí alerta
+    hora += timedelta(seconds=DEFAULT_DEDUPE_SECONDS)
+    motor.evaluate(_estados([umbral_alto - DEFAULT_HYSTERESIS - 1]), timestamp=hora)
+    hora += timedelta(minutes=10)
+    riesgo, alertas = motor.evaluate(_estados([umbral_alto + DEFAULT_HYSTERESIS + 1]), timestamp=hora)
+    assert list(alertas["nivel"]) == ["Alto"]
+
+
+def test_state_persists_across_processes(tmp_path):
+    historial = HistoryStore(str(tmp_path))
+    motor = AlertEngine()
+    motor.evaluate(_estados([10, 60, 90]), timestamp=INICIO)
+    historial.save_risk_state(*motor.state())
+
+    # Un proceso nuevo que carga el estado no alerta por los niveles que ya tenían los estados
+    otro = AlertEngine()
+    otro.restore(*historial.risk_state())
+    _, alertas = otro.evaluate(_estados([10, 60, 90]), timestamp=INICIO + timedelta(hours=1))
+    assert alertas.empty
+
+    # pero sí por un cambio real, y la última alerta guardada evita repetirla en otro proceso
+    _, alertas = otro.evaluate(_estados([10, 90, 90]), timestamp=INICIO + timedelta(hours=2))
+    assert list(alertas["nombre"]) == ["estado-1"]
+    historial.save_risk_state(*otro.state())
+
+    tercero = AlertEngine()
+    tercero.restore(*historial.risk_state())
+    tercero.evaluate(_estados([10, 40, 90]), timestamp=INICIO + timedelta(hours=3))
+    _, alertas = tercero.evaluate(_estados([10, 90, 90]), timestamp=INICIO + timedelta(hours=4))
+    assert alertas.empty
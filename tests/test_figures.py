@@ -0,0 +1,55 @@
+import json
+from datetime import datetime
+
+import pytest
+
+import figures
+import pipeline
+from maps import build_rain_map, popup_html, render_map_html
+from mock_openweather import synthetic_current, synthetic_forecast
+from rolling_stats import RollingStats
+from snapshot import Snapshot
+
+
+@pytest.fixture
+def snapshot_incompleto():
+    """Snapshot de los estados con uno sin condiciones actuales (como los de `errores`)"""
+
+    estados = pipeline.estados_mexico[:12]
+    results, diarios, errores = [], {}, []
+    for i, estado in enumerate(estados):
+        actual = None if i == 3 else synthetic_current(estado["lat"], estado["lon"])
+        if actual is None:
+            errores.append(estado["nombre"])
+        analisis = pipeline.analyze_rain_forecast(synthetic_forecast(estado["lat"], estado["lon"]))
+        results.append(pipeline.result_row(estado, actual, analisis))
+        diarios[estado["nombre"]] = analisis["datos_diarios"]
+    snapshot = Snapshot(results, diarios, errores=errores)
+    rolling = RollingStats()
+    rolling.update(snapshot.df_estados, datetime.now())
+    snapshot.tendencias = rolling.view()
+    return snapshot
+
+
+def test_figures_and_map_with_missing_current(snapshot_incompleto):
+    snapshot = snapshot_incompleto
+    df_estados = snapshot.df_estados
+    assert df_estados["humedad_actual"].isna().sum() == 1
+
+    figuras = [
+        *figures.trend_figures(df_estados, snapshot.agregados)[:3],
+        *figures.trend_figures(df_estados, snapshot.agregados, snapshot.tendencias, "24 h")[:3],
+        *figures.regional_figures(df_estados, snapshot.agregados)[:2],
+        figures.rain_choropleth(df_estados),
+        *figures.daily_figures(snapshot.diario(snapshot.errores[0]), snapshot.errores[0])
+    ]
+    for figura in figuras:
+        json.loads(figura.to_json())
+
+    for tabla in (*figures.current_tables(df_estados), figures.forecast_table(df_estados)):
+        assert not tabla.empty
+
+    popups = popup_html(df_estados)
+    assert not popups.str.contains("<NA>|nan", regex=True).any()
+    assert "Sin datos" in popups.iloc[3]
+    assert render_map_html(build_rain_map(df_estados))
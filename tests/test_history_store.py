@@ -0,0 +1,135 @@
+import glob
+import os
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import history_store
+from history_store import HistoryStore
+from mock_openweather import synthetic_forecast
+
+ESTADOS = [
+    {"nombre": "Sonora", "region": "Norte", "lat": 29.2972, "lon": -110.3309},
+    {"nombre": "Yucatán", "region": "Sur", "lat": 20.7099, "lon": -89.0943}
+]
+
+
+def _actual(momento, lluvia=0.0, condicion=800):
+    """Respuesta de /weather con el instante, la lluvia de la última hora y la condición indicados"""
+
+    datos = {
+        "dt": int(momento.timestamp()),
+        "main": {"temp": 30.0, "humidity": 20, "pressure": 1010},
+        "wind": {"speed": 3.0},
+        "weather": [{"id": condicion}]
+    }
+    if lluvia:
+        datos["rain"] = {"1h": lluvia}
+    return datos
+
+
+def _lote(momento, lluvias=(0.0, 0.0), pronostico_desde=None):
+    ahora = int((pronostico_desde or momento).timestamp())
+    return [
+        {"current": _actual(momento, lluvia), "forecast": synthetic_forecast(estado["lat"], estado["lon"], ahora=ahora)}
+        for estado, lluvia in zip(ESTADOS, lluvias)
+    ]
+
+
+def _archivos(ruta):
+    return sorted(glob.glob(os.path.join(ruta, "*", "fecha=*", "*.parquet")))
+
+
+def test_repeated_responses_are_stored_once(tmp_path):
+    historial = HistoryStore(str(tmp_path))
+    momento = datetime(2024, 6, 1, 12)
+    lote = _lote(momento)
+
+    historial.append_batch(ESTADOS, lote, emitido=momento.timestamp())
+    archivos = _archivos(str(tmp_path))
+    # La misma respuesta servida otra vez desde la caché no agrega filas ni archivos
+    historial.append_batch(ESTADOS, lote, emitido=momento.timestamp() + 600)
+    assert _archivos(str(tmp_path)) == archivos
+    assert len(historial.scan("observaciones")) == 2
+    assert len(historial.scan("pronosticos")) == 2 * len(lote[0]["forecast"]["list"])
+
+    # Una observación más reciente y el pronóstico del siguiente período sí se agregan
+    historial.append_batch(ESTADOS, _lote(momento + timedelta(hours=3)), emitido=momento.timestamp() + 10800)
+    assert len(historial.scan("observaciones")) == 4
+    assert historial.scan("pronosticos")["emitido"].nunique() == 2
+
+
+def test_dry_days_across_day_boundaries(tmp_path):
+    historial = HistoryStore(str(tmp_path))
+    dia = datetime(2024, 6, 1, 9)
+
+    def dias_secos(momento, lluvias):
+        return historial.append_batch(ESTADOS, _lote(momento, lluvias, pronostico_desde=dia))
+
+    # Día 1: seco en Sonora, lluvia en Yucatán; mientras el día no termina no cuenta
+    assert dias_secos(dia, (0.0, 2.0)) == {"Sonora": 0, "Yucatán": 0}
+    assert dias_secos(dia + timedelta(hours=6), (0.0, 0.0)) == {"Sonora": 0, "Yucatán": 0}
+    # Día 2: se cierra el día 1 (seco en Sonora)
+    assert dias_secos(dia + timedelta(days=1), (0.0, 0.0)) == {"Sonora": 1, "Yucatán": 0}
+    # Día 4 (sin observaciones el día 3): se cierra el día 2, seco en ambos
+    assert dias_secos(dia + timedelta(days=3), (0.0, 0.0)) == {"Sonora": 2, "Yucatán": 1}
+    # Lluvia por condición (llovizna) sin milímetros: el día en curso cuenta como lluvioso
+    lote = _lote(dia + timedelta(days=3, hours=4), pronostico_desde=dia)
+    lote[0]["current"]["weather"] = [{"id": 300}]
+    assert historial.append_batch(ESTADOS, lote) == {"Sonora": 0, "Yucatán": 1}
+    # Día 5: se cierra el día 4 con lluvia en Sonora y la racha vuelve a empezar
+    assert dias_secos(dia + timedelta(days=4), (0.0, 0.0)) == {"Sonora": 0, "Yucatán": 2}
+
+    # Una observación anterior a la última guardada se ignora
+    assert dias_secos(dia + timedelta(days=2), (5.0, 5.0)) == {"Sonora": 0, "Yucatán": 2}
+
+
+def test_failed_batch_publishes_nothing(tmp_path, monkeypatch):
+    historial = HistoryStore(str(tmp_path))
+    momento = datetime(2024, 6, 1, 12)
+    escribir = history_store.pq.write_table
+
+    def falla(tabla, ruta, *args, **kwargs):
+        if "pronosticos" in ruta:
+            raise OSError("disco lleno")
+        return escribir(tabla, ruta, *args, **kwargs)
+
+    monkeypatch.setattr(history_store.pq, "write_table", falla)
+    with pytest.raises(OSError):
+        historial.append_batch(ESTADOS, _lote(momento))
+    assert glob.glob(os.path.join(str(tmp_path), "*", "fecha=*", "*")) == []
+    assert historial.dry_days() == {}
+
+    # El reintento guarda cada fila una sola vez
+    monkeypatch.setattr(history_store.pq, "write_table", escribir)
+    historial.append_batch(ESTADOS, _lote(momento))
+    assert len(historial.scan("observaciones")) == 2
+    assert len(historial.scan("pronosticos")) == 2 * 40
+
+
+def test_compact_merges_old_partitions(tmp_path):
+    historial = HistoryStore(str(tmp_path))
+    antiguo = datetime.combine(date.today() - timedelta(days=5), datetime.min.time()) + timedelta(hours=10)
+    reciente = datetime.combine(date.today(), datetime.min.time()) + timedelta(minutes=5)
+    for horas in range(3):
+        momento = antiguo + timedelta(hours=horas)
+        historial.append_batch(ESTADOS, _lote(momento), emitido=momento.timestamp())
+    for horas in range(2):
+        momento = reciente + timedelta(minutes=horas)
+        historial.append_batch(ESTADOS, _lote(momento), emitido=momento.timestamp())
+
+    antes = {tabla: historial.scan(tabla) for tabla in ("observaciones", "pronosticos")}
+    particion = os.path.join(str(tmp_path), "observaciones", f"fecha={antiguo.date().isoformat()}")
+    assert len(glob.glob(os.path.join(particion, "*.parquet"))) == 3
+
+    # Se compactan las particiones antiguas de las dos tablas; las recientes no se tocan
+    assert historial.compact() == 2
+    assert len(glob.glob(os.path.join(particion, "*.parquet"))) == 1
+    particion_reciente = os.path.join(str(tmp_path), "observaciones", f"fecha={reciente.date().isoformat()}")
+    assert len(glob.glob(os.path.join(particion_reciente, "*.parquet"))) == 2
+    assert historial.compact() == 0
+
+    for tabla, df in antes.items():
+        despues = historial.scan(tabla)
+        columnas = list(df.columns)
+        assert despues.sort_values(columnas).reset_index(drop=True).equals(df.sort_values(columnas).reset_index(drop=True))
@@ -0,0 +1,98 @@
+import copy
+import random
+
+import numpy as np
+import pandas as pd
+
+from aggregates import CORRELATION_COLUMNS, RegionAggregates
+
+REGIONES = ["Norte", "Centro", "Sur"]
+
+
+def _filas(rnd, n):
+    """Tabla de estados sintética con las columnas de los agregados y algunos faltantes"""
+
+    datos = {
+        "temp_actual": rnd.normal(25, 6, n),
+        "humedad_actual": rnd.integers(10, 100, n).astype(float),
+        "presion_actual": rnd.normal(1013, 5, n),
+        "viento_actual": rnd.gamma(2, 2, n),
+        "probabilidad_lluvia": rnd.uniform(0, 100, n),
+        "dias_con_lluvia": rnd.integers(0, 6, n).astype(float)
+    }
+    df = pd.DataFrame(datos)[CORRELATION_COLUMNS]
+    df = df.mask(rnd.random(df.shape) < 0.1)
+    df.insert(0, "region", rnd.choice(REGIONES, n))
+    return df
+
+
+def _comparar(agregados, df):
+    esperados = RegionAggregates.from_frame(df)
+    assert agregados.estadisticas.keys() == esperados.estadisticas.keys()
+    for region, valores in esperados.estadisticas.items():
+        for clave, valor in valores.items():
+            np.testing.assert_allclose(agregados.estadisticas[region][clave], valor, rtol=1e-10, atol=1e-6)
+    np.testing.assert_allclose(
+        agregados.correlation().to_numpy(), df[CORRELATION_COLUMNS].corr().to_numpy(), atol=1e-10
+    )
+    pd.testing.assert_frame_equal(agregados.regional_table(), esperados.regional_table())
+
+
+def test_patch_matches_from_frame():
+    rnd = np.random.default_rng(0)
+    df = _filas(rnd, 200)
+    agregados = RegionAggregates.from_frame(df)
+
+    for _ in range(50):
+        cambiados = rnd.choice(len(df), 10, replace=False)
+        nuevo = df.copy()
+        nuevo.iloc[cambiados] = _filas(rnd, 10).to_numpy()
+        agregados = agregados.patch(df.iloc[cambiados], nuevo.iloc[cambiados])
+        df = nuevo
+        _comparar(agregados, df)
+
+    # Una región que se queda sin filas desaparece de los agregados
+    sur = np.flatnonzero(df["region"] == "Sur")
+    nuevo = df.copy()
+    nuevo.iloc[sur, 0] = "Norte"
+    agregados = agregados.patch(df.iloc[sur], nuevo.iloc[sur])
+    assert "Sur" not in agregados.estadisticas
+    _comparar(agregados, nuevo)
+
+
+def test_incremental_build_matches_full(mock_api):
+    import pipeline
+    from forecast_parser import ForecastArrays
+    from mock_openweather import synthetic_locations
+
+    estados = synthetic_locations(60, seed=1)
+    cache = pipeline.get_weather_cache()
+    pipeline.build_snapshot("x", estados=estados)
+    rnd = random.Random(1)
+
+    for ronda in range(3):
+        # Cambiar algunos pronósticos y condiciones actuales en la caché
+        for estado in rnd.sample(estados, 8):
+            pronostico = cache.get("forecast", estado["lat"], estado["lon"])[0]
+            lluvia = pronostico.rain_3h.copy()
+            lluvia[:8] = [rnd.choice([0.0, 2.5, 5.0]) for _ in range(8)]
+            cache.set("forecast", estado["lat"], estado["lon"], ForecastArrays(pronostico.dt, pronostico.temp, lluvia))
+        for estado in rnd.sample(estados, 4):
+            actual = copy.deepcopy(cache.get("weather", estado["lat"], estado["lon"])[0])
+            actual["main"]["temp"] = None if ronda == 1 else actual["main"]["temp"] + 1.5
+            cache.set("weather", estado["lat"], estado["lon"], actual)
+
+        incremental = pipeline.build_snapshot("x", estados=estados)
+        completo = pipeline.build_snapshot("x", estados=estados, incremental=False)
+
+        pd.testing.assert_frame_equal(incremental.df_estados, completo.df_estados)
+        pd.testing.assert_frame_equal(incremental.df_diario, completo.df_diario)
+        assert incremental.errores == completo.errores
+        np.testing.assert_allclose(
+            incremental.agregados.correlation().to_numpy(),
+            completo.df_estados[CORRELATION_COLUMNS].astype(float).corr().to_numpy(),
+            atol=1e-10
+        )
+        pd.testing.assert_frame_equal(incremental.agregados.regional_table(), completo.agregados.regional_table())
+        for estado in estados[:5]:
+            pd.testing.assert_frame_equal(incremental.diario(estado["nombre"]), completo.diario(estado["nombre"]))
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from aggregates import CORRELATION_COLUMNS
+from rolling_stats import Moments, RollingStats, _Grupos
+
+REGIONES = ["Norte", "Centro", "Sur"]
+
+
+def _datos(rnd, n):
+    """Filas con medias lejanas de cero (como la presión) y algunos faltantes"""
+
+    x = np.column_stack([
+        rnd.normal(25, 6, n),
+        rnd.uniform(10, 100, n),
+        rnd.normal(1013, 5, n),
+        rnd.gamma(2, 2, n),
+        rnd.uniform(0, 100, n),
+        rnd.integers(0, 6, n).astype(float)
+    ])
+    x[rnd.random(x.shape) < 0.1] = np.nan
+    return x
+
+
+def _momentos(x, grupos, n_grupos=4):
+    return Moments.from_rows(x, _Grupos(grupos, n_grupos), pares=True)
+
+
+def _comparar_momentos(obtenidos, esperados):
+    np.testing.assert_allclose(obtenidos.n, esperados.n, atol=1e-9)
+    presentes = esperados.n > 0
+    for campo in ("media", "m2", "co"):
+        np.testing.assert_allclose(
+            getattr(obtenidos, campo)[presentes], getattr(esperados, campo)[presentes], rtol=1e-9, atol=1e-7
+        )
+
+
+def test_subtract_matches_from_rows():
+    rnd = np.random.default_rng(0)
+    x = _datos(rnd, 600)
+    grupos = rnd.integers(0, 4, len(x))
+    quitar = rnd.random(len(x)) < 0.3
+
+    total = _momentos(x, grupos)
+    restantes = total.subtract(_momentos(x[quitar], grupos[quitar]))
+    _comparar_momentos(restantes, _momentos(x[~quitar], grupos[~quitar]))
+
+    # Quitar todas las filas de un grupo lo deja vacío
+    del_grupo = grupos == 2
+    sin_grupo = total.subtract(_momentos(x[del_grupo], grupos[del_grupo]))
+    assert (sin_grupo.n[2] == 0).all() and (sin_grupo.m2[2] == 0).all()
+
+
+def test_sliding_merge_subtract_matches_from_rows():
+    rnd = np.random.default_rng(1)
+    lotes = []
+    for _ in range(80):
+        x = _datos(rnd, 40)
+        lotes.append((x, rnd.integers(0, 4, len(x))))
+
+    ventana = 10
+    total = Moments.zeros(4, len(CORRELATION_COLUMNS), True)
+    for i, (x, grupos) in enumerate(lotes):
+        total = total.merge(_momentos(x, grupos))
+        if i >= ventana:
+            total = total.subtract(_momentos(*lotes[i - ventana]))
+        dentro = lotes[max(0, i - ventana + 1):i + 1]
+        esperados = _momentos(np.concatenate([x for x, _ in dentro]), np.concatenate([g for _, g in dentro]))
+        _comparar_momentos(total, esperados)
+
+
+def test_window_matches_pandas():
+    rnd = np.random.default_rng(2)
+    nombres = [f"estado-{i}" for i in range(30)]
+    regiones = rnd.choice(REGIONES, len(nombres))
+    inicio = datetime(2024, 1, 1)
+    stats = RollingStats()
+    historial = []
+
+    # 60 actualizaciones horarias: la ventana de 24 h resta cubetas sin llegar a recalcularse
+    for hora in range(60):
+        df = pd.DataFrame(_datos(rnd, len(nombres)), columns=CORRELATION_COLUMNS)
+        df.insert(0, "nombre", nombres)
+        df.insert(1, "region", regiones)
+        historial.append(df)
+        stats.update(df, inicio + timedelta(hours=hora))
+
+        vista = stats.view()
+        filas = pd.concat(historial[-24:], ignore_index=True)
+        assert vista.observations("24 h") == len(filas)
+        np.testing.assert_allclose(
+            vista.correlation("24 h").to_numpy(), filas[CORRELATION_COLUMNS].corr().to_numpy(), atol=1e-9
+        )
+        norte = filas[filas["region"] == "Norte"]
+        np.testing.assert_allclose(
+            vista.correlation("24 h", ["Norte"]).to_numpy(), norte[CORRELATION_COLUMNS].corr().to_numpy(), atol=1e-9
+        )
+
+    resumen = vista.state_summary("24 h").set_index("nombre").loc[nombres]
+    por_estado = filas.groupby("nombre")[CORRELATION_COLUMNS]
+    medias, desviaciones = por_estado.mean().loc[nombres], por_estado.std().loc[nombres]
+    for columna in CORRELATION_COLUMNS:
+        np.testing.assert_allclose(resumen[f"{columna}_media"], medias[columna], rtol=1e-9, equal_nan=True)
+        np.testing.assert_allclose(resumen[f"{columna}_std"], desviaciones[columna], rtol=1e-7, equal_nan=True)
+
+    descripcion = vista.describe("24 h")
+    esperada = filas[descripcion.columns].describe()
+    np.testing.assert_allclose(descripcion.loc[["count", "mean", "std", "min", "max"]],
+                               esperada.loc[["count", "mean", "std", "min", "max"]], rtol=1e-9)
@@ -0,0 +1,43 @@
+import os
+
+import pandas as pd
+import pytest
+
+import pipeline
+from mock_openweather import synthetic_current, synthetic_forecast
+from snapshot import Snapshot, load_snapshot, save_snapshot
+
+
+def _snapshot(riesgo=None):
+    estados = pipeline.estados_mexico[:5]
+    results, diarios = [], {}
+    for estado in estados:
+        analisis = pipeline.analyze_rain_forecast(synthetic_forecast(estado["lat"], estado["lon"]))
+        results.append(pipeline.result_row(estado, synthetic_current(estado["lat"], estado["lon"]), analisis))
+        diarios[estado["nombre"]] = analisis["datos_diarios"]
+    snapshot = Snapshot(results, diarios)
+    snapshot.riesgo = riesgo
+    return snapshot
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "json"])
+def test_saving_without_risk_drops_previous_risk(tmp_path, fmt):
+    directorio = str(tmp_path)
+    riesgo = pd.DataFrame({"nombre": ["Sonora"], "indice_riesgo": [72.5], "riesgo": ["Extremo"]})
+
+    save_snapshot(_snapshot(riesgo), directorio, fmt=fmt)
+    cargado = load_snapshot(directorio)
+    assert cargado.riesgo.to_dict("records") == riesgo.to_dict("records")
+
+    rutas = save_snapshot(_snapshot(), directorio, fmt=fmt)
+    assert not os.path.exists(os.path.join(directorio, "riesgo.parquet"))
+    assert all("riesgo" not in os.path.basename(ruta) for ruta in rutas)
+    assert load_snapshot(directorio).riesgo is None
+
+
+def test_meta_without_risk_ignores_leftover_file(tmp_path):
+    directorio = str(tmp_path)
+    save_snapshot(_snapshot(), directorio)
+    # Un riesgo.parquet que quedó de otro guardado (por ejemplo, si el proceso se interrumpió) no se carga
+    pd.DataFrame({"nombre": ["Sonora"], "riesgo": ["Alto"]}).to_parquet(os.path.join(directorio, "riesgo.parquet"))
+    assert load_snapshot(directorio).riesgo is None
@@ -0,0 +1,267 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+from forecast_parser import ForecastArrays, loads
+
+# Ruta por defecto del archivo de caché compartido
+DEFAULT_CACHE_PATH = os.environ.get("RAIN_CACHE_PATH", os.path.join(".cache", "weather_cache.sqlite3"))
+
+# Tiempo de vida de una respuesta fresca (segundos)
+DEFAULT_TTL = 3600
+
+# Tiempo adicional durante el cual se sirve una respuesta vencida mientras otro proceso la actualiza
+DEFAULT_STALE_TTL = 6 * 3600
+
+# Número máximo de respuestas guardadas (mayor que las dos respuestas por ubicación de las
+# actualizaciones más grandes; si se queda corto la caché no sirve ningún acierto)
+DEFAULT_MAX_ENTRIES = int(os.environ.get("RAIN_CACHE_MAX_ENTRIES", 100000))
+
+# Resolución (segundos) con la que se registra el último acceso a una entrada
+ACCESS_RESOLUTION = 60
+
+# Cada cuántas escrituras se aplica la política de expiración y tamaño máximo
+EVICT_EVERY = 100
+
+# Duración máxima de un bloqueo de actualización (por si el proceso que lo tomó muere)
+DEFAULT_LOCK_TIMEOUT = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS weather_cache (
+    endpoint TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    units TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (endpoint, lat, lon, units, lang)
+);
+CREATE INDEX IF NOT EXISTS idx_weather_cache_fetched_at ON weather_cache (fetched_at);
+CREATE TABLE IF NOT EXISTS refresh_locks (
+    endpoint TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    units TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (endpoint, lat, lon, units, lang)
+);
+"""
+
+
+class WeatherCache:
+    """Caché en disco (SQLite) de respuestas de OpenWeather compartida entre procesos.
+
+    Las entradas se identifican por (endpoint, lat, lon, units, lang). Una entrada
+    vencida se sigue sirviendo mientras un único proceso obtiene la nueva versión.
+    Cada respuesta lleva una huella de su contenido (SHA-1 del contenido guardado) para que
+    quien la usa pueda saber si cambió sin volver a serializarla. Los pronósticos ya
+    reducidos (ForecastArrays) se guardan en su formato binario; el resto, como JSON.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, stale_ttl=DEFAULT_STALE_TTL,
+                 max_entries=DEFAULT_MAX_ENTRIES, lock_timeout=DEFAULT_LOCK_TIMEOUT):
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.lock_timeout = lock_timeout
+        self._local = threading.local()
+        self._escrituras = 0
+        self._lock = threading.Lock()
+
+        directorio = os.path.dirname(path)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            # Cachés creadas antes de registrar el último acceso
+            columnas = [fila[1] for fila in conn.execute("PRAGMA table_info(weather_cache)")]
+            if "accessed_at" not in columnas:
+                conn.execute("ALTER TABLE weather_cache ADD COLUMN accessed_at REAL NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_weather_cache_accessed_at ON weather_cache (accessed_at)")
+
+    def _connect(self):
+        """Devuelve la conexión del hilo actual (sqlite3 no comparte conexiones entre hilos)"""
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            # WAL permite lectores concurrentes mientras otro proceso escribe
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(endpoint, lat, lon, units, lang):
+        return (endpoint, round(float(lat), 4), round(float(lon), 4), units, lang)
+
+    @staticmethod
+    def _huella(contenido):
+        if isinstance(contenido, str):
+            contenido = contenido.encode()
+        return hashlib.sha1(contenido).hexdigest()
+
+    @staticmethod
+    def _serializar(payload):
+        if isinstance(payload, ForecastArrays):
+            return payload.to_bytes()
+        return json.dumps(payload)
+
+    @staticmethod
+    def _deserializar(contenido):
+        if isinstance(contenido, bytes):
+            return ForecastArrays.from_bytes(contenido)
+        return loads(contenido)
+
+    def get(self, endpoint, lat, lon, units="metric", lang="es"):
+        """Devuelve (payload, edad en segundos, huella) o None si no hay una entrada utilizable"""
+
+        key = self._key(endpoint, lat, lon, units, lang)
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT payload, fetched_at, accessed_at FROM weather_cache "
+            "WHERE endpoint=? AND lat=? AND lon=? AND units=? AND lang=?",
+            key
+        ).fetchone()
+        if row is None:
+            return None
+
+        ahora = time.time()
+        edad = ahora - row[1]
+        if edad > self.ttl + self.stale_ttl:
+            return None
+        # La política de tamaño máximo elimina primero lo que no se ha leído en más tiempo
+        if ahora - row[2] > ACCESS_RESOLUTION:
+            conn.execute(
+                "UPDATE weather_cache SET accessed_at=? "
+                "WHERE endpoint=? AND lat=? AND lon=? AND units=? AND lang=?",
+                (ahora,) + key
+            )
+        return self._deserializar(row[0]), edad, self._huella(row[0])
+
+    def set(self, endpoint, lat, lon, payload, units="metric", lang="es"):
+        """Guarda una respuesta y aplica periódicamente la política de expiración y tamaño máximo.
+
+        Devuelve la huella del contenido guardado.
+        """
+
+        ahora = time.time()
+        contenido = self._serializar(payload)
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO weather_cache "
+            "(endpoint, lat, lon, units, lang, payload, fetched_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            self._key(endpoint, lat, lon, units, lang) + (contenido, ahora, ahora)
+        )
+        # Los hilos del pool de descargas escriben a la vez
+        with self._lock:
+            self._escrituras += 1
+            aplicar = self._escrituras % EVICT_EVERY == 1
+        if aplicar:
+            self._evict(conn, ahora)
+        return self._huella(contenido)
+
+    def _evict(self, conn, ahora):
+        """Elimina entradas expiradas y las de acceso más antiguo si se supera el tamaño máximo"""
+
+        conn.execute("DELETE FROM weather_cache WHERE fetched_at < ?", (ahora - self.ttl - self.stale_ttl,))
+        conn.execute("DELETE FROM refresh_locks WHERE expires_at < ?", (ahora,))
+        conn.execute(
+            "DELETE FROM weather_cache WHERE rowid IN ("
+            "SELECT rowid FROM weather_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def _acquire(self, key):
+        """Intenta tomar el bloqueo de actualización de una entrada; True si se obtuvo"""
+
+        ahora = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT expires_at FROM refresh_locks "
+                "WHERE endpoint=? AND lat=? AND lon=? AND units=? AND lang=?",
+                key
+            ).fetchone()
+            if row is not None and row[0] > ahora:
+                conn.execute("COMMIT")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO refresh_locks VALUES (?, ?, ?, ?, ?, ?)",
+                key + (ahora + self.lock_timeout,)
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _release(self, key):
+        self._connect().execute(
+            "DELETE FROM refresh_locks WHERE endpoint=? AND lat=? AND lon=? AND units=? AND lang=?",
+            key
+        )
+
+    def get_or_fetch(self, endpoint, lat, lon, fetch, units="metric", lang="es", max_age=None, with_fingerprint=False):
+        """Devuelve la entrada en caché o la obtiene con `fetch` si está vencida.
+
+        Si otro proceso ya está actualizando la entrada se devuelve la versión vencida;
+        si no existe ninguna versión se espera a que ese proceso termine. `max_age`
+        permite exigir una entrada más reciente que el TTL. Con `with_fingerprint`
+        devuelve (payload, huella); la huella es None si no hay respuesta.
+        """
+
+        payload, huella = self._get_or_fetch(endpoint, lat, lon, fetch, units, lang, max_age)
+        return (payload, huella) if with_fingerprint else payload
+
+    def _get_or_fetch(self, endpoint, lat, lon, fetch, units, lang, max_age):
+        max_age = self.ttl if max_age is None else min(max_age, self.ttl)
+        key = self._key(endpoint, lat, lon, units, lang)
+        entrada = self.get(endpoint, lat, lon, units, lang)
+        if entrada is not None and entrada[1] <= max_age:
+            metrics.increment("cache_total", endpoint=endpoint, resultado="hit")
+            return entrada[0], entrada[2]
+
+        limite = time.time() + self.lock_timeout
+        tiene_bloqueo = True
+        while not self._acquire(key):
+            if entrada is not None:
+                metrics.increment("cache_total", endpoint=endpoint, resultado="stale")
+                return entrada[0], entrada[2]
+            # Sin versión previa: esperar a que el otro proceso guarde la respuesta
+            time.sleep(0.1)
+            entrada = self.get(endpoint, lat, lon, units, lang)
+            if entrada is not None:
+                metrics.increment("cache_total", endpoint=endpoint, resultado="wait")
+                return entrada[0], entrada[2]
+            if time.time() > limite:
+                tiene_bloqueo = False
+                break
+
+        metrics.increment("cache_total", endpoint=endpoint, resultado="miss")
+        try:
+            payload = fetch()
+            if payload is not None:
+                return payload, self.set(endpoint, lat, lon, payload, units, lang)
+            # Si la API falla se conserva la versión vencida
+            return (entrada[0], entrada[2]) if entrada is not None else (None, None)
+        finally:
+            if tiene_bloqueo:
+                self._release(key)
+
+    def clear(self):
+        """Elimina todas las entradas"""
+
+        conn = self._connect()
+        conn.execute("DELETE FROM weather_cache")
+        conn.execute("DELETE FROM refresh_locks")